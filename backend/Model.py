@@ -1,41 +1,139 @@
 """Model.py - Chat con Google Gemini (~50 líneas)"""
-import google.generativeai as genai
+import time
 from pathlib import Path
+from typing import Iterator, Optional
 import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config import GEMINI_API_KEY, CHAT_MODEL
+from config import CHAT_MODEL, RAG_MIN_TOKENS
 from logger import get_logger
+from llm_gateway import get_llm_gateway
+from helpers import estimate_tokens
+from retrieval import RetrievedContext, build_context, transcript_hash
+from context_cache import get_context_cache
 
 logger = get_logger(__name__)
-genai.configure(api_key=GEMINI_API_KEY)
+
+PROMPT_HEADER = "Eres un asistente que responde basado en el contexto:\n\n"
+PROMPT_RULES = "Si no lo sabes, responde 'No lo sé'. Sé preciso y conciso."
+CACHED_SYSTEM_INSTRUCTION = f"Eres un asistente que responde basado en la transcripción de la reunión adjunta.\n\n{PROMPT_RULES}"
 
 class Model:
     def __init__(self):
-        self.model = genai.GenerativeModel(CHAT_MODEL)
+        self.gateway = get_llm_gateway()
+        self.cache = get_context_cache()
+        self.last_context: Optional[RetrievedContext] = None  # Cómo se respondió la última pregunta
         logger.info("✓ Chat model initialized")
     
-    def call_model(self, question: str, context: str, keywords=None) -> str:
-        """Genera respuesta basada en pregunta y contexto"""
+    def retrieve_context(self, question: str, transcription: str, summary: Optional[str] = None) -> RetrievedContext:
+        """Contexto a enviar para una pregunta: la transcripción entera si es corta,
+        y si no, un resumen breve más los fragmentos relevantes
+        """
+        tokens_full = estimate_tokens(transcription)
+        if tokens_full <= RAG_MIN_TOKENS:
+            return RetrievedContext(transcription, [], tokens_full, tokens_full, "full")
         try:
-            keywords_section = ""
-            if keywords:
-                kw_list = list(keywords.keys()) if isinstance(keywords, dict) else keywords
-                if kw_list:
-                    keywords_section = f"\n\n📌 KEYWORDS:\n{', '.join(kw_list)}\nUsa estas keywords en tu respuesta si es relevante."
-            
-            prompt = f"""Eres un asistente que responde basado en el contexto:
-
-{context}{keywords_section}
+            retrieved = build_context(question, transcription, summary)
+            logger.info(
+                f"RAG: {len(retrieved.chunks)} fragmentos, ~{retrieved.tokens_sent} de ~{tokens_full} tokens "
+                f"(ahorro ~{retrieved.tokens_saved})"
+            )
+            return retrieved
+        except Exception as e:
+            logger.warning(f"⚠️  RAG no disponible, se envía la transcripción completa - {type(e).__name__}: {str(e)[:100]}")
+            return RetrievedContext(transcription, [], tokens_full, tokens_full, "full")
+    
+    @staticmethod
+    def _keywords_section(keywords=None) -> str:
+        if keywords:
+            kw_list = list(keywords.keys()) if isinstance(keywords, dict) else keywords
+            if kw_list:
+                return f"\n\n📌 KEYWORDS:\n{', '.join(kw_list)}\nUsa estas keywords en tu respuesta si es relevante."
+        return ""
+    
+    def _build_prompt(self, question: str, context: str, keywords=None) -> str:
+        return f"""{PROMPT_HEADER}{context}{self._keywords_section(keywords)}
 
-Si no lo sabes, responde 'No lo sé'. Sé preciso y conciso.
+{PROMPT_RULES}
 
 Pregunta: {question}"""
-            
+    
+    def call_model(self, question: str, context: str, keywords=None) -> str:
+        """Genera respuesta basada en pregunta y contexto"""
+        try:
+            prompt = self._build_prompt(question, context, keywords)
             logger.info(f"Generando respuesta para: {question[:50]}...")
-            response = self.model.generate_content(prompt)
+            response = self.gateway.generate(CHAT_MODEL, prompt)
             return response.text
         
         except Exception as e:
             logger.error(f"call_model: {type(e).__name__} - {str(e)}")
             raise
+    
+    def stream_model(self, question: str, context: str, keywords=None) -> Iterator[str]:
+        """Como call_model, pero entrega el texto a medida que Gemini lo genera
+        
+        Pensado para st.write_stream, que devuelve el texto completo al terminar.
+        """
+        try:
+            prompt = self._build_prompt(question, context, keywords)
+            logger.info(f"Generando respuesta (streaming) para: {question[:50]}...")
+            started = time.monotonic()
+            first_token = True
+            for text in self.gateway.stream(CHAT_MODEL, prompt):
+                if first_token:
+                    logger.info(f"Primer fragmento en {time.monotonic() - started:.2f}s")
+                    first_token = False
+                yield text
+        
+        except Exception as e:
+            logger.error(f"stream_model: {type(e).__name__} - {str(e)}")
+            raise
+    
+    def _stream_cached(self, question: str, cached_content, keywords=None) -> Iterator[str]:
+        """Pregunta contra la caché de contexto de Gemini: solo viaja la pregunta"""
+        contents = f"{self._keywords_section(keywords).strip()}\n\nPregunta: {question}".strip()
+        logger.info(f"Generando respuesta (caché de contexto) para: {question[:50]}...")
+        yield from self.gateway.stream(CHAT_MODEL, contents, cached_content=cached_content)
+    
+    def stream_answer(self, question: str, transcription: str, keywords=None, summary: Optional[str] = None) -> Iterator[str]:
+        """Respuesta del chat sobre una transcripción, pasando por las cachés
+        
+        Orden: respuesta memorizada para la misma pregunta → caché de contexto
+        de Gemini → fragmentos relevantes (RAG) o transcripción completa.
+        `self.last_context` indica qué camino se usó y cuántos tokens se enviaron.
+        """
+        t_hash = transcript_hash(transcription)
+        tokens_full = estimate_tokens(transcription)
+        
+        answer = self.cache.get_answer(t_hash, question, keywords)
+        if answer is not None:
+            logger.info(f"Respuesta memorizada para: {question[:50]}...")
+            self.last_context = RetrievedContext("", [], tokens_full, 0, "memo")
+            yield answer
+            return
+        
+        parts = []
+        cached_content = self.cache.provider_cache(t_hash, transcription, CACHED_SYSTEM_INSTRUCTION)
+        if cached_content is not None:
+            try:
+                question_tokens = estimate_tokens(question + self._keywords_section(keywords))
+                self.last_context = RetrievedContext("", [], tokens_full, question_tokens, "gemini_cache")
+                for text in self._stream_cached(question, cached_content, keywords):
+                    parts.append(text)
+                    yield text
+                self.cache.put_answer(t_hash, question, keywords, "".join(parts))
+                return
+            except Exception as e:
+                if parts:
+                    raise
+                # La caché pudo caducar o borrarse en Gemini: se olvida y se sigue sin ella
+                logger.warning(f"⚠️  Caché de contexto no utilizable - {type(e).__name__}: {str(e)[:100]}")
+                self.cache.invalidate_provider(t_hash)
+        
+        retrieved = self.retrieve_context(question, transcription, summary)
+        self.last_context = retrieved
+        for text in self.stream_model(question, retrieved.text, keywords):
+            parts.append(text)
+            yield text
+        self.cache.put_answer(t_hash, question, keywords, "".join(parts))
@@ -2,68 +2,79 @@
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import streamlit as st
 import sys
 import google.generativeai as genai
 import re
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from logger import get_logger
-from database import init_supabase
-from helpers import safe_json_dump
-from config import GEMINI_API_KEY
+from database import init_supabase, PAGE_SIZE, keyset_page, next_cursor, count_rows
+from helpers import safe_json_dump, split_speaker_turns, chunk_speaker_turns
+from keyword_matcher import get_matcher, normalize
+from RecordingsCatalog import get_recordings_catalog
+from llm_gateway import get_llm_gateway
+from structured_output import OpportunityStreamParser, build_opportunity_schema, repair_json
+from config import (
+    OPPORTUNITIES_DIR, OPPORTUNITY_STRUCTURED_OUTPUT, OPPORTUNITY_REPAIR_MAX_CHARS,
+    OPPORTUNITY_CHUNK_TOKENS, OPPORTUNITY_MAX_WORKERS, OPPORTUNITY_DEDUP_OVERLAP
+)
 
 logger = get_logger(__name__)
-BASE_DIR = Path(__file__).parent.parent / "data" / "opportunities"
+BASE_DIR = OPPORTUNITIES_DIR
 KEYWORDS_DICT_PATH = Path(__file__).parent.parent / "keywords_dict.json"
 
-# Configurar Gemini
-genai.configure(api_key=GEMINI_API_KEY)
+# Prompt del análisis con IA (se rellena por fragmento de transcripción)
+ANALYSIS_PROMPT = """CRÍTICO: Analiza esta conversación/reunión palabra por palabra. Detecta TODAS las oportunidades que encuentres.
+
+MAPEO SIMPLE:
+• Presupuesto / dinero / gasto / inversión / coste → "Presupuesto" (HIGH)
+• Contactar / llamar / tarea / acción / hacer / pendiente / debe / responsabilidad → "Acción requerida" (HIGH)
+• Regulación / ley / cumplimiento / compliance / auditoría / riesgo legal → "Cumplimiento Legal" (HIGH)
+• Formación / capacitación / entrenamiento / curso / educación → "Formación" (MEDIUM)
+• Contratar / empleado / personal / equipo / rol / recurso humano → "Recursos Humanos" (MEDIUM)
+• Cliente / venta / deal / contrato / negocio / oportunidad / acuerdo → "Cierre de venta" (HIGH)
+• Decisión / cambio / estrategia / importante / aprobado → "Decisión importante" (HIGH)
+• Herramienta / infraestructura / sistema / plataforma / equipo tecnológico → "Infraestructura" (MEDIUM)
+
+TRANSCRIPCIÓN:
+{transcription}
+
+SPEAKERS: {speakers}{part_note}
+
+RESPONDE SOLO CON JSON (sin markdown, sin explicaciones):
+
+{{"analisis_completo": true, "oportunidades": [{{"tema": "TemaExacto", "prioridad": "high/medium/low", "mencionado_por": "Nombre", "contexto": "frase", "confianza": 0.85}}]}}
+
+Si no hay oportunidades: {{"analisis_completo": true, "oportunidades": []}}"""
+CHUNK_PROMPT_NOTE = """
+FRAGMENTO {number} DE {total} de la reunión: analiza solo este fragmento."""
+
+class AnalysisFailed(RuntimeError):
+    """El análisis con IA no pudo completarse (distinto de 0 oportunidades detectadas)"""
 
 class OpportunitiesManager:
     def __init__(self):
         BASE_DIR.mkdir(parents=True, exist_ok=True)
         self.db = init_supabase()
+        self.gateway = get_llm_gateway()
     
     def get_recording_id(self, filename: str) -> Optional[str]:
-        """Obtiene ID del recording - intenta múltiples variaciones del nombre"""
+        """Obtiene ID del recording desde el catálogo en memoria (tolera variaciones del nombre)"""
         try:
             if not self.db:
                 logger.warning(f"DB unavailable: {filename}")
                 return None
             
-            # Intentar búsqueda directa
-            result = self.db.table("recordings").select("id").eq("filename", filename).execute()
-            if result.data:
-                recording_id = result.data[0]["id"]
-                logger.info(f"✅ Recording encontrado (búsqueda exacta): {recording_id}")
-                return recording_id
-            
-            # Si no encuentra, intentar variaciones
-            logger.warning(f"No encontrado exacto: {filename}, probando variaciones...")
-            
-            # Variación 1: Buscar por nombre sin extensión
-            filename_no_ext = filename.rsplit('.', 1)[0] if '.' in filename else filename
-            result = self.db.table("recordings").select("id").eq("filename", filename_no_ext).execute()
-            if result.data:
-                recording_id = result.data[0]["id"]
-                logger.info(f"✅ Recording encontrado (sin extensión): {recording_id}")
+            recording_id = get_recordings_catalog().resolve_id(filename)
+            if recording_id:
+                logger.debug(f"Recording resuelto: {filename} → {recording_id}")
                 return recording_id
             
-            # Variación 2: Obtener todos los recordings y buscar por coincidencia parcial
-            try:
-                all_recordings = self.db.table("recordings").select("id, filename").order("created_at", desc=True).limit(20).execute()
-                if all_recordings.data:
-                    main_part = filename.split(" - ")[0].strip() if " - " in filename else filename_no_ext[:20]
-                    for rec in all_recordings.data:
-                        if main_part.lower() in rec["filename"].lower():
-                            recording_id = rec["id"]
-                            logger.info(f"✅ Recording encontrado (coincidencia parcial): {recording_id} ({rec['filename']})")
-                            return recording_id
-            except Exception as search_error:
-                logger.debug(f"Búsqueda por coincidencia falló: {search_error}")
-            
             logger.error(f"❌ Recording no encontrado con ninguna variación: {filename}")
             return None
         except Exception as e:
@@ -71,36 +82,65 @@ class OpportunitiesManager:
             return None
     
     def extract_opportunities(self, transcription: str, keywords_list: List[str]) -> List[Dict]:
-        """Extrae oportunidades de keywords en transcripción"""
-        if not keywords_list:
+        """Extrae oportunidades de keywords en transcripción (una sola pasada Aho–Corasick)"""
+        if not keywords_list or not transcription:
             return []
         
-        opportunities, words = [], transcription.lower().split()
-        for keyword in keywords_list:
-            occurrence_count = 0
-            for i, word in enumerate(words):
-                if keyword.lower() not in word:
-                    continue
-                occurrence_count += 1
-                context_window = 15
-                start, end = max(0, i - context_window), min(len(words), i + context_window + 1)
-                
-                opportunity = {
-                    "id": f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{keyword}_{occurrence_count}",
-                    "keyword": keyword,
-                    "context_before": " ".join(words[start:i]),
-                    "context_after": " ".join(words[i+1:end]),
-                    "full_context": f"{' '.join(words[start:i])} **{keyword}** {' '.join(words[i+1:end])}",
-                    "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "status": "new",
-                    "notes": "",
-                    "occurrence": occurrence_count,
-                    "priority": "Medium",
-                    "title": keyword
-                }
-                opportunities.append(opportunity)
+        matches = get_matcher(tuple(keywords_list)).find(transcription)
+        if not matches:
+            return []
+        
+        # Límites de palabra del texto original: el contexto se recorta por offsets
+        word_spans = [m.span() for m in re.finditer(r"\S+", transcription)]
+        word_starts = [span[0] for span in word_spans]
+        keyword_order = {keyword: i for i, keyword in reversed(list(enumerate(keywords_list)))}
+        matches.sort(key=lambda m: (keyword_order[m.keyword], m.start))
+        
+        now = datetime.now()
+        id_prefix, created_at = now.strftime('%Y%m%d_%H%M%S'), now.strftime("%Y-%m-%d %H:%M:%S")
+        context_window = 15
+        opportunities, occurrences = [], {}
+        for match in matches:
+            i = bisect_right(word_starts, match.start) - 1
+            first, last = max(0, i - context_window), min(len(word_spans) - 1, i + context_window)
+            word_start, word_end = word_spans[i]
+            context_before = " ".join(transcription[word_spans[first][0]:word_start].split())
+            context_after = " ".join(transcription[word_end:word_spans[last][1]].split())
+            occurrence_count = occurrences[match.keyword] = occurrences.get(match.keyword, 0) + 1
+            
+            opportunity = {
+                "id": f"{id_prefix}_{match.keyword}_{occurrence_count}",
+                "keyword": match.keyword,
+                "start": match.start,
+                "end": match.end,
+                "context_before": context_before,
+                "context_after": context_after,
+                "full_context": f"{context_before} **{transcription[word_start:word_end]}** {context_after}".strip(),
+                "created_at": created_at,
+                "status": "new",
+                "notes": "",
+                "occurrence": occurrence_count,
+                "priority": "Medium",
+                "title": match.keyword
+            }
+            opportunities.append(opportunity)
         return opportunities
     
+    def _opportunity_row(self, opportunity: Dict, recording_id: str) -> Dict:
+        """Fila de la tabla opportunities para una oportunidad de keywords
+
+        Sin created_at: lo pone el servidor (default de la columna), igual que en
+        las demás tablas; el pager de tickets y el panel ordenan y filtran por él.
+        """
+        return {
+            "recording_id": recording_id,
+            "title": opportunity.get("keyword", "Opportunity"),
+            "description": opportunity.get("full_context", ""),
+            "status": opportunity.get("status", "new"),
+            "priority": opportunity.get("priority", "Medium").capitalize(),
+            "notes": opportunity.get("notes", "")
+        }
+    
     def save_opportunity(self, opportunity: Dict, audio_filename: str) -> bool:
         """Guarda oportunidad en BD/local"""
         try:
@@ -113,18 +153,7 @@ class OpportunitiesManager:
                 logger.warning(f"Recording ID not found, fallback local")
                 return self._save_local(opportunity, audio_filename)
             
-            priority = opportunity.get("priority", "Medium").capitalize()
-            data = {
-                "recording_id": recording_id,
-                "title": opportunity.get("keyword", "Opportunity"),
-                "description": opportunity.get("full_context", ""),
-                "status": opportunity.get("status", "new"),
-                "priority": priority,
-                "notes": opportunity.get("notes", ""),
-                "created_at": datetime.now().isoformat()
-            }
-            
-            result = self.db.table("opportunities").insert(data).execute()
+            result = self.db.table("opportunities").insert(self._opportunity_row(opportunity, recording_id)).execute()
             if result.data:
                 supabase_id = result.data[0].get("id")
                 opportunity["supabase_id"] = supabase_id
@@ -139,13 +168,117 @@ class OpportunitiesManager:
             logger.error(f"save_opportunity: {type(e).__name__} - {str(e)}")
             return self._save_local(opportunity, audio_filename)
     
+    def save_opportunities(self, opportunities: List[Dict], audio_filename: str) -> int:
+        """Guarda varias oportunidades con un solo INSERT; las que fallen van a local
+        
+        Returns:
+            Número de oportunidades guardadas (en BD o en local)
+        """
+        if not opportunities:
+            return 0
+        try:
+            recording_id = self.get_recording_id(audio_filename) if self.db else None
+            if not recording_id:
+                logger.warning(f"BD/Recording ID unavailable, saving locally: {audio_filename}")
+                return sum(self._save_local(opp, audio_filename) for opp in opportunities)
+            
+            rows = [self._opportunity_row(opp, recording_id) for opp in opportunities]
+            created, failed = self.insert_opportunities(rows)
+            
+            for failure in failed:
+                logger.warning(f"❌ Oportunidad {failure['index'] + 1} no guardada en BD, fallback local: {failure['error']}")
+            failed_indexes = {failure["index"] for failure in failed}
+            inserted = [opp for i, opp in enumerate(opportunities) if i not in failed_indexes]
+            for opportunity, row in zip(inserted, created):
+                opportunity["supabase_id"] = opportunity["id"] = row.get("id")
+            
+            saved_local = sum(self._save_local(opportunities[i], audio_filename) for i in sorted(failed_indexes))
+            return len(created) + saved_local
+        
+        except Exception as e:
+            logger.error(f"save_opportunities: {type(e).__name__} - {str(e)}")
+            return sum(self._save_local(opp, audio_filename) for opp in opportunities)
+    
+    def insert_opportunities(self, rows: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Valida todas las filas y las inserta con un INSERT multi-fila
+        
+        Returns:
+            Tuple con (filas creadas, fallidas). Cada fallida es
+            {"index": posición en rows, "row": fila, "error": motivo}; un error en
+            una fila solo descarta esa fila.
+        """
+        created, failed, valid = [], [], []
+        for index, row in enumerate(rows):
+            error = self._validate_opportunity_row(row)
+            if error:
+                failed.append({"index": index, "row": row, "error": error})
+            else:
+                valid.append((index, row))
+        
+        if valid and not self.db:
+            failed.extend({"index": index, "row": row, "error": "BD no disponible"} for index, row in valid)
+            valid = []
+        
+        for offset in range(0, len(valid), PAGE_SIZE):
+            self._insert_batch(valid[offset:offset + PAGE_SIZE], created, failed)
+        
+        failed.sort(key=lambda failure: failure["index"])
+        logger.info(f"✓ Opportunities insertadas: {len(created)}/{len(rows)}")
+        return created, failed
+    
+    def _validate_opportunity_row(self, row: Dict) -> Optional[str]:
+        """Motivo por el que la fila violaría las restricciones de la tabla (None si es válida)"""
+        if not row.get("recording_id"):
+            return "Sin recording_id"
+        if not str(row.get("title") or "").strip():
+            return "Título vacío"
+        if not str(row.get("description") or "").strip():
+            return "Descripción vacía"
+        return None
+    
+    def _insert_batch(self, batch: List[Tuple[int, Dict]], created: List[Dict], failed: List[Dict]) -> None:
+        """INSERT de un lote; si Postgres lo rechaza (es atómico) se parte en mitades
+        hasta aislar las filas que fallan"""
+        try:
+            result = self.db.table("opportunities").insert([row for _, row in batch]).execute()
+            if result.data:
+                created.extend(result.data)
+                return
+            # Sin excepción no sabemos qué se escribió: no se reintenta para no duplicar
+            failed.extend({"index": index, "row": row, "error": "Respuesta vacía de Supabase"} for index, row in batch)
+            return
+        except Exception as e:
+            error = f"{type(e).__name__} - {str(e)[:150]}"
+        
+        if len(batch) == 1:
+            failed.append({"index": batch[0][0], "row": batch[0][1], "error": error})
+            return
+        middle = len(batch) // 2
+        self._insert_batch(batch[:middle], created, failed)
+        self._insert_batch(batch[middle:], created, failed)
+    
     def _save_local(self, opportunity: Dict, audio_filename: str) -> bool:
         """Fallback: guarda JSON localmente"""
         filename = f"opp_{audio_filename.replace('.', '_')}_{opportunity['id']}.json"
         return safe_json_dump(opportunity, filename, BASE_DIR)
     
+    @staticmethod
+    def _from_row(r: Dict) -> Dict:
+        """Fila de opportunities → oportunidad tal como la usa la UI"""
+        return {
+            "id": r.get("id"),
+            "supabase_id": r.get("id"),
+            "keyword": r.get("title", ""),
+            "full_context": r.get("description", ""),
+            "status": r.get("status", "new"),
+            "notes": r.get("notes", ""),
+            "priority": r.get("priority", "Medium"),
+            "created_at": r.get("created_at", ""),
+            "occurrence": 1
+        }
+    
     def load_opportunities(self, audio_filename: str) -> List[Dict]:
-        """Carga oportunidades desde BD/local"""
+        """Carga todas las oportunidades desde BD/local (por páginas keyset de PAGE_SIZE)"""
         try:
             logger.info(f"📂 Cargando oportunidades para: {audio_filename}")
             
@@ -160,26 +293,17 @@ class OpportunitiesManager:
                 return self._load_local(audio_filename)
             
             logger.info(f"🔍 Buscando opportunities con recording_id: {recording_id}")
-            result = self.db.table("opportunities").select("*").eq("recording_id", recording_id).execute()
-            
-            if not result.data:
+            opportunities, cursor = [], None
+            while True:
+                page, cursor = self._select_page(recording_id, cursor, PAGE_SIZE)
+                opportunities.extend(page)
+                if not cursor:
+                    break
+            
+            if not opportunities:
                 logger.warning(f"❌ No opportunities encontradas para recording_id: {recording_id}")
                 return []
             
-            logger.info(f"✅ Encontradas {len(result.data)} opportunities")
-            
-            opportunities = [{
-                "id": r.get("id"),
-                "supabase_id": r.get("id"),
-                "keyword": r.get("title", ""),
-                "full_context": r.get("description", ""),
-                "status": r.get("status", "new"),
-                "notes": r.get("notes", ""),
-                "priority": r.get("priority", "Medium"),
-                "created_at": r.get("created_at", ""),
-                "occurrence": 1
-            } for r in result.data]
-            
             logger.info(f"✓ Cargadas {len(opportunities)} opportunities")
             return opportunities
         
@@ -189,6 +313,39 @@ class OpportunitiesManager:
             logger.debug(traceback.format_exc())
             return self._load_local(audio_filename)
     
+    def _select_page(self, recording_id: str, cursor, limit: int) -> Tuple[List[Dict], Optional[Tuple[str, str]]]:
+        query = self.db.table("opportunities").select("*").eq("recording_id", recording_id)
+        rows = keyset_page(query, cursor, limit, desc=False).execute().data or []
+        return [self._from_row(r) for r in rows], next_cursor(rows, limit)
+    
+    def load_opportunities_page(self, audio_filename: str, cursor: Any = None, limit: int = 5) -> Tuple[List[Dict], Any]:
+        """Una página de oportunidades (más antiguas primero) y el cursor de la siguiente
+        
+        El cursor es opaco: (created_at, id) en BD o la posición en la lista
+        local sin conexión. None en la última página.
+        """
+        try:
+            recording_id = self.get_recording_id(audio_filename) if self.db else None
+            if recording_id:
+                return self._select_page(recording_id, cursor, limit)
+        except Exception as e:
+            logger.error(f"load_opportunities_page: {type(e).__name__} - {str(e)}")
+        
+        opportunities = self._load_local(audio_filename)
+        start = cursor if isinstance(cursor, int) else 0
+        end = start + limit
+        return opportunities[start:end], (end if end < len(opportunities) else None)
+    
+    def count_opportunities(self, audio_filename: str) -> int:
+        """Total de oportunidades de la grabación (consulta head, sin descargar filas)"""
+        try:
+            recording_id = self.get_recording_id(audio_filename) if self.db else None
+            if recording_id:
+                return count_rows(self.db, "opportunities", {"recording_id": recording_id})
+        except Exception as e:
+            logger.error(f"count_opportunities: {type(e).__name__} - {str(e)}")
+        return len(self._load_local(audio_filename))
+    
     def _load_local(self, audio_filename: str) -> List[Dict]:
         """Carga oportunidades de archivos JSON locales"""
         opportunities = []
@@ -252,33 +409,186 @@ class OpportunitiesManager:
         """Extrae speakers y sus fragmentos de la transcripción con formato 'Nombre: "..."'"""
         speakers = {}
         try:
-            # Patrón para detectar "Nombre: "texto""
-            pattern = r'^([^:]+):\s*["\']?(.+?)["\']?\s*$'
-            
-            for line in transcription.split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                match = re.match(pattern, line)
-                if match:
-                    speaker = match.group(1).strip()
-                    text = match.group(2).strip()
-                    
-                    if speaker not in speakers:
-                        speakers[speaker] = []
-                    speakers[speaker].append(text)
-            
+            for turn in split_speaker_turns(transcription):
+                if turn.speaker != "Unknown":
+                    speakers.setdefault(turn.speaker, []).append(turn.text)
             return speakers if speakers else {"Unknown": [transcription]}
         except Exception as e:
             logger.error(f"Error extracting speakers: {type(e).__name__} - {str(e)}")
             return {"Unknown": [transcription]}
     
+    def _structured_config(self, temas: List[str]):
+        """GenerationConfig con JSON y esquema declarado (None si el modo está desactivado)"""
+        if not OPPORTUNITY_STRUCTURED_OUTPUT:
+            return None
+        return genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=build_opportunity_schema(temas)
+        )
+    
+    @staticmethod
+    def _is_schema_rejection(error: Exception) -> bool:
+        """400 / InvalidArgument que menciona el esquema: el modelo no admite salida estructurada"""
+        message = str(error).lower()
+        return getattr(error, "code", None) == 400 and ("response_schema" in message or "responseschema" in message)
+    
+    def _stream_response(self, model_name: str, prompt: str, generation_config) -> Iterator[str]:
+        """Fragmentos de texto de la respuesta; si el modelo rechaza el esquema se repite sin él
+
+        Solo el rechazo del esquema provoca la segunda llamada en texto libre;
+        timeouts, 429 y errores de red ya los reintenta la pasarela y se propagan.
+        """
+        if generation_config is None:
+            yield from self.gateway.stream(model_name, prompt)
+            return
+        stream = self.gateway.stream(model_name, prompt, generation_config=generation_config)
+        try:
+            first = next(stream, None)
+        except Exception as e:
+            if not self._is_schema_rejection(e):
+                raise
+            logger.warning(f"⚠️  Salida estructurada no admitida ({type(e).__name__}), se usa texto libre")
+            yield from self.gateway.stream(model_name, prompt)
+            return
+        if first is not None:
+            yield first
+            yield from stream
+    
+    def _generate_opportunities_json(self, model_name: str, prompt: str, temas: List[str]) -> Optional[Dict]:
+        """Llama a Gemini y parsea la respuesta en streaming
+        
+        Las oportunidades se aceptan según se completan, así que una respuesta
+        cortada conserva las ya recibidas. El JSON mal formado se repara en
+        local; solo si no queda nada utilizable se pide una reparación al modelo
+        con el texto roto (sin la transcripción, mucho más barata).
+        """
+        generation_config = self._structured_config(temas)
+        parser = OpportunityStreamParser()
+        try:
+            for chunk in self._stream_response(model_name, prompt, generation_config):
+                for item in parser.feed(chunk):
+                    logger.info(f"⏳ Oportunidad recibida: {item.get('tema')} ({item.get('mencionado_por')})")
+        except Exception as e:
+            if not parser.buffer:
+                raise
+            logger.warning(f"⚠️  Respuesta de Gemini interrumpida ({type(e).__name__}), se usa lo recibido")
+        
+        logger.info(f"Respuesta Gemini recibida: {len(parser.buffer)} caracteres")
+        logger.debug(f"RESPUESTA COMPLETA:\n{parser.buffer}")
+        
+        response_json = parser.result()
+        if response_json is not None:
+            if not parser.array_closed:
+                logger.warning(f"⚠️  Respuesta incompleta: se usan {len(parser.items)} oportunidades recibidas")
+            return response_json
+        if not parser.buffer.strip():
+            return None
+        
+        logger.warning(f"JSON mal formado, solicitando reparación: {parser.buffer[:200]}")
+        return self._repair_with_model(model_name, parser.buffer, generation_config)
+    
+    def _repair_with_model(self, model_name: str, broken_text: str, generation_config) -> Optional[Dict]:
+        """Segunda llamada corta: convierte la respuesta rota en JSON válido"""
+        prompt = (
+            'El siguiente texto debía ser JSON con la clave "oportunidades" pero está mal formado. '
+            "Devuélvelo como JSON válido con el mismo contenido, sin añadir ni inventar oportunidades. "
+            "Responde SOLO con el JSON.\n\n"
+            f"{broken_text[:OPPORTUNITY_REPAIR_MAX_CHARS]}"
+        )
+        try:
+            response = self.gateway.generate(model_name, prompt, generation_config=generation_config)
+            repaired = repair_json(response.text)
+            if isinstance(repaired, dict) and isinstance(repaired.get("oportunidades"), list):
+                logger.info("✓ JSON recuperado con la llamada de reparación")
+                return repaired
+            logger.error("❌ La reparación tampoco devolvió JSON válido")
+        except Exception as e:
+            logger.error(f"❌ Reparación fallida: {type(e).__name__} - {str(e)[:100]}")
+        return None
+    
+    def _analyze_chunk(self, model_name: str, chunk: str, index: int, total: int, speakers_list: str, temas: List[str]) -> Optional[List[Dict]]:
+        """Map: oportunidades de un fragmento (None si no hubo respuesta utilizable)"""
+        part_note = CHUNK_PROMPT_NOTE.format(number=index + 1, total=total) if total > 1 else ""
+        prompt = ANALYSIS_PROMPT.format(transcription=chunk, speakers=speakers_list, part_note=part_note)
+        try:
+            response_json = self._generate_opportunities_json(model_name, prompt, temas)
+        except Exception as e:
+            logger.error(f"❌ Fragmento {index + 1}/{total}: {type(e).__name__} - {str(e)[:150]}")
+            return None
+        if response_json is None:
+            return None
+        return [opp for opp in response_json.get("oportunidades", []) if isinstance(opp, dict)]
+    
+    def _map_reduce_opportunities(self, model_name: str, chunks: List[str], speakers_list: str, temas: List[str]) -> Optional[List[Dict]]:
+        """Analiza los fragmentos en paralelo y fusiona los resultados
+        
+        Returns:
+            Oportunidades sin duplicados, o None si ningún fragmento respondió
+        """
+        total = len(chunks)
+        if total == 1:
+            results = [self._analyze_chunk(model_name, chunks[0], 0, 1, speakers_list, temas)]
+        else:
+            workers = max(1, min(OPPORTUNITY_MAX_WORKERS, total))
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="opportunities") as pool:
+                results = list(pool.map(
+                    lambda item: self._analyze_chunk(model_name, item[1], item[0], total, speakers_list, temas),
+                    enumerate(chunks)
+                ))
+            logger.info(f"✓ {total} fragmentos analizados en {time.monotonic() - started:.1f}s ({workers} en paralelo)")
+        
+        answered = [result for result in results if result is not None]
+        if not answered:
+            return None
+        if len(answered) < total:
+            logger.warning(f"⚠️  {total - len(answered)}/{total} fragmento(s) sin respuesta utilizable")
+        return self._merge_opportunities(answered)
+    
+    def _merge_opportunities(self, groups: List[List[Dict]]) -> List[Dict]:
+        """Reduce: fusiona oportunidades repetidas entre fragmentos
+        
+        Son la misma si coinciden tema y speaker y sus contextos se solapan al
+        menos OPPORTUNITY_DEDUP_OVERLAP; se queda la de mayor confianza.
+        """
+        def context_words(opp: Dict) -> set:
+            # Palabras de 4+ letras: ignora artículos y preposiciones
+            return {w for w in re.findall(r"\w+", normalize(str(opp.get("contexto", "")))) if len(w) >= 4}
+        
+        def confidence(opp: Dict) -> float:
+            try:
+                return float(opp.get("confianza", 0))
+            except (TypeError, ValueError):
+                return 0.0
+        
+        merged: List[Tuple[Dict, set]] = []
+        for opp in (opp for group in groups for opp in group):
+            key = (str(opp.get("tema", "")).strip(), normalize(str(opp.get("mencionado_por", "")).strip()))
+            words = context_words(opp)
+            for i, (kept, kept_words) in enumerate(merged):
+                kept_key = (str(kept.get("tema", "")).strip(), normalize(str(kept.get("mencionado_por", "")).strip()))
+                if kept_key != key:
+                    continue
+                shared = len(words & kept_words) / max(1, min(len(words), len(kept_words)))
+                if words and kept_words and shared < OPPORTUNITY_DEDUP_OVERLAP:
+                    continue
+                if confidence(opp) > confidence(kept):
+                    merged[i] = (opp, words)
+                break
+            else:
+                merged.append((opp, words))
+        
+        total = sum(len(group) for group in groups)
+        if total != len(merged):
+            logger.info(f"Reduce: {total} oportunidades → {len(merged)} tras fusionar duplicados")
+        return [opp for opp, _ in merged]
+    
     def analyze_opportunities_with_ai(
         self, 
         transcription: str, 
         audio_filename: str,
-        recording_id: str = None
+        recording_id: str = None,
+        raise_errors: bool = False
     ) -> Tuple[int, List[Dict]]:
         """
         Análisis inteligente de oportunidades usando Gemini.
@@ -289,16 +599,23 @@ class OpportunitiesManager:
             audio_filename: Nombre del archivo de audio para asociar la oportunidad
             recording_id: (Opcional) ID del recording en Supabase. Si se proporciona, se usa directamente.
                          Si no, se intenta obtener buscando por audio_filename.
+            raise_errors: Si es True, un fallo lanza AnalysisFailed en vez de devolver (0, [])
+                          (la cola de trabajos lo necesita para marcar la etapa como fallida)
         
         Returns:
             Tuple con (número de oportunidades detectadas, lista de oportunidades)
         """
+        def failed(message: str, detected: int = 0) -> Tuple[int, List[Dict]]:
+            logger.error(f"❌ {message}")
+            if raise_errors:
+                raise AnalysisFailed(message)
+            return detected, []
+
         try:
             # Cargar diccionario de keywords
             keywords_dict = self.load_keywords_dict()
             if not keywords_dict:
-                logger.warning("Keywords dict is empty, skipping AI analysis")
-                return 0, []
+                return failed("Keywords dict is empty, skipping AI analysis")
             
             # Extraer speakers de la transcripción
             speakers = self.extract_speakers_from_transcription(transcription)
@@ -309,88 +626,21 @@ class OpportunitiesManager:
             config = keywords_dict.get("configuracion", {})
             
             if not temas:
-                logger.warning("No topics found in keywords dict")
-                return 0, []
+                return failed("No topics found in keywords dict")
             
             speakers_list = ", ".join(speakers.keys())
+            model_name = config.get("modelo_gemini", "gemini-2.0-flash")
             
-            # Limitar transcripción si es necesario
-            transcription_limited = transcription[:12000] if len(transcription) > 12000 else transcription
-            
-            # PROMPT EXTREMADAMENTE DIRECTO
-            prompt = f"""CRÍTICO: Analiza esta conversación/reunión palabra por palabra. Detecta TODAS las oportunidades que encuentres.
-
-MAPEO SIMPLE:
-• Presupuesto / dinero / gasto / inversión / coste → "Presupuesto" (HIGH)
-• Contactar / llamar / tarea / acción / hacer / pendiente / debe / responsabilidad → "Acción requerida" (HIGH)
-• Regulación / ley / cumplimiento / compliance / auditoría / riesgo legal → "Cumplimiento Legal" (HIGH)
-• Formación / capacitación / entrenamiento / curso / educación → "Formación" (MEDIUM)
-• Contratar / empleado / personal / equipo / rol / recurso humano → "Recursos Humanos" (MEDIUM)
-• Cliente / venta / deal / contrato / negocio / oportunidad / acuerdo → "Cierre de venta" (HIGH)
-• Decisión / cambio / estrategia / importante / aprobado → "Decisión importante" (HIGH)
-• Herramienta / infraestructura / sistema / plataforma / equipo tecnológico → "Infraestructura" (MEDIUM)
-
-TRANSCRIPCIÓN:
-{transcription_limited}
-
-SPEAKERS: {speakers_list}
-
-RESPONDE SOLO CON JSON (sin markdown, sin explicaciones):
-
-{{"analisis_completo": true, "oportunidades": [{{"tema": "TemaExacto", "prioridad": "high/medium/low", "mencionado_por": "Nombre", "contexto": "frase", "confianza": 0.85}}]}}
-
-Si no hay oportunidades: {{"analisis_completo": true, "oportunidades": []}}"""
+            # Map-reduce: la reunión completa en fragmentos por turnos de palabra
+            chunks = chunk_speaker_turns(transcription, OPPORTUNITY_CHUNK_TOKENS) or [transcription]
             
-            # Llamar a Gemini
             logger.info(f"Iniciando analisis con Gemini para: {audio_filename}")
-            logger.info(f"Modelo: {config.get('modelo_gemini', 'gemini-2.0-flash')}")
-            logger.info(f"Transcripción: {len(transcription_limited)} caracteres, Speakers: {speakers_list}")
-            
-            model = genai.GenerativeModel(config.get("modelo_gemini", "gemini-2.0-flash"))
-            response = model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            logger.info(f"Respuesta Gemini recibida: {len(response_text)} caracteres")
-            logger.info(f"RESPUESTA COMPLETA:\n{response_text}")
-            
-            # Limpiar respuesta
-            # Remover markdown code blocks
-            if "```json" in response_text:
-                logger.info("Limpiando: encontrado ```json")
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                logger.info("Limpiando: encontrado ```")
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-            
-            # Remover caracteres de control
-            response_text = response_text.strip()
-            logger.info(f"Texto limpio: {response_text[:200]}")
-            
-            # Parsear JSON
-            try:
-                response_json = json.loads(response_text)
-                logger.info(f"JSON parseado exitosamente: {response_json}")
-            except json.JSONDecodeError as e:
-                logger.error(f"ERROR al parsear JSON: {str(e)[:100]}")
-                logger.error(f"Response text: {response_text[:300]}")
-                # Intentar limpiar y reparsear
-                try:
-                    # Buscar el primer { y último }
-                    start = response_text.find("{")
-                    end = response_text.rfind("}") + 1
-                    if start >= 0 and end > start:
-                        cleaned = response_text[start:end]
-                        logger.info(f"Intentando limpiar JSON desde {start} a {end}")
-                        response_json = json.loads(cleaned)
-                        logger.info("JSON recuperado tras limpieza")
-                    else:
-                        logger.error("No JSON encontrado en respuesta")
-                        return 0, []
-                except Exception as clean_err:
-                    logger.error(f"Error en cleanup: {str(clean_err)[:100]}")
-                    return 0, []
+            logger.info(f"Modelo: {model_name}")
+            logger.info(f"Transcripción: {len(transcription)} caracteres en {len(chunks)} fragmento(s), Speakers: {speakers_list}")
             
-            oportunidades_data = response_json.get("oportunidades", [])
+            oportunidades_data = self._map_reduce_opportunities(model_name, chunks, speakers_list, list(temas.keys()))
+            if oportunidades_data is None:
+                return failed("Respuesta de Gemini sin JSON recuperable")
             logger.info(f"IA detectó {len(oportunidades_data)} oportunidades: {oportunidades_data}")
             
             if not oportunidades_data:
@@ -412,7 +662,6 @@ Si no hay oportunidades: {{"analisis_completo": true, "oportunidades": []}}"""
                         # Crear un registro en la tabla recordings
                         new_recording = {
                             "filename": audio_filename,
-                            "created_at": datetime.now().isoformat(),
                             "file_size_mb": 0.0,
                             "duration_seconds": 0,
                             "filepath": "",
@@ -422,6 +671,7 @@ Si no hay oportunidades: {{"analisis_completo": true, "oportunidades": []}}"""
                         result = self.db.table("recordings").insert(new_recording).execute()
                         if result.data and len(result.data) > 0:
                             recording_id = result.data[0].get("id")
+                            get_recordings_catalog().upsert(result.data[0])
                             logger.info(f"✅ Recording creado exitosamente: {recording_id}")
                         else:
                             logger.error(f"❌ Respuesta vacía al crear recording")
@@ -430,14 +680,16 @@ Si no hay oportunidades: {{"analisis_completo": true, "oportunidades": []}}"""
             
             # Si aún no hay recording_id, no se puede guardar
             if not recording_id:
-                logger.error(f"❌ No recording_id disponible después de intentos, no se guardarán las {len(oportunidades_data)} oportunidades")
-                return len(oportunidades_data), []
+                return failed(
+                    f"No recording_id disponible después de intentos, no se guardarán las {len(oportunidades_data)} oportunidades",
+                    len(oportunidades_data)
+                )
             
             logger.info(f"✅ Usando recording_id para guardar oportunidades: {recording_id}")
             logger.info(f"📊 Total de oportunidades a guardar: {len(oportunidades_data)}")
             
-            # Guardar cada oportunidad
-            saved_opportunities = []
+            # Validar y preparar todas las oportunidades; se insertan juntas al final
+            rows, row_numbers = [], []
             for idx, opp in enumerate(oportunidades_data, 1):
                 try:
                     tema = str(opp.get("tema", "")).strip()
@@ -476,39 +728,30 @@ Si no hay oportunidades: {{"analisis_completo": true, "oportunidades": []}}"""
                     nota += f"💬 Contexto: {contexto}\n"
                     nota += f"🎯 Confianza: {confianza:.0%}"
                     
+                    # created_at lo pone el servidor (ver _opportunity_row)
                     opportunity_data = {
                         "recording_id": recording_id,
                         "title": f"[IA] {tema} - {mencionado_por}",
                         "description": contexto,
                         "status": "new",
                         "priority": priority,
-                        "notes": nota,
-                        "created_at": datetime.now().isoformat()
+                        "notes": nota
                     }
                     
-                    logger.debug(f"Opp {idx}: Datos preparados para insertar")
-                    
-                    # Insertar en Supabase
-                    if not self.db:
-                        logger.error(f"❌ Opp {idx}: DB no disponible")
-                        continue
-                    
-                    logger.debug(f"Opp {idx}: Iniciando insert en tabla opportunities...")
-                    result = self.db.table("opportunities").insert(opportunity_data).execute()
-                    
-                    if result.data and len(result.data) > 0:
-                        opp_id = result.data[0].get("id")
-                        logger.info(f"✅ Opp {idx} guardada: {opp_id} | Tema: {tema} | Por: {mencionado_por}")
-                        saved_opportunities.append(result.data[0])
-                    else:
-                        logger.error(f"❌ Opp {idx}: Respuesta vacía de Supabase")
-                        logger.error(f"   Respuesta: {result}")
+                    rows.append(opportunity_data)
+                    row_numbers.append(idx)
                     
                 except Exception as inner_e:
                     logger.error(f"❌ Opp {idx}: Error {type(inner_e).__name__} - {str(inner_e)[:150]}")
                     import traceback
                     logger.debug(f"   Traceback: {traceback.format_exc()}")
             
+            saved_opportunities, failed_rows = self.insert_opportunities(rows)
+            for failure in failed_rows:
+                logger.error(f"❌ Opp {row_numbers[failure['index']]}: {failure['error']}")
+            if failed_rows and not saved_opportunities:
+                return failed(f"No se pudo guardar ninguna de las {len(rows)} oportunidades", len(oportunidades_data))
+            
             total = len(saved_opportunities)
             total_detectadas = len(oportunidades_data)
             logger.info(f"🎯 ANÁLISIS COMPLETADO: {total} guardadas / {total_detectadas} detectadas")
@@ -516,9 +759,13 @@ Si no hay oportunidades: {{"analisis_completo": true, "oportunidades": []}}"""
             # Retornar total detectadas (para mostrar feedback), y las guardadas (si existen)
             return total_detectadas, saved_opportunities
         
+        except AnalysisFailed:
+            raise
         except Exception as e:
             logger.error(f"analyze_opportunities_with_ai error: {type(e).__name__} - {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
+            if raise_errors:
+                raise AnalysisFailed(f"{type(e).__name__}: {str(e)[:200]}") from e
             return 0, []
 
@@ -0,0 +1,325 @@
+"""RecordingsCatalog.py - Catálogo en memoria de grabaciones (carga única + deltas)
+
+Sustituye a las consultas `select filename` / `select id, filename limit 50`
+que se hacían en cada rerun. Se carga entera una vez (paginada), se refresca
+con deltas paginados por (updated_at, id) desde el último cursor leído de la
+BD (los timestamps los pone siempre el servidor, nunca el reloj del cliente)
+y responde listados, filename → id y
+búsquedas desde memoria. También resuelve nombres aproximados a su id
+(`resolve_id`) con un índice de claves normalizadas. Las cargas y deltas se
+vuelcan al índice local (local_index.py), del que se carga el catálogo
+cuando Supabase no responde.
+"""
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import streamlit as st
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from logger import get_logger
+from config import REFRESH_INTERVAL_SECONDS, CATALOG_FULL_RELOAD_SECONDS, CATALOG_RETRY_MAX_SECONDS
+import database as db_utils
+from local_index import get_local_index
+from keyword_matcher import normalize
+
+logger = get_logger(__name__)
+
+COLUMNS = "id, filename, created_at, updated_at, file_size_mb"
+COLUMNS_WITHOUT_SIZE = "id, filename, created_at, updated_at"
+FUZZY_PREFIX_CHARS = 20  # Longitud del prefijo usado en la búsqueda aproximada
+UNDEFINED_COLUMN_CODES = ("42703", "PGRST204")  # Postgres / PostgREST: la columna no existe
+
+
+def is_undefined_column(error: Exception) -> bool:
+    """True si PostgREST rechazó la consulta por una columna inexistente"""
+    return str(getattr(error, "code", "") or "") in UNDEFINED_COLUMN_CODES
+
+
+def filename_key(filename: str) -> str:
+    """Clave de resolución: sin extensión, sin mayúsculas ni acentos, separadores unificados
+
+    "Reunión_Lunes-2025.WAV" y "reunion lunes 2025" comparten clave.
+    """
+    stem = filename.rsplit(".", 1)[0] if "." in filename else filename
+    return " ".join(re.split(r"[\s_\-.]+", normalize(stem))).strip()
+
+
+class RecordingsCatalog:
+    """Catálogo de grabaciones: id, filename, created_at, tamaño y estado de transcripción"""
+
+    def __init__(
+        self,
+        refresh_interval: float = REFRESH_INTERVAL_SECONDS,
+        full_reload_interval: float = CATALOG_FULL_RELOAD_SECONDS
+    ):
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._lock = threading.RLock()
+        self._records: Dict[str, Dict] = {}
+        self._by_filename: Dict[str, str] = {}
+        self._by_key: Dict[str, Set[str]] = {}
+        self._cursor: Optional[db_utils.Cursor] = None  # (updated_at, id) más reciente leído de la BD
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._retry_at = 0.0  # Sin carga completa: no se reintenta antes de este instante
+        self._retry_delay = 0.0
+        self._columns = COLUMNS
+        self.queries = 0
+
+    # ------------------------------------------------------------------
+    # Carga y refresco
+    # ------------------------------------------------------------------
+
+    def _select(self, db, build_query) -> List[Dict]:
+        """Ejecuta una consulta; si la columna de tamaño no existe, repite sin ella
+
+        Solo el error de columna inexistente quita file_size_mb; un timeout o un
+        5xx se propagan y no cambian las columnas del catálogo.
+        """
+        self.queries += 1
+        try:
+            return build_query(db.table("recordings").select(self._columns)).execute().data or []
+        except Exception as e:
+            if self._columns == COLUMNS_WITHOUT_SIZE or not is_undefined_column(e):
+                raise
+            logger.info(f"recordings sin columna file_size_mb ({type(e).__name__}), se omite el tamaño")
+            self._columns = COLUMNS_WITHOUT_SIZE
+            return build_query(db.table("recordings").select(self._columns)).execute().data or []
+
+    def load(self) -> bool:
+        """Carga completa paginada por keyset (sin el límite de 50 filas anterior)"""
+        db = db_utils.init_supabase()
+        if not db:
+            self._load_failed()
+            return False
+        try:
+            rows, cursor = [], None
+            while True:
+                page = self._select(db, lambda q: db_utils.keyset_page(q, cursor))
+                rows.extend(page)
+                cursor = db_utils.next_cursor(page, db_utils.PAGE_SIZE)
+                if not cursor:
+                    break
+
+            with self._lock:
+                self._records, self._by_filename, self._by_key = {}, {}, {}
+                for row in rows:
+                    self._apply(row)
+                stamped = [(r["updated_at"], r["id"]) for r in rows if r.get("updated_at")]
+                self._cursor = max(stamped) if stamped else None
+                self._loaded_at = self._refreshed_at = time.monotonic()
+                self._retry_at = self._retry_delay = 0.0
+            logger.info(f"✓ Catálogo cargado: {len(rows)} grabaciones")
+            self._mirror(rows, replace=True)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Catálogo: carga fallida - {type(e).__name__}: {str(e)[:100]}")
+            self._load_failed()
+            return False
+
+    def _load_failed(self) -> None:
+        """Espera creciente (hasta CATALOG_RETRY_MAX_SECONDS) antes de otra carga completa"""
+        self._retry_delay = min(CATALOG_RETRY_MAX_SECONDS, max(self.refresh_interval, self._retry_delay * 2))
+        self._retry_at = time.monotonic() + self._retry_delay
+        self._load_offline()
+
+    def _load_offline(self) -> None:
+        """Sin Supabase: catálogo desde el índice local (se reintenta la carga en el próximo refresco)"""
+        if self._records:
+            return
+        try:
+            rows = get_local_index().recordings()
+        except Exception as e:
+            logger.warning(f"⚠️  Índice local no disponible: {type(e).__name__}")
+            return
+        with self._lock:
+            for row in rows:
+                self._apply(row)
+        if rows:
+            logger.warning(f"⚠️  Catálogo cargado del índice local (sin conexión): {len(rows)} grabaciones")
+
+    def _mirror(self, rows: List[Dict], replace: bool = False) -> None:
+        try:
+            get_local_index().upsert_recordings(rows, replace=replace)
+        except Exception as e:
+            logger.warning(f"⚠️  Índice local: grabaciones no volcadas - {type(e).__name__}")
+
+    def refresh(self, force: bool = False) -> None:
+        """Trae solo las filas nuevas/modificadas desde el último refresco"""
+        now = time.monotonic()
+        if not self._loaded_at or now - self._loaded_at > self.full_reload_interval:
+            if force or now >= self._retry_at:
+                self.load()
+            return
+        if not force and now - self._refreshed_at < self.refresh_interval:
+            return
+
+        db = db_utils.init_supabase()
+        if not db:
+            return
+        try:
+            # updated_at = now() al insertar y en cada UPDATE (trigger), así que basta con él
+            rows, cursor = [], self._cursor
+            while True:
+                page = self._select(db, lambda q: db_utils.keyset_page(
+                    q, cursor, desc=False, column="updated_at"
+                ))
+                rows.extend(page)
+                if page:
+                    cursor = (page[-1]["updated_at"], page[-1]["id"])
+                if not db_utils.next_cursor(page, db_utils.PAGE_SIZE, column="updated_at"):
+                    break
+            with self._lock:
+                for row in rows:
+                    self._apply(row)
+                self._cursor = cursor
+                self._refreshed_at = now
+            if rows:
+                logger.info(f"Catálogo: {len(rows)} cambio(s) incorporados")
+                self._mirror(rows)
+        except Exception as e:
+            logger.warning(f"Catálogo: refresco incremental fallido - {type(e).__name__}")
+
+    def _apply(self, row: Dict) -> None:
+        """Inserta/actualiza una fila en los índices (llamar con el lock tomado)"""
+        rec_id = row.get("id")
+        if not rec_id:
+            return
+        previous = self._records.get(rec_id)
+        if previous and previous["filename"] != row.get("filename"):
+            self._by_filename.pop(previous["filename"], None)
+            self._unindex_key(previous["filename"], rec_id)
+        record = {
+            "id": rec_id,
+            "filename": row.get("filename", ""),
+            "created_at": row.get("created_at") or "",
+            "updated_at": row.get("updated_at") or row.get("created_at") or "",
+            "size_mb": row.get("file_size_mb"),
+        }
+        self._records[rec_id] = record
+        self._by_filename[record["filename"]] = rec_id
+        self._by_key.setdefault(filename_key(record["filename"]), set()).add(rec_id)
+
+    def _unindex_key(self, filename: str, rec_id: str) -> None:
+        key = filename_key(filename)
+        ids = self._by_key.get(key)
+        if ids:
+            ids.discard(rec_id)
+            if not ids:
+                del self._by_key[key]
+
+    # ------------------------------------------------------------------
+    # Mutaciones locales (mantienen el catálogo al día sin consultar)
+    # ------------------------------------------------------------------
+
+    def upsert(self, record: Dict) -> None:
+        with self._lock:
+            self._apply(record)
+
+    def remove(self, filename: str) -> None:
+        with self._lock:
+            rec_id = self._by_filename.pop(filename, None)
+            if rec_id:
+                self._records.pop(rec_id, None)
+                self._unindex_key(filename, rec_id)
+
+    def rename(self, old_filename: str, new_filename: str) -> None:
+        with self._lock:
+            rec_id = self._by_filename.pop(old_filename, None)
+            if rec_id:
+                self._unindex_key(old_filename, rec_id)
+                self._records[rec_id]["filename"] = new_filename
+                self._by_filename[new_filename] = rec_id
+                self._by_key.setdefault(filename_key(new_filename), set()).add(rec_id)
+
+    # ------------------------------------------------------------------
+    # Consultas en memoria
+    # ------------------------------------------------------------------
+
+    def records(self) -> List[Dict]:
+        """Grabaciones ordenadas por recencia, con estado de transcripción"""
+        status = self.transcription_status()
+        with self._lock:
+            ordered = sorted(self._records.values(), key=lambda r: r["created_at"], reverse=True)
+            return [dict(r, transcribed=status.get(r["filename"], False)) for r in ordered]
+
+    def filenames(self) -> List[str]:
+        with self._lock:
+            ordered = sorted(self._records.values(), key=lambda r: r["created_at"], reverse=True)
+            return [r["filename"] for r in ordered]
+
+    def filename_to_id(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._by_filename)
+
+    def get_id(self, filename: str) -> Optional[str]:
+        with self._lock:
+            return self._by_filename.get(filename)
+
+    def resolve_id(self, filename: str) -> Optional[str]:
+        """filename → id tolerante a variaciones del nombre
+
+        Orden: nombre exacto, clave normalizada, refresco incremental forzado
+        (una grabación recién creada en otra sesión) y de nuevo exacto/clave.
+        Solo después se prueba la coincidencia aproximada, que falla (None)
+        si hay más de un candidato en vez de elegir uno.
+        """
+        if not filename:
+            return None
+        rec_id = self._resolve_exact(filename)
+        if rec_id is None:
+            self.refresh(force=True)
+            rec_id = self._resolve_exact(filename)
+        if rec_id is None:
+            rec_id = self._resolve_fuzzy(filename)
+        return rec_id
+
+    def _resolve_exact(self, filename: str) -> Optional[str]:
+        """Nombre exacto o misma clave normalizada (gana la más reciente)"""
+        with self._lock:
+            rec_id = self._by_filename.get(filename)
+            if rec_id:
+                return rec_id
+            candidates = self._by_key.get(filename_key(filename))
+            if not candidates:
+                return None
+            return max(candidates, key=lambda rid: self._records[rid]["created_at"])
+
+    def _resolve_fuzzy(self, filename: str) -> Optional[str]:
+        """Parte principal del nombre contenida en la clave ("Reunión X - 2025-01-01" → "reunion x")"""
+        key = filename_key(filename)
+        main_part = filename_key(filename.split(" - ")[0]) if " - " in filename else key[:FUZZY_PREFIX_CHARS]
+        if not main_part:
+            return None
+        with self._lock:
+            candidates = {rid for k, ids in self._by_key.items() if main_part in k for rid in ids}
+            if len(candidates) > 1:
+                names = sorted(self._records[rid]["filename"] for rid in candidates)[:5]
+                logger.warning(f"⚠️  '{filename}' es ambiguo ({len(candidates)} grabaciones: {names}); no se resuelve")
+                return None
+            return next(iter(candidates), None)
+
+    def search(self, query: str) -> List[str]:
+        """Filtra por nombre (sin distinguir mayúsculas)"""
+        needle = query.strip().lower()
+        if not needle:
+            return self.filenames()
+        return [f for f in self.filenames() if needle in f.lower()]
+
+    def transcription_status(self) -> Dict[str, bool]:
+        """{filename: transcrito} (índice cacheado en database.py)"""
+        return db_utils.get_transcription_status_index()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+@st.cache_resource
+def get_recordings_catalog() -> RecordingsCatalog:
+    """Catálogo único por proceso"""
+    catalog = RecordingsCatalog()
+    catalog.load()
+    return catalog
@@ -1,35 +1,32 @@
 """Transcriber.py - Transcribidor de audio con Gemini (~45 líneas)"""
 import google.generativeai as genai
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Callable, Dict, Optional
 import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config import GEMINI_API_KEY, TRANSCRIPTION_MODEL, MIME_TYPES
+from config import (
+    TRANSCRIPTION_MODEL, MIME_TYPES, LLM_TRANSCRIPTION_TIMEOUT_SECONDS,
+    TRANSCRIPTION_CHUNK_THRESHOLD_SECONDS, TRANSCRIPTION_CHUNK_SECONDS,
+    TRANSCRIPTION_CHUNK_OVERLAP_SECONDS, TRANSCRIPTION_MAX_WORKERS
+)
 from logger import get_logger
+from audio_chunks import get_audio_duration, split_audio, stitch_transcripts
+from transcription_cache import TranscriptionCache, compute_file_hash
+from llm_gateway import get_llm_gateway
 
 logger = get_logger(__name__)
-genai.configure(api_key=GEMINI_API_KEY)
 
-class Transcriber:
-    def __init__(self):
-        self.model = genai.GenerativeModel(TRANSCRIPTION_MODEL)
-        logger.info("✓ Transcriber initialized")
-    
-    def transcript_audio(self, audio_path: str):
-        """Transcribe un archivo de audio con diarización e identificación de voces"""
-        try:
-            if not os.path.exists(audio_path):
-                raise FileNotFoundError(f"Archivo no encontrado: {audio_path}")
-            
-            ext = audio_path.lower().split('.')[-1]
-            mime_type = MIME_TYPES.get(ext, 'audio/mpeg')
-            
-            logger.info(f"Transcribiendo: {audio_path} ({mime_type})")
-            audio_file = genai.upload_file(audio_path, mime_type=mime_type)
-            
-            # Prompt ESTRICTO para diarización completa e identificación de nombres
-            prompt = """INSTRUCCIONES CRÍTICAS - DEBES SEGUIRLAS AL PIE DE LA LETRA:
+# Incrementar al cambiar TRANSCRIPTION_PROMPT para no reutilizar transcripciones antiguas
+TRANSCRIPTION_PROMPT_VERSION = "1"
+
+# Prompt ESTRICTO para diarización completa e identificación de nombres
+TRANSCRIPTION_PROMPT = """INSTRUCCIONES CRÍTICAS - DEBES SEGUIRLAS AL PIE DE LA LETRA:
 
 TAREA: Transcribe esta conversación/reunión identificando CADA HABLANTE por separado.
 
@@ -61,22 +58,185 @@ PASO 4 - REGLAS DE ORO:
 ✓ SIN EXPLICACIONES - solo el diálogo
 
 SALIDA FINAL: Solo el texto formateado, nada más."""
-            
-            response = self.model.generate_content([prompt, audio_file])
-            
-            logger.info(f"✓ Transcripción: {len(response.text)} caracteres")
-            
-            class Result:
-                def __init__(self, text):
-                    self.text = text
-            
-            return Result(response.text)
-        
+
+CHUNK_PROMPT_NOTE = """
+
+NOTA: Este audio es el FRAGMENTO {number} de {total} de una reunión más larga
+(minuto {start:.0f} a {end:.0f}). Puede empezar y terminar a mitad de frase:
+transcribe también esas frases parciales tal cual."""
+
+
+class TranscriptionResult:
+    """Resultado de una transcripción (expone .text como antes)"""
+    def __init__(self, text: str, chunks: int = 1, cached: bool = False):
+        self.text = text
+        self.chunks = chunks
+        self.cached = cached
+
+
+class Transcriber:
+    def __init__(self):
+        self.gateway = get_llm_gateway()
+        self.cache = TranscriptionCache()
+        logger.info("✓ Transcriber initialized")
+
+    def transcript_audio(
+        self,
+        audio_path: str,
+        chunked: bool = None,
+        use_cache: bool = True,
+        progress_callback: Optional[Callable[[float], None]] = None
+    ):
+        """Transcribe un archivo de audio con diarización e identificación de voces
+
+        Args:
+            audio_path: Ruta local del audio
+            chunked: Forzar (True) o desactivar (False) el modo por fragmentos.
+                     Por defecto se trocea si dura más de TRANSCRIPTION_CHUNK_THRESHOLD_SECONDS.
+            use_cache: Si es False se ignora la caché y se sobrescribe con el resultado nuevo
+            progress_callback: Recibe la fracción completada (0-1) a medida que avanza
+        """
+        try:
+            if not os.path.exists(audio_path):
+                raise FileNotFoundError(f"Archivo no encontrado: {audio_path}")
+
+            audio_hash = compute_file_hash(audio_path)
+            if use_cache:
+                cached_text = self.cache.get(audio_hash, TRANSCRIPTION_MODEL, TRANSCRIPTION_PROMPT_VERSION)
+                if cached_text:
+                    logger.info(f"✓ Transcripción desde caché: {audio_path} ({audio_hash})")
+                    return TranscriptionResult(cached_text, cached=True)
+
+            result = self._transcribe(audio_path, chunked, progress_callback)
+            self.cache.set(audio_hash, TRANSCRIPTION_MODEL, TRANSCRIPTION_PROMPT_VERSION, result.text)
+            return result
+
         except FileNotFoundError as e:
             logger.error(f"Archivo no encontrado: {audio_path}")
             raise
-        
+
         except Exception as e:
             logger.error(f"transcript_audio: {type(e).__name__} - {str(e)}")
             raise
 
+    def invalidate_cache(self, audio_path: str) -> int:
+        """Elimina de la caché las transcripciones de este audio (por contenido)"""
+        if not os.path.exists(audio_path):
+            return 0
+        return self.cache.invalidate(compute_file_hash(audio_path))
+
+    def _transcribe(
+        self,
+        audio_path: str,
+        chunked: bool = None,
+        progress_callback: Optional[Callable[[float], None]] = None
+    ) -> TranscriptionResult:
+        """Transcribe con Gemini (por fragmentos si el audio es largo)"""
+        ext = audio_path.lower().split('.')[-1]
+        mime_type = MIME_TYPES.get(ext, 'audio/mpeg')
+
+        if chunked is None:
+            duration = get_audio_duration(audio_path)
+            chunked = bool(duration and duration > TRANSCRIPTION_CHUNK_THRESHOLD_SECONDS)
+
+        if chunked:
+            result = self._transcribe_chunked(audio_path, progress_callback)
+            if result is not None:
+                return result
+            logger.warning("No se pudo trocear el audio, transcribiendo en una sola llamada")
+
+        logger.info(f"Transcribiendo: {audio_path} ({mime_type})")
+        text = self._transcribe_file(audio_path, mime_type, TRANSCRIPTION_PROMPT)
+        logger.info(f"✓ Transcripción: {len(text)} caracteres")
+        return TranscriptionResult(text)
+
+    def _transcribe_file(
+        self, path: str, mime_type: str, prompt: str, cancelled: Optional[threading.Event] = None
+    ) -> str:
+        """Sube un archivo a Gemini y devuelve el texto transcrito (el archivo subido se borra al terminar)
+
+        Si `cancelled` se activa durante la subida, no se llega a pedir la transcripción.
+        """
+        audio_file = self.gateway.call(
+            genai.upload_file, path, mime_type=mime_type,
+            bucket="upload_file", timeout=LLM_TRANSCRIPTION_TIMEOUT_SECONDS
+        )
+        try:
+            if cancelled is not None and cancelled.is_set():
+                raise CancelledError()
+            response = self.gateway.generate(
+                TRANSCRIPTION_MODEL, [prompt, audio_file], timeout=LLM_TRANSCRIPTION_TIMEOUT_SECONDS
+            )
+            return response.text
+        finally:
+            try:
+                self.gateway.call(genai.delete_file, audio_file.name, bucket="delete_file")
+            except Exception as e:
+                logger.warning(f"⚠️  No se pudo borrar {audio_file.name} de Gemini: {type(e).__name__}")
+
+    def _transcribe_chunk(self, chunk: Dict, total: int, cancelled: Optional[threading.Event] = None) -> str:
+        """Transcribe un fragmento (los reintentos los aplica la pasarela)"""
+        if cancelled is not None and cancelled.is_set():
+            raise CancelledError()
+        prompt = TRANSCRIPTION_PROMPT + CHUNK_PROMPT_NOTE.format(
+            number=chunk["index"] + 1, total=total,
+            start=chunk["start"] / 60, end=chunk["end"] / 60
+        )
+        started = time.monotonic()
+        try:
+            text = self._transcribe_file(chunk["path"], chunk["mime_type"], prompt, cancelled)
+        except CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Fragmento {chunk['index'] + 1}/{total} falló: {type(e).__name__}")
+            raise
+        logger.info(f"✓ Fragmento {chunk['index'] + 1}/{total}: {len(text)} caracteres en {time.monotonic() - started:.1f}s")
+        return text
+
+    def _transcribe_chunked(self, audio_path: str, progress_callback: Optional[Callable[[float], None]] = None):
+        """Trocea el audio en ventanas solapadas y las transcribe en paralelo
+
+        Returns:
+            TranscriptionResult o None si el audio no se puede trocear
+        """
+        with tempfile.TemporaryDirectory(prefix="chunks_") as tmp_dir:
+            chunks = split_audio(
+                audio_path, Path(tmp_dir),
+                TRANSCRIPTION_CHUNK_SECONDS, TRANSCRIPTION_CHUNK_OVERLAP_SECONDS
+            )
+            if not chunks:
+                return None
+
+            workers = max(1, min(TRANSCRIPTION_MAX_WORKERS, len(chunks)))
+            logger.info(f"Transcribiendo {audio_path} en {len(chunks)} fragmentos ({workers} en paralelo)")
+            started = time.monotonic()
+            done = []
+            cancelled = threading.Event()
+
+            def run_chunk(chunk: Dict) -> str:
+                text = self._transcribe_chunk(chunk, len(chunks), cancelled)
+                done.append(chunk["index"])
+                if progress_callback:
+                    progress_callback(len(done) / len(chunks))
+                return text
+
+            # Al primer fallo se cancelan los fragmentos en cola y los que están
+            # subiendo no llegan a pedir la transcripción (no se factura trabajo inútil)
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+            futures = [pool.submit(run_chunk, chunk) for chunk in chunks]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                texts = [future.result() for future in futures]
+            except BaseException:
+                cancelled.set()
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                # Se espera a los que ya estaban en marcha: usan los archivos de tmp_dir
+                pool.shutdown(wait=True, cancel_futures=True)
+
+            text = stitch_transcripts(texts)
+            logger.info(f"✓ Transcripción por fragmentos: {len(text)} caracteres en {time.monotonic() - started:.1f}s")
+            return TranscriptionResult(text, chunks=len(chunks))
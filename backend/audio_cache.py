@@ -0,0 +1,232 @@
+"""audio_cache.py - Caché LRU en disco de los audios (data/recordings)
+
+Los audios se descargan de Storage bajo demanda y se guardan en
+RECORDINGS_DIR con un índice SQLite (hash, tamaño, último acceso). Cuando el
+total supera AUDIO_CACHE_MAX_MB se eliminan los menos usados recientemente;
+el original sigue en Storage y se vuelve a descargar si hace falta.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+import streamlit as st
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import (
+    RECORDINGS_DIR, AUDIO_EXTENSIONS,
+    AUDIO_CACHE_DB_PATH, AUDIO_CACHE_MAX_MB, AUDIO_CACHE_MIN_AGE_SECONDS
+)
+from logger import get_logger
+from transcription_cache import compute_file_hash
+
+logger = get_logger(__name__)
+
+# Descarga filename → ruta destino; devuelve True si el archivo quedó escrito
+Downloader = Callable[[str, str], bool]
+
+
+class AudioCache:
+    """Caché de audios con presupuesto en bytes y expulsión LRU"""
+
+    def __init__(
+        self,
+        downloader: Optional[Downloader] = None,
+        cache_dir: Path = RECORDINGS_DIR,
+        db_path: Path = AUDIO_CACHE_DB_PATH,
+        max_bytes: int = AUDIO_CACHE_MAX_MB * 1024 * 1024,
+        min_age_seconds: float = AUDIO_CACHE_MIN_AGE_SECONDS
+    ):
+        self.downloader = downloader
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.min_age_seconds = min_age_seconds
+        self._lock = threading.Lock()
+        self._download_locks: Dict[str, threading.Lock] = {}  # Una descarga a la vez por audio
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._init_schema()
+        self._reconcile()
+
+    @contextmanager
+    def _connect(self):
+        """Conexión corta por operación (commit al salir del bloque)"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_schema(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS audio_cache (
+                    filename TEXT PRIMARY KEY,
+                    audio_hash TEXT,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_cache_access ON audio_cache(last_access)")
+
+    def _reconcile(self) -> None:
+        """Sincroniza el índice con el disco (archivos previos a la caché o borrados a mano)"""
+        on_disk = {
+            p.name: p for p in self.cache_dir.iterdir()
+            if p.is_file() and p.name.lower().endswith(AUDIO_EXTENSIONS)
+        }
+        with self._lock, self._connect() as conn:
+            indexed = {row["filename"] for row in conn.execute("SELECT filename FROM audio_cache")}
+            for name in indexed - on_disk.keys():
+                conn.execute("DELETE FROM audio_cache WHERE filename = ?", (name,))
+            for name in on_disk.keys() - indexed:
+                stat = on_disk[name].stat()
+                conn.execute(
+                    "INSERT INTO audio_cache (filename, audio_hash, size, last_access) VALUES (?, NULL, ?, ?)",
+                    (name, stat.st_size, stat.st_mtime)
+                )
+        self._evict()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def path_for(self, filename: str) -> Path:
+        return self.cache_dir / filename
+
+    def get_path(self, filename: str) -> Optional[Path]:
+        """Ruta local del audio; si no está en caché lo descarga de Storage
+
+        Dos sesiones que piden el mismo audio no lo descargan dos veces: la
+        segunda espera a la primera. Cada descarga escribe en un temporal
+        propio y se publica con os.replace (atómico), así que ni otro proceso
+        ni una descarga fallida dejan el audio a medias.
+        """
+        path = self.path_for(filename)
+        if path.exists():
+            self.hits += 1
+            self._touch(filename)
+            return path
+        if not self.downloader:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            download_lock = self._download_locks.setdefault(filename, threading.Lock())
+        with download_lock:
+            try:
+                if path.exists():  # La descargó otra sesión mientras se esperaba
+                    self.hits += 1
+                    self._touch(filename)
+                    return path
+                self.misses += 1
+                return self._download(filename, path)
+            finally:
+                with self._lock:
+                    self._download_locks.pop(filename, None)
+
+    def _download(self, filename: str, path: Path) -> Optional[Path]:
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{path.name}.", suffix=".part")
+        os.close(fd)
+        logger.info(f"Caché de audio: {filename} no está en disco, descargando de Storage...")
+        try:
+            if not self.downloader(filename, tmp_name):
+                return None
+            os.replace(tmp_name, path)
+        finally:
+            Path(tmp_name).unlink(missing_ok=True)
+        self.register(filename)
+        return path
+
+    def register(self, filename: str) -> None:
+        """Añade (o actualiza) un audio ya escrito en el directorio de la caché"""
+        path = self.path_for(filename)
+        if not path.exists():
+            return
+        audio_hash = compute_file_hash(str(path))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO audio_cache (filename, audio_hash, size, last_access) VALUES (?, ?, ?, ?)",
+                (filename, audio_hash, path.stat().st_size, time.time())
+            )
+        self._evict(protect=filename)
+
+    def remove(self, filename: str) -> None:
+        self.path_for(filename).unlink(missing_ok=True)
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM audio_cache WHERE filename = ?", (filename,))
+
+    def rename(self, old_filename: str, new_filename: str) -> None:
+        old_path, new_path = self.path_for(old_filename), self.path_for(new_filename)
+        with self._lock, self._connect() as conn:
+            if old_path.exists() and not new_path.exists():
+                old_path.rename(new_path)
+                conn.execute("UPDATE audio_cache SET filename = ? WHERE filename = ?", (new_filename, old_filename))
+            else:
+                conn.execute("DELETE FROM audio_cache WHERE filename = ?", (old_filename,))
+
+    def _touch(self, filename: str) -> None:
+        with self._lock, self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE audio_cache SET last_access = ? WHERE filename = ?", (time.time(), filename)
+            ).rowcount
+        if not updated:
+            self.register(filename)
+
+    def _evict(self, protect: Optional[str] = None) -> int:
+        """Elimina los audios menos usados hasta volver al presupuesto"""
+        removed = 0
+        with self._lock, self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            # Los accedidos hace poco pueden estar transcribiéndose o reproduciéndose
+            cutoff = time.time() - self.min_age_seconds
+            candidates = conn.execute(
+                "SELECT filename, size FROM audio_cache WHERE last_access < ? ORDER BY last_access",
+                (cutoff,)
+            ).fetchall()
+            for row in candidates:
+                if total <= self.max_bytes:
+                    break
+                if row["filename"] == protect:
+                    continue
+                self.path_for(row["filename"]).unlink(missing_ok=True)
+                conn.execute("DELETE FROM audio_cache WHERE filename = ?", (row["filename"],))
+                total -= row["size"]
+                removed += 1
+        if removed:
+            self.evictions += removed
+            logger.info(f"Caché de audio: {removed} archivo(s) expulsados (LRU), {total / (1024 * 1024):.0f} MB en uso")
+        return removed
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            files, used = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio_cache").fetchone()
+        requests = self.hits + self.misses
+        return {
+            "files": files,
+            "used_mb": round(used / (1024 * 1024), 1),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 3) if requests else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+@st.cache_resource
+def get_audio_cache() -> AudioCache:
+    """Caché única por proceso (descarga desde Supabase Storage)"""
+    import database as db_utils
+    return AudioCache(downloader=db_utils.download_audio_from_storage)
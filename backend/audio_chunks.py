@@ -0,0 +1,227 @@
+"""audio_chunks.py - Troceado de audio en ventanas solapadas y unión de transcripciones
+
+Los WAV se trocean con la librería estándar (`wave`). El resto de formatos
+necesita `pydub` (+ ffmpeg); si no está disponible se devuelve None y el
+Transcriber usa el modo de una sola llamada.
+"""
+import re
+import wave
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from logger import get_logger
+from helpers import SPEAKER_LINE_PATTERN
+
+logger = get_logger(__name__)
+
+try:
+    from pydub import AudioSegment
+except ImportError:
+    AudioSegment = None
+
+GENERIC_SPEAKER_PATTERN = re.compile(r'^Voz\s+(\d+)$', re.IGNORECASE)
+
+# Nº de líneas del final/principio de cada fragmento que se comparan para alinear
+OVERLAP_LINES = 8
+OVERLAP_SIMILARITY = 0.75
+# Líneas con menos palabras se ignoran al alinear ("Vale", "Sí, claro"...)
+OVERLAP_MIN_WORDS = 3
+
+# ============================================================================
+# DURACIÓN Y TROCEADO
+# ============================================================================
+
+def get_audio_duration(audio_path: str) -> Optional[float]:
+    """Devuelve la duración en segundos o None si no se puede determinar"""
+    try:
+        if audio_path.lower().endswith(".wav"):
+            with wave.open(audio_path, "rb") as wav:
+                return wav.getnframes() / float(wav.getframerate())
+        if AudioSegment is not None:
+            return len(AudioSegment.from_file(audio_path)) / 1000.0
+    except Exception as e:
+        logger.warning(f"No se pudo leer la duración de {audio_path}: {type(e).__name__}")
+    return None
+
+def compute_windows(duration: float, chunk_seconds: float, overlap_seconds: float) -> List[Tuple[float, float]]:
+    """Calcula ventanas (inicio, fin) en segundos que cubren todo el audio con solape"""
+    if duration <= chunk_seconds:
+        return [(0.0, duration)]
+    step = max(chunk_seconds - overlap_seconds, 1.0)
+    windows, start = [], 0.0
+    while start < duration:
+        end = min(start + chunk_seconds, duration)
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start += step
+    return windows
+
+def split_audio(
+    audio_path: str,
+    out_dir: Path,
+    chunk_seconds: float,
+    overlap_seconds: float
+) -> List[Dict]:
+    """Trocea un audio en ventanas solapadas y las escribe en out_dir
+
+    Returns:
+        Lista de dicts {index, start, end, path, mime_type}. Vacía si el formato
+        no se puede trocear en este entorno.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if audio_path.lower().endswith(".wav"):
+        return _split_wav(audio_path, out_dir, chunk_seconds, overlap_seconds)
+    if AudioSegment is not None:
+        return _split_pydub(audio_path, out_dir, chunk_seconds, overlap_seconds)
+    logger.warning("⚠️  pydub no instalado: no se puede trocear formatos distintos de WAV")
+    return []
+
+def _split_wav(audio_path: str, out_dir: Path, chunk_seconds: float, overlap_seconds: float) -> List[Dict]:
+    """Trocea WAV leyendo solo los frames de cada ventana"""
+    chunks = []
+    with wave.open(audio_path, "rb") as src:
+        params = src.getparams()
+        rate = src.getframerate()
+        duration = src.getnframes() / float(rate)
+        for idx, (start, end) in enumerate(compute_windows(duration, chunk_seconds, overlap_seconds)):
+            src.setpos(int(start * rate))
+            frames = src.readframes(int((end - start) * rate))
+            chunk_path = out_dir / f"chunk_{idx:03d}.wav"
+            with wave.open(str(chunk_path), "wb") as dst:
+                dst.setparams(params)
+                dst.writeframes(frames)
+            chunks.append({"index": idx, "start": start, "end": end, "path": str(chunk_path), "mime_type": "audio/wav"})
+    return chunks
+
+def _split_pydub(audio_path: str, out_dir: Path, chunk_seconds: float, overlap_seconds: float) -> List[Dict]:
+    """Trocea cualquier formato soportado por ffmpeg y exporta a MP3"""
+    audio = AudioSegment.from_file(audio_path)
+    duration = len(audio) / 1000.0
+    chunks = []
+    for idx, (start, end) in enumerate(compute_windows(duration, chunk_seconds, overlap_seconds)):
+        chunk_path = out_dir / f"chunk_{idx:03d}.mp3"
+        audio[int(start * 1000):int(end * 1000)].export(str(chunk_path), format="mp3")
+        chunks.append({"index": idx, "start": start, "end": end, "path": str(chunk_path), "mime_type": "audio/mpeg"})
+    return chunks
+
+# ============================================================================
+# UNIÓN DE TRANSCRIPCIONES
+# ============================================================================
+
+def _parse_lines(text: str) -> List[List[Optional[str]]]:
+    """Convierte 'Nombre: "texto"' en [speaker, texto]; líneas sin formato → [None, línea]"""
+    lines = []
+    for raw in text.splitlines():
+        raw = raw.strip()
+        if not raw:
+            continue
+        match = SPEAKER_LINE_PATTERN.match(raw)
+        if match:
+            # Mismo patrón que helpers.split_speaker_turns; el texto se conserva con sus comillas
+            lines.append([match.group(1).strip(), raw[match.end(1) + 1:].strip()])
+        else:
+            lines.append([None, raw])
+    return lines
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^\w\s]', '', text.lower()).strip()
+
+def _is_generic(speaker: Optional[str]) -> bool:
+    return bool(speaker and GENERIC_SPEAKER_PATTERN.match(speaker))
+
+def _is_trivial(text: str) -> bool:
+    """Líneas como "Vale" o "Sí, claro" aparecen en cualquier parte: no sirven para alinear"""
+    return len(_normalize(text).split()) < OVERLAP_MIN_WORDS
+
+def _lines_match(h_text: str, t_text: str) -> bool:
+    h_norm, t_norm = _normalize(h_text), _normalize(t_text)
+    # Una línea cortada por el borde de la ventana es prefijo/sufijo de la completa
+    return (
+        SequenceMatcher(None, h_norm, t_norm).ratio() >= OVERLAP_SIMILARITY
+        or (len(h_norm) > 15 and (h_norm in t_norm or t_norm in h_norm))
+    )
+
+def _align_overlap(
+    tail: List[List[Optional[str]]],
+    head: List[List[Optional[str]]]
+) -> Tuple[int, Dict[str, str]]:
+    """Alinea el principio de un fragmento con el final del anterior
+
+    Solo se acepta un tramo contiguo desde la primera línea de `head` que
+    coincida con las últimas líneas de `tail` (head[:k] ↔ tail[-k:]), y se
+    prueba primero el más largo. Las líneas triviales no cuentan como
+    coincidencia ni la rompen; hace falta al menos una línea con contenido.
+
+    Returns:
+        (nº de líneas iniciales duplicadas a descartar, mapeo speaker_nuevo → speaker_anterior)
+    """
+    for size in range(min(len(tail), len(head)), 0, -1):
+        matched = []
+        for (h_speaker, h_text), (t_speaker, t_text) in zip(head[:size], tail[-size:]):
+            if _is_trivial(h_text) or _is_trivial(t_text):
+                continue
+            if not _lines_match(h_text, t_text):
+                break
+            matched.append((h_speaker, t_speaker))
+        else:
+            if matched:
+                mapping = {}
+                for h_speaker, t_speaker in matched:
+                    if h_speaker and t_speaker:
+                        mapping.setdefault(h_speaker, t_speaker)
+                return size, mapping
+    return 0, {}
+
+def stitch_transcripts(texts: List[str]) -> str:
+    """Une transcripciones de ventanas solapadas manteniendo los hablantes
+
+    - Las líneas repetidas en la zona de solape se eliminan.
+    - Los hablantes de cada fragmento se alinean con el anterior usando las
+      líneas coincidentes del solape.
+    - Si un fragmento descubre el nombre real de una "Voz N", se renombra
+      también en todo lo ya unido.
+    """
+    merged: List[List[Optional[str]]] = []
+    for chunk_idx, text in enumerate(texts):
+        lines = _parse_lines(text or "")
+        if not merged:
+            merged.extend(lines)
+            continue
+
+        skip, mapping = _align_overlap(merged[-OVERLAP_LINES:], lines[:OVERLAP_LINES])
+        backward, forward = {}, {}
+        for new_speaker, old_speaker in mapping.items():
+            if new_speaker == old_speaker:
+                continue
+            if _is_generic(old_speaker) and not _is_generic(new_speaker):
+                # El fragmento nuevo conoce el nombre: renombrar lo ya unido
+                backward[old_speaker] = new_speaker
+            else:
+                forward[new_speaker] = old_speaker
+
+        # Una "Voz N" sin alinear cuyo número ya ocupa otro hablante alineado recibe número nuevo
+        taken = set(forward.values())
+        next_voice = 1 + max(
+            [int(GENERIC_SPEAKER_PATTERN.match(s).group(1)) for s, _ in merged + lines if _is_generic(s)] or [0]
+        )
+        for speaker in dict.fromkeys(s for s, _ in lines[skip:]):
+            if _is_generic(speaker) and speaker not in forward and speaker in taken:
+                forward[speaker] = f"Voz {next_voice}"
+                next_voice += 1
+
+        if backward or forward:
+            logger.debug(f"Fragmento {chunk_idx}: alineación de hablantes {backward} / {forward}")
+        for line in merged:
+            if line[0] in backward:
+                line[0] = backward[line[0]]
+        for speaker, line_text in lines[skip:]:
+            merged.append([forward.get(speaker, speaker), line_text])
+
+    output = []
+    for speaker, text in merged:
+        output.append(f"{speaker}: {text}" if speaker else text)
+    return "\n".join(output)
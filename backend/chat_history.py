@@ -0,0 +1,240 @@
+"""chat_history.py - Historial del chat persistido en la tabla chat_history
+
+- Ventana en memoria por grabación (los últimos CHAT_HISTORY_LIMIT mensajes)
+- Mensajes anteriores bajo demanda con paginación keyset sobre (created_at, id)
+- Escrituras asíncronas: un hilo agrupa los mensajes nuevos en inserts por lotes
+
+Los rerun de Streamlit leen de la ventana en memoria; solo se consulta la BD
+la primera vez que se abre una grabación y al pedir mensajes anteriores.
+"""
+import atexit
+import threading
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+import streamlit as st
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from logger import get_logger
+from config import (
+    CHAT_HISTORY_LIMIT, CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_FLUSH_SECONDS,
+    CHAT_HISTORY_BATCH_SIZE, CHAT_HISTORY_MAX_WINDOWS, CHAT_HISTORY_MAX_ATTEMPTS
+)
+import database as db_utils
+
+logger = get_logger(__name__)
+
+COLUMNS = "id, role, message, created_at"
+LOCAL_PREFIX = "local:"  # Conversaciones de audios sin fila en recordings (no se persisten)
+ROLES = ("user", "assistant")
+
+
+class ChatHistoryStore:
+    """Ventanas de conversación por grabación con escritura diferida en lotes"""
+
+    def __init__(
+        self,
+        window_size: int = CHAT_HISTORY_LIMIT,
+        page_size: int = CHAT_HISTORY_PAGE_SIZE,
+        flush_interval: float = CHAT_HISTORY_FLUSH_SECONDS,
+        batch_size: int = CHAT_HISTORY_BATCH_SIZE
+    ):
+        self.window_size = window_size
+        self.page_size = page_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._windows: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._limits: Dict[str, int] = {}  # Tamaño de ventana (crece al cargar páginas anteriores)
+        self._has_more: Dict[str, bool] = {}
+        self._pending: Deque[Dict] = deque()  # {"row": ..., "attempts": n}
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.queries = 0
+        self.written = 0
+
+    @staticmethod
+    def local_key(filename: str) -> str:
+        return f"{LOCAL_PREFIX}{filename}"
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def _select(self, recording_id: str, cursor: Optional[db_utils.Cursor] = None) -> Optional[List[Dict]]:
+        """Página de mensajes anteriores a `cursor` (o los últimos), de nuevo a viejo
+
+        El cursor es (created_at, id): los mensajes con el mismo created_at en el
+        borde de una página no se pierden ni se repiten.
+        """
+        db = db_utils.init_supabase()
+        if not db:
+            return None
+        self.queries += 1
+        query = db.table("chat_history").select(COLUMNS).eq("recording_id", recording_id)
+        return db_utils.keyset_page(query, cursor, limit=self.page_size).execute().data or []
+
+    def messages(self, recording_id: str) -> List[Dict]:
+        """Mensajes en memoria de la grabación (de viejo a nuevo); la primera vez carga los últimos"""
+        with self._lock:
+            if recording_id in self._windows:
+                self._windows.move_to_end(recording_id)
+                return list(self._windows[recording_id])
+
+        rows: List[Dict] = []
+        has_more = False
+        if not recording_id.startswith(LOCAL_PREFIX):
+            try:
+                db_rows = self._select(recording_id)
+                if db_rows is not None:
+                    rows = list(reversed(db_rows))
+                    has_more = len(db_rows) == self.page_size
+            except Exception as e:
+                logger.warning(f"⚠️  Historial de chat no disponible - {type(e).__name__}: {str(e)[:100]}")
+
+        with self._lock:
+            if recording_id not in self._windows:
+                # Mensajes escritos aún en cola (p. ej. tras un error de lectura previo)
+                pending = [p["row"] for p in self._pending if p["row"]["recording_id"] == recording_id]
+                seen = {r["id"] for r in rows}
+                rows.extend(r for r in pending if r["id"] not in seen)
+                self._windows[recording_id] = rows
+                self._limits[recording_id] = self.window_size
+                self._has_more[recording_id] = has_more
+                while len(self._windows) > CHAT_HISTORY_MAX_WINDOWS:
+                    evicted, _ = self._windows.popitem(last=False)
+                    self._limits.pop(evicted, None)
+                    self._has_more.pop(evicted, None)
+            return list(self._windows[recording_id])
+
+    def has_more(self, recording_id: str) -> bool:
+        with self._lock:
+            return self._has_more.get(recording_id, False)
+
+    def load_older(self, recording_id: str) -> int:
+        """Añade a la ventana la página anterior al mensaje más antiguo cargado"""
+        with self._lock:
+            window = self._windows.get(recording_id)
+            if not window or not self._has_more.get(recording_id):
+                return 0
+            oldest = window[0]
+        try:
+            rows = self._select(recording_id, cursor=(oldest["created_at"], oldest["id"]))
+        except Exception as e:
+            logger.warning(f"⚠️  No se pudieron cargar mensajes anteriores - {type(e).__name__}")
+            return 0
+        if rows is None:
+            return 0
+        with self._lock:
+            window = self._windows.setdefault(recording_id, [])
+            window[:0] = reversed(rows)
+            self._limits[recording_id] = len(window) + self.window_size
+            self._has_more[recording_id] = len(rows) == self.page_size
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def append(self, recording_id: str, role: str, message: str) -> Dict:
+        """Añade el mensaje a la ventana y lo encola para guardarlo en segundo plano"""
+        if role not in ROLES:
+            raise ValueError(f"Rol de chat no válido: {role}")
+        row = {
+            "id": str(uuid.uuid4()),  # Id de cliente: sirve de cursor aunque el mensaje siga en cola
+            "recording_id": recording_id,
+            "role": role,
+            "message": message,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self.messages(recording_id)  # Asegura la ventana antes de añadir
+        with self._lock:
+            window = self._windows.setdefault(recording_id, [])
+            window.append(row)
+            limit = self._limits.get(recording_id, self.window_size)
+            if len(window) > limit:
+                del window[:len(window) - limit]
+                self._has_more[recording_id] = True
+            if message and not recording_id.startswith(LOCAL_PREFIX):
+                self._pending.append({"row": row, "attempts": 0})
+        self._ensure_writer()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return row
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_loop, name="chat-history-writer", daemon=True)
+                self._thread.start()
+
+    def _writer_loop(self) -> None:
+        delay = self.flush_interval
+        while True:
+            self._wakeup.wait(timeout=delay)
+            self._wakeup.clear()
+            failed = self.flush() < 0
+            # Si la BD falla se espera cada vez más (hasta un minuto) antes de reintentar
+            delay = min(60.0, delay * 2) if failed else self.flush_interval
+
+    def _insert(self, db, rows: List[Dict]) -> bool:
+        try:
+            db.table("chat_history").insert(rows).execute()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️  chat_history: lote de {len(rows)} rechazado - {type(e).__name__}: {str(e)[:100]}")
+            return False
+
+    def flush(self) -> int:
+        """Guarda los mensajes en cola por lotes; devuelve los guardados (-1 si la BD no responde)"""
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                if not batch:
+                    return written
+                db = db_utils.init_supabase()
+                if db and self._insert(db, [p["row"] for p in batch]):
+                    written += len(batch)
+                    self.written += len(batch)
+                    continue
+
+                # Lote rechazado: fila a fila, para aislar mensajes inválidos
+                retry = []
+                for item in batch:
+                    if db and self._insert(db, [item["row"]]):
+                        written += 1
+                        self.written += 1
+                        continue
+                    item["attempts"] += 1
+                    if item["attempts"] < CHAT_HISTORY_MAX_ATTEMPTS:
+                        retry.append(item)
+                    else:
+                        logger.error(f"❌ chat_history: mensaje descartado tras {item['attempts']} intentos")
+                with self._lock:
+                    self._pending.extendleft(reversed(retry))
+                return -1 if retry else written
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "windows": len(self._windows), "pending": len(self._pending),
+                "queries": self.queries, "written": self.written,
+            }
+
+
+@st.cache_resource
+def get_chat_history_store() -> ChatHistoryStore:
+    """Historial único por proceso; al salir se vacía la cola pendiente"""
+    store = ChatHistoryStore()
+    atexit.register(store.flush)
+    return store
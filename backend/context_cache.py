@@ -0,0 +1,173 @@
+"""context_cache.py - Caché de contexto del chat por hash de transcripción
+
+Dos niveles, del más barato al más caro:
+
+- Memo de respuestas exactas: (transcripción, pregunta, keywords) → respuesta
+- Caché de contexto de Gemini (CachedContent): instrucciones + transcripción
+  se suben una vez y las preguntas siguientes solo envían la pregunta
+
+Si Gemini no admite la caché (modelo, tamaño mínimo, error) se envía el
+prompt completo. Todo el estado por transcripción está acotado con LRU.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from logger import get_logger
+from config import (
+    CONTEXT_CACHE_ENABLED, CONTEXT_CACHE_MODEL, CONTEXT_CACHE_MIN_TOKENS, CONTEXT_CACHE_TTL_MINUTES,
+    CHAT_ANSWER_MEMO_SIZE, CONTEXT_CACHE_MAX_TRANSCRIPTS
+)
+from helpers import estimate_tokens
+from keyword_matcher import normalize
+from llm_gateway import get_llm_gateway
+
+logger = get_logger(__name__)
+
+try:
+    from google.generativeai import caching as genai_caching
+except ImportError:
+    genai_caching = None
+
+
+def question_key(question: str) -> str:
+    """Pregunta normalizada: sin mayúsculas, acentos ni espacios repetidos"""
+    return " ".join(normalize(question).split())
+
+
+def keywords_key(keywords) -> Tuple[str, ...]:
+    if not keywords:
+        return ()
+    return tuple(sorted(keywords.keys() if isinstance(keywords, dict) else keywords))
+
+
+class _LRU:
+    """Diccionario LRU acotado (llamar con el lock del propietario tomado)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        if key not in self._data:
+            return None
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ContextCache:
+    """Memo de respuestas y CachedContent de Gemini por transcripción"""
+
+    def __init__(self, enabled: bool = CONTEXT_CACHE_ENABLED):
+        self.enabled = enabled and genai_caching is not None
+        self._lock = threading.Lock()
+        self._answers = _LRU(CHAT_ANSWER_MEMO_SIZE)
+        self._provider = _LRU(CONTEXT_CACHE_MAX_TRANSCRIPTS)  # transcript_hash → (CachedContent, caduca)
+        self._unsupported = _LRU(CONTEXT_CACHE_MAX_TRANSCRIPTS)  # Transcripciones en las que la caché de Gemini ha fallado
+        self._creating = _LRU(CONTEXT_CACHE_MAX_TRANSCRIPTS)  # transcript_hash → Lock de creación
+        self._counters = {"answer_hits": 0, "provider_hits": 0, "provider_created": 0, "misses": 0}
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    # ------------------------------------------------------------------
+    # Memo de respuestas exactas
+    # ------------------------------------------------------------------
+
+    def get_answer(self, transcript_hash: str, question: str, keywords=None) -> Optional[str]:
+        with self._lock:
+            answer = self._answers.get((transcript_hash, question_key(question), keywords_key(keywords)))
+            self._counters["answer_hits" if answer is not None else "misses"] += 1
+            return answer
+
+    def put_answer(self, transcript_hash: str, question: str, keywords, answer: str) -> None:
+        if not answer:
+            return
+        with self._lock:
+            self._answers.put((transcript_hash, question_key(question), keywords_key(keywords)), answer)
+
+    # ------------------------------------------------------------------
+    # Caché de contexto de Gemini
+    # ------------------------------------------------------------------
+
+    def provider_cache(self, transcript_hash: str, transcription: str, system_instruction: str):
+        """CachedContent con instrucciones + transcripción, o None si no se puede usar
+
+        Se crea una vez por transcripción y se renueva al caducar. Si Gemini
+        la rechaza (modelo sin soporte, contexto por debajo del mínimo) no se
+        vuelve a intentar para esa transcripción.
+        """
+        if not self.enabled or estimate_tokens(transcription) < CONTEXT_CACHE_MIN_TOKENS:
+            return None
+
+        with self._lock:
+            if self._unsupported.get(transcript_hash):
+                return None
+            creating = self._creating.get(transcript_hash)
+            if creating is None:
+                creating = threading.Lock()
+                self._creating.put(transcript_hash, creating)
+        with creating:  # Dos preguntas simultáneas no crean dos cachés
+            with self._lock:
+                entry = self._provider.get(transcript_hash)
+            if entry and entry[1] > time.time():
+                self._count("provider_hits")
+                return entry[0]
+            try:
+                ttl = timedelta(minutes=CONTEXT_CACHE_TTL_MINUTES)
+                cached = get_llm_gateway().call(
+                    genai_caching.CachedContent.create, CONTEXT_CACHE_MODEL,
+                    display_name=f"chat-{transcript_hash}", system_instruction=system_instruction,
+                    contents=[transcription], ttl=ttl, bucket="cached_content"
+                )
+            except Exception as e:
+                logger.warning(f"⚠️  Caché de contexto de Gemini no disponible, se envía el prompt completo - {type(e).__name__}: {str(e)[:100]}")
+                with self._lock:
+                    self._unsupported.put(transcript_hash, True)
+                return None
+            # Margen de un minuto para no usar una caché a punto de caducar
+            with self._lock:
+                self._provider.put(transcript_hash, (cached, time.time() + ttl.total_seconds() - 60))
+            self._count("provider_created")
+            logger.info(f"✓ Caché de contexto creada en Gemini (~{estimate_tokens(transcription)} tokens, {CONTEXT_CACHE_TTL_MINUTES} min)")
+            return cached
+
+    def invalidate_provider(self, transcript_hash: str) -> None:
+        """Olvida la caché de Gemini (p. ej. si la llamada la da por inexistente)"""
+        with self._lock:
+            self._provider.pop(transcript_hash, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._counters, "answers": len(self._answers), "provider_caches": len(self._provider)}
+
+
+_context_cache: Optional[ContextCache] = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCache:
+    """Caché única por proceso (compartida entre sesiones de Streamlit)"""
+    global _context_cache
+    with _context_cache_lock:
+        if _context_cache is None:
+            _context_cache = ContextCache()
+        return _context_cache
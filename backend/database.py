@@ -2,27 +2,42 @@
 import streamlit as st
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Callable
+from typing import Optional, List, Dict, Any, Callable, Tuple
 import sys
+import threading
 import time
+import weakref
+from collections import deque
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from logger import get_logger
-from helpers import db_operation, validate_file
+from helpers import db_operation, validate_file, safe_json_dump
+from config import (
+    SUPABASE_POOL_SIZE, SUPABASE_HTTP_TIMEOUT, CACHE_TTL_MINUTES,
+    STORAGE_BUCKET, STORAGE_UPLOAD_CHUNK_MB, RENAME_LOG_DIR, RENAME_RECOVERY_SECONDS,
+    MAX_SEARCH_RESULTS, TRANSCRIPT_SEARCH_CACHE_SECONDS, HEALTH_METRICS_CACHE_SECONDS
+)
+from local_index import get_local_index
 
 logger = get_logger(__name__)
 
 try:
-    from supabase import create_client, Client
+    from supabase import create_client, Client, ClientOptions
 except ImportError:
     create_client = None
     logger.warning("⚠️  Supabase no instalado")
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 # ============================================================================
 # CONFIGURACIÓN
 # ============================================================================
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # segundos
+PAGE_SIZE = 1000  # Máximo de filas por petición PostgREST
 
 # ============================================================================
 # UTILIDADES
@@ -63,16 +78,117 @@ def retry_operation(
     return None
 
 # ============================================================================
-# CONEXIÓN A SUPABASE
+# POOL HTTP INSTRUMENTADO
 # ============================================================================
 
+class _PoolMetrics:
+    """Contadores del pool HTTP compartido (peticiones, conexiones nuevas, latencia)"""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._connections = weakref.WeakSet()
+        self.requests = 0
+        self.completed = 0  # Con respuesta del servidor (aunque sea un 5xx)
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.errors = 0
+
+    def record(self, latency_ms: float, connections: List[Any], failed: bool = False, completed: bool = True) -> None:
+        """Una petición; sin respuesta (DNS, conexión rechazada) no cuenta como reutilización"""
+        with self._lock:
+            self.requests += 1
+            self.errors += int(failed)
+            self._latencies.append(latency_ms)
+            opened = 0
+            for conn in connections:
+                if conn not in self._connections:
+                    self._connections.add(conn)
+                    opened += 1
+            self.new_connections += opened
+            if completed:
+                self.completed += 1
+                self.reused_connections += int(not opened)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            requests, completed = self.requests, self.completed
+            new_connections, reused = self.new_connections, self.reused_connections
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+        return {
+            "pool_size": SUPABASE_POOL_SIZE,
+            "requests": requests,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / completed, 3) if completed else 0.0,
+            "errors": self.errors,
+            "latency_ms_avg": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+        }
+
+
+_pool_metrics = _PoolMetrics()
+
+if httpx is not None:
+    class _InstrumentedTransport(httpx.HTTPTransport):
+        """Transporte keep-alive que mide latencia y reutilización de conexiones"""
+
+        def handle_request(self, request):
+            started = time.perf_counter()
+            failed, completed = True, False
+            try:
+                response = super().handle_request(request)
+                failed, completed = response.status_code >= 500, True
+                return response
+            finally:
+                connections = list(getattr(self._pool, "connections", []))
+                _pool_metrics.record((time.perf_counter() - started) * 1000, connections, failed, completed)
+
+
+def _build_http_client() -> Optional["httpx.Client"]:
+    """Cliente httpx con pool de conexiones persistentes compartido por toda la app"""
+    if httpx is None:
+        return None
+    limits = httpx.Limits(
+        max_connections=SUPABASE_POOL_SIZE,
+        max_keepalive_connections=SUPABASE_POOL_SIZE,
+        keepalive_expiry=60
+    )
+    return httpx.Client(
+        transport=_InstrumentedTransport(limits=limits),
+        timeout=SUPABASE_HTTP_TIMEOUT,
+        follow_redirects=True
+    )
+
+
+@st.cache_resource
+def get_http_client() -> Optional["httpx.Client"]:
+    """Cliente httpx compartido (lo usan Supabase y las subidas por bloques)"""
+    return _build_http_client()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Métricas del pool HTTP: tamaño, peticiones, conexiones reutilizadas y latencia"""
+    return _pool_metrics.snapshot()
+
 # ============================================================================
 # CONEXIÓN A SUPABASE
 # ============================================================================
 
 @st.cache_resource
 def init_supabase() -> Optional[Client]:
-    """Inicializa cliente de Supabase con manejo de errores"""
+    """Inicializa el cliente ÚNICO de Supabase (compartido por todos los módulos)
+
+    Todas las peticiones PostgREST/Storage reutilizan el mismo pool HTTP
+    keep-alive, evitando handshakes TLS y configuración de auth por rerun.
+    """
     try:
         import os
         url = os.getenv("SUPABASE_URL", "").strip()
@@ -80,8 +196,15 @@ def init_supabase() -> Optional[Client]:
         if not url or not key:
             logger.error("❌ Credentials no configuradas")
             return None
-        client = create_client(url, key)
-        logger.info("✓ Conexión Supabase OK")
+
+        # ClientOptions(httpx_client=...) existe desde supabase 2.16 (fijado en requirements.txt)
+        http_client = get_http_client()
+        if http_client is not None:
+            client = create_client(url, key, options=ClientOptions(httpx_client=http_client))
+        else:
+            client = create_client(url, key)
+
+        logger.info(f"✓ Conexión Supabase OK (pool HTTP: {SUPABASE_POOL_SIZE} conexiones)")
         return client
     except Exception as e:
         logger.error(f"❌ Init Supabase: {e}")
@@ -138,16 +261,104 @@ def _execute_table_operation(
         logger.error(f"DB {method} {table}: {type(e).__name__}")
         return [] if method == "select" else None
 
+# ============================================================================
+# PAGINACIÓN KEYSET (created_at, id)
+# ============================================================================
+
+Cursor = Tuple[str, str]  # (created_at, id) de la última fila de la página anterior
+
+def keyset_page(
+    query,
+    cursor: Optional[Cursor] = None,
+    limit: int = PAGE_SIZE,
+    desc: bool = True,
+    column: str = "created_at"
+):
+    """Aplica a una consulta la página siguiente a `cursor` en orden (column, id)
+
+    A diferencia de range(offset, ...), el coste no crece con el número de
+    página (usa el índice sobre la columna) y las filas insertadas o borradas
+    mientras se pagina no desplazan las páginas siguientes. Con
+    column="updated_at" sirve para traer los cambios desde un cursor.
+
+    Las filas con la columna a NULL se excluyen: no tienen posición en el
+    orden del cursor (database.sql las declara NOT NULL).
+    """
+    query = query.not_.is_(column, "null")
+    if cursor:
+        stamp, row_id = cursor
+        op = "lt" if desc else "gt"
+        query = query.or_(f'{column}.{op}."{stamp}",and({column}.eq."{stamp}",id.{op}."{row_id}")')
+    return query.order(column, desc=desc).order("id", desc=desc).limit(limit)
+
+def next_cursor(rows: List[Dict], limit: int, column: str = "created_at") -> Optional[Cursor]:
+    """Cursor de la página siguiente (None si esta era la última)"""
+    if len(rows) < limit or not rows:
+        return None
+    return rows[-1][column], rows[-1]["id"]
+
+def count_rows(db, table: str, filters: Optional[Dict[str, Any]] = None) -> int:
+    """Total de filas con count="exact" y head=True (no descarga ninguna fila)"""
+    query = db.table(table).select("id", count="exact", head=True)
+    for col, val in (filters or {}).items():
+        query = query.eq(col, val)
+    return query.execute().count or 0
+
+# ============================================================================
+# MÉTRICAS DE SALUD (panel DEBUG)
+# ============================================================================
+
+HEALTH_TABLES = ("recordings", "opportunities", "transcriptions")
+
+@st.cache_data(ttl=HEALTH_METRICS_CACHE_SECONDS, show_spinner=False)
+def get_health_metrics() -> Dict[str, Any]:
+    """Filas y latencia por tabla con consultas head (unos cientos de bytes en total)
+
+    Returns:
+        {"ok": bool, "error": str | None, "checked_at": "HH:MM:SS",
+         "tables": {tabla: {"count": int | None, "latency_ms": float, "error": str | None}}}
+    """
+    db = init_supabase()
+    if not db:
+        return {"ok": False, "error": "BD no disponible", "checked_at": datetime.now().strftime("%H:%M:%S"), "tables": {}}
+
+    tables, first_error = {}, None
+    for table in HEALTH_TABLES:
+        started = time.perf_counter()
+        count, error = None, None
+        try:
+            count = count_rows(db, table)
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)[:200]}"
+            first_error = first_error or error
+            logger.warning(f"⚠️  Métricas de salud: {table} - {error}")
+        tables[table] = {
+            "count": count, "latency_ms": round((time.perf_counter() - started) * 1000, 1), "error": error
+        }
+    return {
+        "ok": first_error is None, "error": first_error,
+        "checked_at": datetime.now().strftime("%H:%M:%S"), "tables": tables,
+    }
+
 
 
 @db_operation
 def upload_audio_to_storage(db, filename: str, filepath: str) -> bool:
-    """Sube audio a Supabase Storage"""
+    """Sube audio a Supabase Storage
+
+    Los archivos mayores que un bloque se envían por TUS leyendo el archivo
+    local por bloques (memoria acotada y reanudable); los pequeños, de una vez.
+    """
     valid, err = validate_file(filepath)
     if not valid:
         logger.error(f"❌ {err}")
         return False
     try:
+        http_client = get_http_client()
+        if http_client is not None and Path(filepath).stat().st_size > STORAGE_UPLOAD_CHUNK_MB * 1024 * 1024:
+            from storage_upload import ResumableUpload
+            return ResumableUpload(http_client, filename, filepath).run()
+
         with open(filepath, "rb") as f:
             db.storage.from_("recordings").upload(filename, f.read(), {"upsert": "true"})
         logger.info(f"✓ {filename} subido a Storage")
@@ -177,8 +388,12 @@ def delete_audio_from_storage(db, filename: str) -> bool:
         return False
 
 @db_operation
-def save_recording_to_db(db, filename: str, filepath: str, transcription: Optional[str] = None) -> Optional[str]:
-    """Sube a Storage + guarda en BD"""
+def save_recording_to_db(db, filename: str, filepath: str, transcription: Optional[str] = None) -> Optional[Dict]:
+    """Sube a Storage + guarda en BD
+
+    Returns:
+        Fila insertada (id y created_at/updated_at puestos por la BD) o None
+    """
     logger.info(f"[1/2] Storage: {filename}")
     if not upload_audio_to_storage(filename, filepath):
         logger.error(f"[FAIL] Storage")
@@ -186,16 +401,22 @@ def save_recording_to_db(db, filename: str, filepath: str, transcription: Option
     
     logger.info(f"[2/2] BD metadata")
     try:
-        result = db.table("recordings").insert({
+        row = {
             "filename": filename,
             "filepath": filepath,
             "transcription": transcription,
-            "created_at": datetime.now().isoformat()
-        }).execute()
-        recording_id = result.data[0]["id"] if result.data else None
-        if recording_id:
-            logger.info(f"✓ Recording ID: {recording_id}")
-        return recording_id
+            "file_size_mb": round(Path(filepath).stat().st_size / (1024 * 1024), 2)
+        }
+        try:
+            result = db.table("recordings").insert(row).execute()
+        except Exception:
+            # Esquemas sin la columna file_size_mb (ver database.sql)
+            row.pop("file_size_mb")
+            result = db.table("recordings").insert(row).execute()
+        recording = result.data[0] if result.data else None
+        if recording:
+            logger.info(f"✓ Recording ID: {recording['id']}")
+        return recording
     except:
         return None
 
@@ -210,88 +431,191 @@ def update_transcription(db, recording_id: str, transcription: str) -> bool:
     return bool(_execute_table_operation(
         db, "recordings", "update",
         filters={"id": recording_id},
-        data={"transcription": transcription, "updated_at": datetime.now().isoformat()}
+        data={"transcription": transcription}  # updated_at lo pone el trigger de la BD
     ))
 
+# ============================================================================
+# RENOMBRADO (move en Storage + registro compensatorio)
+# ============================================================================
+# Cada renombrado deja un registro en RENAME_LOG_DIR antes de tocar nada:
+#   pending → el objeto aún no se ha movido en Storage
+#   moved   → Storage ya tiene el nombre nuevo, falta la fila de BD
+# Si el proceso muere a mitad, o el move falla sin saber si el servidor llegó a
+# ejecutarlo (timeout, conexión cortada), recover_pending_renames() completa o
+# revierte el renombrado sin volver a transferir el audio.
+
+RENAME_PENDING = "pending"
+RENAME_MOVED = "moved"
+
+_rename_recovery_lock = threading.Lock()
+_rename_recovery_at = 0.0
+
+
+def _rename_log_path(old_filename: str) -> Path:
+    import hashlib
+    return RENAME_LOG_DIR / f"{hashlib.sha256(old_filename.encode('utf-8')).hexdigest()[:24]}.json"
+
+
+def _write_rename_log(old_filename: str, new_filename: str, state: str) -> None:
+    safe_json_dump({
+        "old_filename": old_filename,
+        "new_filename": new_filename,
+        "state": state,
+        "updated_at": datetime.now().isoformat()
+    }, _rename_log_path(old_filename).name, RENAME_LOG_DIR)
+
+
+def _clear_rename_log(old_filename: str) -> None:
+    _rename_log_path(old_filename).unlink(missing_ok=True)
+
+
+def _storage_exists(db, filename: str) -> Optional[bool]:
+    """Consulta el objeto exacto (GET object/info). None si Storage no responde: no se sabe"""
+    try:
+        db.storage.from_(STORAGE_BUCKET).info(filename)
+        return True
+    except Exception as e:
+        status = str(getattr(e, "status", "") or "")
+        if status in ("400", "404") or "not found" in str(e).lower():
+            return False
+        logger.warning(f"⚠️  Storage: no se pudo comprobar {filename} - {type(e).__name__}: {str(e)[:100]}")
+        return None
+
+
+def _rename_local_copy(old_filename: str, new_filename: str) -> None:
+    """Renombra también la copia en la caché de audios (evita volver a descargarla)"""
+    try:
+        from audio_cache import get_audio_cache
+        get_audio_cache().rename(old_filename, new_filename)
+    except Exception as e:
+        logger.warning(f"⚠️  Copia local no renombrada: {e}")
+
+
+def _finish_rename(db, old_filename: str, new_filename: str) -> bool:
+    """Paso 2: actualiza la fila (un único UPDATE, atómico). Revierte el move si falla"""
+    # updated_at lo pone el trigger de la BD (no el reloj de este cliente)
+    result = db.table("recordings").update({"filename": new_filename}).eq("filename", old_filename).execute()
+
+    if result.data:
+        _clear_rename_log(old_filename)
+        _rename_local_copy(old_filename, new_filename)
+        invalidate_transcription_status_index()
+        _update_local_index("rename", old_filename, new_filename)
+        logger.info(f"✓ Nombre actualizado: {old_filename} → {new_filename}")
+        return True
+
+    already_done = db.table("recordings").select("id").eq("filename", new_filename).limit(1).execute()
+    if already_done.data:
+        # Un intento anterior ya actualizó la BD
+        _clear_rename_log(old_filename)
+        return True
+
+    logger.error("❌ Error actualizando BD. Revirtiendo move en Storage...")
+    db.storage.from_(STORAGE_BUCKET).move(new_filename, old_filename)
+    _clear_rename_log(old_filename)
+    return False
+
+
 @db_operation
 def update_recording_filename(db, old_filename: str, new_filename: str) -> bool:
     """
-    Actualiza el nombre del archivo de grabación en Supabase Storage y BD.
+    Renombra una grabación sin transferir el audio.
     
     Realiza:
-    1. Descargar archivo de Storage con nombre antiguo
-    2. Subir a Storage con nombre nuevo
-    3. Eliminar archivo antiguo de Storage
-    4. Actualizar BD con nuevo nombre
+    1. Registrar la operación (registro compensatorio)
+    2. Mover el objeto dentro de Storage (operación del servidor)
+    3. Actualizar el nombre en BD con un único UPDATE
     """
     try:
-        # 1. Descargar archivo con nombre antiguo
-        logger.info(f"[1/4] Descargando {old_filename} de Storage...")
-        try:
-            audio_data = db.storage.from_("recordings").download(old_filename)
-            if not audio_data:
-                logger.error(f"❌ No se pudo descargar {old_filename}")
-                return False
-        except Exception as e:
-            logger.error(f"❌ Error descargando: {e}")
+        existing = db.table("recordings").select("id").eq("filename", new_filename).limit(1).execute()
+        if existing.data:
+            logger.error(f"❌ Ya existe una grabación llamada {new_filename}")
             return False
-        
-        # 2. Subir a Storage con nombre nuevo
-        logger.info(f"[2/4] Subiendo como {new_filename}...")
-        try:
-            db.storage.from_("recordings").upload(
-                new_filename, 
-                audio_data, 
-                {"upsert": "false"}  # No sobrescribir si ya existe
-            )
-        except Exception as e:
-            logger.error(f"❌ Error subiendo: {e}")
-            return False
-        
-        # 3. Eliminar archivo antiguo de Storage
-        logger.info(f"[3/4] Eliminando {old_filename} de Storage...")
+
+        logger.info(f"[1/3] Registrando renombrado {old_filename} → {new_filename}")
+        _write_rename_log(old_filename, new_filename, RENAME_PENDING)
+
+        logger.info(f"[2/3] Moviendo en Storage...")
         try:
-            db.storage.from_("recordings").remove([old_filename])
+            db.storage.from_(STORAGE_BUCKET).move(old_filename, new_filename)
         except Exception as e:
-            logger.warning(f"⚠️  Error eliminando archivo antiguo: {e}")
-            # No es crítico, continuamos
-        
-        # 4. Actualizar BD
-        logger.info(f"[4/4] Actualizando BD...")
-        result = _execute_table_operation(
-            db, "recordings", "update",
-            filters={"filename": old_filename},
-            data={"filename": new_filename, "updated_at": datetime.now().isoformat()}
-        )
-        
-        if result:
-            logger.info(f"✓ Nombre actualizado completamente: {old_filename} → {new_filename}")
-            return True
-        else:
-            # Si la BD falla, intentar revertir en Storage
-            logger.error("❌ Error actualizando BD. Revertiendo cambios en Storage...")
-            try:
-                db.storage.from_("recordings").remove([new_filename])
-                # Re-subir con nombre antiguo
-                db.storage.from_("recordings").upload(
-                    old_filename, 
-                    audio_data, 
-                    {"upsert": "true"}
-                )
-            except:
-                logger.error("❌ Error al revertir. Storage podría estar en estado inconsistente")
-            return False
+            # El servidor pudo mover el objeto antes de fallar la respuesta: se comprueba
+            logger.error(f"❌ Error moviendo en Storage: {e}")
+            moved = _storage_exists(db, new_filename)
+            if moved is None:
+                # No se sabe: el registro pendiente se conserva y lo resuelve la recuperación
+                return False
+            if not moved:
+                _clear_rename_log(old_filename)
+                return False
+        _write_rename_log(old_filename, new_filename, RENAME_MOVED)
+
+        logger.info(f"[3/3] Actualizando BD...")
+        return _finish_rename(db, old_filename, new_filename)
             
     except Exception as e:
+        # El registro se conserva: recover_pending_renames() lo completará o revertirá
         logger.error(f"❌ Error al actualizar nombre: {e}")
         return False
 
+
+@db_operation
+def recover_pending_renames(db) -> int:
+    """Completa o revierte renombrados interrumpidos. Devuelve cuántos se resolvieron"""
+    import json
+    resolved = 0
+    for log_path in sorted(RENAME_LOG_DIR.glob("*.json")):
+        try:
+            with open(log_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            old_filename, new_filename = entry["old_filename"], entry["new_filename"]
+
+            if entry["state"] == RENAME_PENDING:
+                exists = _storage_exists(db, new_filename)
+                if exists is None:
+                    # Sin respuesta de Storage: se conserva el registro para el próximo intento
+                    continue
+                if not exists:
+                    # El move nunca llegó a ejecutarse: no hay nada que deshacer
+                    _clear_rename_log(old_filename)
+                    resolved += 1
+                    continue
+                _write_rename_log(old_filename, new_filename, RENAME_MOVED)
+
+            _finish_rename(db, old_filename, new_filename)
+            resolved += 1
+            logger.info(f"♻️  Renombrado interrumpido resuelto: {old_filename} → {new_filename}")
+        except Exception as e:
+            logger.warning(f"⚠️  No se pudo resolver {log_path.name}: {type(e).__name__}")
+    return resolved
+
+
+def recover_pending_renames_if_due() -> int:
+    """Recuperación de renombrados como mucho cada RENAME_RECOVERY_SECONDS (si hay registros)
+
+    Se llama en cada rerun: un registro que quedó sin resolver (Storage sin
+    respuesta) se reintenta sin esperar a reiniciar el proceso.
+    """
+    global _rename_recovery_at
+    now = time.monotonic()
+    if _rename_recovery_at and now - _rename_recovery_at < RENAME_RECOVERY_SECONDS:
+        return 0
+    if not _rename_recovery_lock.acquire(blocking=False):
+        return 0
+    try:
+        _rename_recovery_at = now
+        if not any(RENAME_LOG_DIR.glob("*.json")):
+            return 0
+        return recover_pending_renames() or 0
+    finally:
+        _rename_recovery_lock.release()
+
 @db_operation
 def save_opportunity(db, recording_id: str, title: str, description: str) -> bool:
-    """Guarda oportunidad"""
+    """Guarda oportunidad (created_at lo pone el servidor)"""
     return bool(_execute_table_operation(
         db, "opportunities", "insert",
-        data={"recording_id": recording_id, "title": title, "description": description, "created_at": datetime.now().isoformat()}
+        data={"recording_id": recording_id, "title": title, "description": description}
     ))
 
 @db_operation
@@ -311,6 +635,8 @@ def delete_recording_from_db(db, recording_id: int) -> bool:
         
         if filename:
             delete_audio_from_storage(filename)
+        invalidate_transcription_status_index()
+        _update_local_index("remove_recording", recording_id)
         return True
     except:
         return False
@@ -326,6 +652,102 @@ def delete_recording_by_filename(db, filename: str) -> bool:
     except:
         return False
 
+# ============================================================================
+# ÍNDICE LOCAL (réplica SQLite, ver local_index.py)
+# ============================================================================
+
+def _update_local_index(operation: str, *args) -> None:
+    """Aplica un cambio en el índice local; un fallo aquí nunca rompe la operación en BD"""
+    try:
+        getattr(get_local_index(), operation)(*args)
+    except Exception as e:
+        logger.warning(f"⚠️  Índice local: {operation} fallido - {type(e).__name__}: {str(e)[:100]}")
+
+# ============================================================================
+# ÍNDICE DE ESTADO DE TRANSCRIPCIÓN
+# ============================================================================
+
+@st.cache_data(ttl=CACHE_TTL_MINUTES * 60, show_spinner=False)
+def _cached_transcription_status_index() -> Dict[str, bool]:
+    """Una sola consulta (join embebido) paginada por keyset de a PAGE_SIZE filas (los errores no se cachean)"""
+    db = init_supabase()
+    if not db:
+        raise ConnectionError("BD no disponible")
+    index, cursor = {}, None
+    while True:
+        query = db.table("recordings").select("id, created_at, filename, transcriptions(id)")
+        rows = keyset_page(query, cursor).execute().data or []
+        for row in rows:
+            # Si hay nombres repetidos basta con que uno esté transcrito
+            index[row["filename"]] = index.get(row["filename"], False) or bool(row.get("transcriptions"))
+        cursor = next_cursor(rows, PAGE_SIZE)
+        if not cursor:
+            return index
+
+def get_transcription_status_index() -> Dict[str, bool]:
+    """Devuelve {filename: tiene_transcripción} para todas las grabaciones
+
+    Sustituye a una llamada a get_transcription_by_filename por grabación.
+    Se invalida al guardar/borrar transcripciones o grabaciones. Sin conexión
+    responde el índice local, fuera de la caché: en cuanto Supabase vuelve a
+    responder se usa otra vez su respuesta.
+    """
+    try:
+        return _cached_transcription_status_index()
+    except Exception as e:
+        logger.error(f"get_transcription_status_index: {type(e).__name__} - {str(e)[:200]}")
+    try:
+        return get_local_index().transcription_status()
+    except Exception as e:
+        logger.warning(f"⚠️  Índice local no disponible: {type(e).__name__}")
+        return {}
+
+def invalidate_transcription_status_index() -> None:
+    """Fuerza a recargar el índice de estado (y las búsquedas de contenido) en la próxima lectura"""
+    try:
+        _cached_transcription_status_index.clear()
+        _cached_search_transcriptions.clear()
+    except Exception as e:
+        logger.debug(f"No se pudo invalidar el índice de transcripciones: {e}")
+
+# ============================================================================
+# BÚSQUEDA DE TEXTO COMPLETO EN TRANSCRIPCIONES
+# ============================================================================
+
+@st.cache_data(ttl=TRANSCRIPT_SEARCH_CACHE_SECONDS, show_spinner=False)
+def _cached_search_transcriptions(query: str, limit: int, offset: int) -> List[Dict]:
+    """Llamada a la función SQL search_transcriptions (los errores no se cachean)"""
+    db = init_supabase()
+    if not db:
+        raise ConnectionError("BD no disponible")
+    result = db.rpc("search_transcriptions", {
+        "search_query": query, "result_limit": limit, "result_offset": offset
+    }).execute()
+    return result.data or []
+
+def search_transcriptions(query: str, limit: int = MAX_SEARCH_RESULTS, offset: int = 0) -> Optional[List[Dict]]:
+    """Grabaciones cuya transcripción contiene la búsqueda, ordenadas por relevancia
+    
+    Admite "frases exactas", -exclusiones y or. Cada resultado trae
+    recording_id, filename, transcription_id, created_at, rank y snippet
+    (coincidencias entre **). Responde la función SQL sobre el índice GIN de
+    transcriptions.content_tsv (ver database.sql); solo si Supabase falla se
+    busca en el índice local (FTS5). Devuelve None si la búsqueda no está
+    disponible.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    try:
+        return _cached_search_transcriptions(query, limit, offset)
+    except Exception as e:
+        logger.error(f"search_transcriptions: {type(e).__name__} - {str(e)[:200]}")
+    try:
+        return get_local_index().search(query, limit, offset)
+    except Exception as e:
+        logger.warning(f"⚠️  Índice local no disponible: {type(e).__name__}")
+        return None
+
 @db_operation
 def save_transcription(db, recording_filename: str, content: str, language: str = "es") -> Optional[str]:
     """Guarda transcripción"""
@@ -335,35 +757,58 @@ def save_transcription(db, recording_filename: str, content: str, language: str
             return None
         
         recording_id = result.data[0]["id"]
+        # created_at/updated_at los pone el servidor (default y trigger, ver database.sql)
         trans_result = db.table("transcriptions").insert({
             "recording_id": recording_id,
             "content": content,
-            "language": language,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
+            "language": language
         }).execute()
-        return trans_result.data[0]["id"] if trans_result.data else None
+        invalidate_transcription_status_index()
+        row = trans_result.data[0] if trans_result.data else {}
+        transcription_id = row.get("id")
+        if transcription_id:
+            _update_local_index(
+                "upsert_transcription", recording_id, recording_filename, content, transcription_id, language,
+                row.get("created_at")
+            )
+        return transcription_id
     except:
         return None
 
 @db_operation
-def get_transcription_by_filename(db, recording_filename: str) -> Optional[Dict]:
-    """Obtiene transcripción por filename"""
-    try:
-        result = db.table("recordings").select("id").eq("filename", recording_filename).execute()
-        if not result.data:
-            return None
-        
-        trans = db.table("transcriptions").select("*").eq("recording_id", result.data[0]["id"]).order("created_at", desc=True).limit(1).execute()
-        return trans.data[0] if trans.data else None
-    except:
+def _fetch_transcription_by_filename(db, recording_filename: str) -> Optional[Dict]:
+    """Última transcripción (None si no hay; los errores los convierte db_operation en False)"""
+    result = db.table("recordings").select("id").eq("filename", recording_filename).execute()
+    if not result.data:
         return None
 
+    trans = db.table("transcriptions").select("*").eq("recording_id", result.data[0]["id"]).order("created_at", desc=True).limit(1).execute()
+    return trans.data[0] if trans.data else None
+
+def get_transcription_by_filename(recording_filename: str) -> Optional[Dict]:
+    """Obtiene transcripción por filename (Supabase; el índice local solo si la BD no responde)"""
+    trans = _fetch_transcription_by_filename(recording_filename)
+    if trans is False:
+        try:
+            return get_local_index().get_transcription(recording_filename)
+        except Exception as e:
+            logger.warning(f"⚠️  Índice local no disponible: {type(e).__name__}")
+            return None
+
+    if trans and trans.get("content"):
+        _update_local_index(
+            "upsert_transcription", trans["recording_id"], recording_filename, trans["content"],
+            trans.get("id"), trans.get("language") or "es", trans.get("created_at")
+        )
+    return trans or None
+
 @db_operation
 def delete_transcription_by_id(db, transcription_id: str) -> bool:
     """Elimina una transcripción"""
     try:
         db.table("transcriptions").delete().eq("id", transcription_id).execute()
+        invalidate_transcription_status_index()
+        _update_local_index("remove_transcription", transcription_id)
         return True
     except:
         return False
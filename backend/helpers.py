@@ -1,8 +1,9 @@
 """helpers.py - Funciones auxiliares comunes para reducir duplicación"""
+import re
 import streamlit as st
 from functools import wraps
 from pathlib import Path
-from typing import Callable, Optional, Any, Dict, List, Tuple
+from typing import Callable, Optional, Any, Dict, List, NamedTuple, Tuple
 from datetime import datetime
 from logger import get_logger
 
@@ -132,3 +133,70 @@ def format_recording_name(filename: str) -> str:
     
     # Reemplazar guiones bajos por espacios
     return filename.replace("_", " ")
+
+# ============================================================================
+# TURNOS DE PALABRA EN TRANSCRIPCIONES
+# ============================================================================
+
+SPEAKER_LINE_PATTERN = re.compile(r'^([^:]+):\s*["\']?(.+?)["\']?\s*$')
+CHARS_PER_TOKEN = 4  # Estimación habitual para texto en castellano
+
+
+class SpeakerTurn(NamedTuple):
+    speaker: str  # "Unknown" si la línea no sigue el formato 'Nombre: "..."'
+    text: str     # Texto del turno sin el nombre ni las comillas
+    raw: str      # Líneas originales del turno
+
+
+def split_speaker_turns(transcription: str) -> List[SpeakerTurn]:
+    """Divide una transcripción con formato 'Nombre: "..."' en turnos de palabra
+
+    Las líneas sin speaker se añaden al turno anterior.
+    """
+    turns: List[SpeakerTurn] = []
+    for line in transcription.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        match = SPEAKER_LINE_PATTERN.match(line)
+        if match:
+            turns.append(SpeakerTurn(match.group(1).strip(), match.group(2).strip(), line))
+        elif turns:
+            previous = turns[-1]
+            turns[-1] = SpeakerTurn(previous.speaker, f"{previous.text} {line}", f"{previous.raw}\n{line}")
+        else:
+            turns.append(SpeakerTurn("Unknown", line, line))
+    return turns
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_speaker_turns(transcription: str, max_tokens: int) -> List[str]:
+    """Agrupa turnos completos en bloques de como máximo `max_tokens` (estimados)
+
+    Un turno que por sí solo supera el presupuesto se parte por palabras y
+    cada trozo conserva el nombre del speaker.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks, current, size = [], [], 0
+    for turn in split_speaker_turns(transcription):
+        pieces = [turn.raw]
+        if len(turn.raw) > max_chars:
+            words, pieces, piece = turn.raw.split(), [], ""
+            for word in words:
+                if piece and len(piece) + len(word) + 1 > max_chars:
+                    pieces.append(piece)
+                    piece = f"{turn.speaker}:"
+                piece = f"{piece} {word}" if piece else word
+            pieces.append(piece)
+        for piece in pieces:
+            if current and size + len(piece) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
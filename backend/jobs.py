@@ -0,0 +1,322 @@
+"""jobs.py - Cola persistente de trabajos (SQLite) con pool de workers
+
+Pipeline por trabajo: transcribe → save → analyze. Cada etapa guarda su
+resultado en la fila del trabajo, de modo que si el proceso se reinicia el
+trabajo se reanuda desde la última etapa completada en vez de empezar de cero.
+
+Cada trabajo pertenece a la sesión que lo encoló (session_id): la interfaz
+solo muestra el progreso y el resultado de los trabajos de su propia sesión.
+Si una etapa posterior a PARTIAL_AFTER_STAGE falla (p. ej. el análisis), lo
+ya guardado se conserva y el trabajo queda como 'partial' con la etapa fallida.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import streamlit as st
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import JOBS_DB_PATH, JOB_WORKERS
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_PARTIAL = "partial"  # Transcripción guardada, falló una etapa posterior
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# Una etapa recibe (job, contexto) y deja sus resultados en el contexto
+Stage = Tuple[str, Callable[[Dict, Dict], None]]
+
+# Progreso alcanzado al terminar cada etapa
+STAGE_PROGRESS = {"transcribe": 0.7, "save": 0.8, "analyze": 1.0}
+
+# Completada esta etapa, un fallo posterior deja el trabajo como JOB_PARTIAL
+PARTIAL_AFTER_STAGE = "save"
+
+# ============================================================================
+# COLA
+# ============================================================================
+
+class JobQueue:
+    """Cola de trabajos persistida en SQLite (segura entre hilos)"""
+
+    def __init__(self, db_path: Path = JOBS_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._init_schema()
+        self._recover_interrupted()
+
+    @contextmanager
+    def _connect(self):
+        """Conexión corta por operación (commit al salir del bloque)"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_schema(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    session_id TEXT,
+                    filename TEXT NOT NULL,
+                    audio_path TEXT NOT NULL,
+                    options TEXT NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    result TEXT NOT NULL DEFAULT '{}',
+                    error TEXT,
+                    failed_stage TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            # Colas creadas antes de añadir estas columnas
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("session_id", "failed_stage"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+            conn.execute("DROP INDEX IF EXISTS idx_jobs_filename")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session_filename ON jobs(session_id, filename, created_at DESC)")
+
+    def _recover_interrupted(self) -> None:
+        """Trabajos 'running' de un proceso anterior vuelven a la cola"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (JOB_QUEUED, datetime.now().isoformat(), JOB_RUNNING)
+            )
+            if cursor.rowcount:
+                logger.info(f"♻️  {cursor.rowcount} trabajo(s) interrumpido(s) devueltos a la cola")
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job.get("options") or "{}")
+        job["result"] = json.loads(job.get("result") or "{}")
+        return job
+
+    def submit(
+        self,
+        filename: str,
+        audio_path: str,
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None
+    ) -> str:
+        """Encola un trabajo. Si la sesión ya tiene uno activo para el mismo audio, devuelve ese"""
+        now = datetime.now().isoformat()
+        with self._lock, self._connect() as conn:
+            active = conn.execute(
+                f"SELECT id FROM jobs WHERE session_id IS ? AND filename = ? "
+                f"AND status IN ({','.join('?' * len(ACTIVE_STATUSES))}) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (session_id, filename, *ACTIVE_STATUSES)
+            ).fetchone()
+            if active:
+                return active["id"]
+
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO jobs (id, session_id, filename, audio_path, options, status, progress, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                (job_id, session_id, filename, audio_path, json.dumps(options or {}), JOB_QUEUED, now, now)
+            )
+        logger.info(f"📥 Trabajo encolado: {job_id} ({filename})")
+        return job_id
+
+    def claim_next(self) -> Optional[Dict]:
+        """Marca como 'running' el trabajo en cola más antiguo y lo devuelve"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (JOB_RUNNING, datetime.now().isoformat(), row["id"])
+            )
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def update(self, job_id: str, **fields) -> None:
+        """Actualiza campos del trabajo (result/options se serializan a JSON)"""
+        for key in ("result", "options"):
+            if key in fields:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        fields["updated_at"] = datetime.now().isoformat()
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def latest_for(self, filename: str, session_id: Optional[str]) -> Optional[Dict]:
+        """Último trabajo (activo o no) de un audio encolado por esa sesión"""
+        with self._connect() as conn:
+            return self._to_dict(conn.execute(
+                "SELECT * FROM jobs WHERE session_id IS ? AND filename = ? ORDER BY created_at DESC LIMIT 1",
+                (session_id, filename)
+            ).fetchone())
+
+    def list_jobs(self, statuses: Optional[Tuple[str, ...]] = None, limit: int = 20) -> List[Dict]:
+        query, params = "SELECT * FROM jobs", []
+        if statuses:
+            query += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [self._to_dict(row) for row in conn.execute(query, params).fetchall()]
+
+    def retry(self, job_id: str) -> None:
+        """Vuelve a encolar un trabajo fallido o parcial (reanuda desde la etapa que falló)"""
+        self.update(job_id, status=JOB_QUEUED, error=None, failed_stage=None)
+
+    def pending_count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (JOB_QUEUED,)).fetchone()[0]
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+class JobWorkerPool:
+    """Pool de hilos que ejecuta las etapas de cada trabajo en orden"""
+
+    def __init__(self, queue: JobQueue, stages: List[Stage], workers: int = JOB_WORKERS):
+        self.queue = queue
+        self.stages = stages
+        self.workers = max(1, workers)
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"✓ {self.workers} worker(s) de trabajos iniciados")
+
+    def notify(self) -> None:
+        """Despierta a los workers tras encolar un trabajo"""
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        while True:
+            job = self.queue.claim_next()
+            if job is None:
+                self._wakeup.wait(timeout=5)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict) -> None:
+        context = dict(job["result"])
+        completed = context.setdefault("completed_stages", [])
+        logger.info(f"▶️  Trabajo {job['id']} ({job['filename']}) - etapas hechas: {completed}")
+        current = None
+        try:
+            for name, stage in self.stages:
+                if name in completed:
+                    continue
+                current = name
+                self.queue.update(job["id"], stage=name)
+                started = time.monotonic()
+                stage(job, context)
+                completed.append(name)
+                context.setdefault("timings", {})[name] = round(time.monotonic() - started, 2)
+                self.queue.update(job["id"], result=context, progress=STAGE_PROGRESS.get(name, 0))
+            self.queue.update(job["id"], status=JOB_DONE, stage=None, progress=1.0, error=None, failed_stage=None)
+            logger.info(f"✅ Trabajo {job['id']} completado en {sum(context.get('timings', {}).values()):.1f}s")
+        except Exception as e:
+            status = JOB_PARTIAL if PARTIAL_AFTER_STAGE in completed else JOB_FAILED
+            logger.error(f"❌ Trabajo {job['id']} falló en etapa '{current}' ({status}): {type(e).__name__} - {e}")
+            self.queue.update(
+                job["id"], status=status, stage=None, failed_stage=current,
+                result=context, error=f"{type(e).__name__}: {e}"
+            )
+
+# ============================================================================
+# PIPELINE DE TRANSCRIPCIÓN
+# ============================================================================
+
+def build_transcription_stages(queue: JobQueue, transcriber, opportunities_manager) -> List[Stage]:
+    """Etapas transcribe → save → analyze usando los componentes de la app"""
+    import database as db_utils
+
+    def transcribe(job: Dict, context: Dict) -> None:
+        # Desde la caché de audios (la descarga de Storage si fue expulsado o el contenedor es nuevo)
+        from audio_cache import get_audio_cache
+        cached_path = get_audio_cache().get_path(job["filename"])
+        audio_path = str(cached_path) if cached_path else job["audio_path"]
+
+        def on_progress(fraction: float) -> None:
+            queue.update(job["id"], progress=round(fraction * STAGE_PROGRESS["transcribe"], 3))
+
+        result = transcriber.transcript_audio(
+            audio_path,
+            use_cache=not job["options"].get("force", False),
+            progress_callback=on_progress
+        )
+        context["transcription"] = result.text
+        context["cached"] = result.cached
+
+    def save(job: Dict, context: Dict) -> None:
+        context["transcription_id"] = db_utils.save_transcription(
+            recording_filename=job["filename"],
+            content=context["transcription"],
+            language=job["options"].get("language", "es")
+        )
+        if not context["transcription_id"]:
+            # save_transcription no lanza (db_operation): None/False es un fallo
+            raise RuntimeError("No se pudo guardar la transcripción en Supabase")
+
+    def analyze(job: Dict, context: Dict) -> None:
+        num_opportunities, saved = opportunities_manager.analyze_opportunities_with_ai(
+            transcription=context["transcription"],
+            audio_filename=job["filename"],
+            recording_id=job["options"].get("recording_id"),
+            raise_errors=True
+        )
+        context["num_opportunities"] = num_opportunities
+        context["saved_opportunities"] = len(saved) if saved else 0
+
+    return [("transcribe", transcribe), ("save", save), ("analyze", analyze)]
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """Cola única por proceso (compartida por todas las sesiones)"""
+    return JobQueue()
+
+
+@st.cache_resource
+def start_job_workers(_transcriber, _opportunities_manager) -> JobWorkerPool:
+    """Arranca una sola vez el pool de workers del proceso"""
+    queue = get_job_queue()
+    pool = JobWorkerPool(queue, build_transcription_stages(queue, _transcriber, _opportunities_manager))
+    pool.start()
+    return pool
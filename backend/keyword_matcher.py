@@ -0,0 +1,140 @@
+"""keyword_matcher.py - Búsqueda multi-patrón de palabras clave (Aho–Corasick)
+
+El autómata se construye una vez por conjunto de palabras clave y recorre el
+texto en una sola pasada, sin distinguir mayúsculas ni acentos y respetando
+el inicio de palabra. Devuelve posiciones (offsets) sobre el texto original;
+quien lo necesite construye el contexto a partir de ellas.
+"""
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class KeywordMatch(NamedTuple):
+    keyword: str  # Palabra clave tal como se pasó al matcher
+    start: int    # Offset de inicio en el texto original
+    end: int      # Offset de fin (exclusivo) en el texto original
+
+
+def _fold_char(char: str) -> str:
+    return "".join(piece for piece in unicodedata.normalize("NFD", char.casefold())
+                   if not unicodedata.combining(piece))
+
+
+def normalize_with_offsets(text: str) -> Tuple[str, Optional[List[int]]]:
+    """Minúsculas sin acentos + mapa posición normalizada → posición original
+
+    El plegado se calcula una vez por carácter distinto. Si todos pliegan a un
+    único carácter (lo normal en castellano) las posiciones coinciden y el mapa
+    es None; si no (p. ej. "ß" → "ss") se devuelve el mapa explícito.
+    """
+    folds = {char: _fold_char(char) for char in set(text)}
+    if all(len(fold) == 1 for fold in folds.values()):
+        return text.translate({ord(char): fold for char, fold in folds.items()}), None
+    chars, offsets = [], []
+    for i, char in enumerate(text):
+        for piece in folds[char]:
+            chars.append(piece)
+            offsets.append(i)
+    offsets.append(len(text))
+    return "".join(chars), offsets
+
+
+def normalize(text: str) -> str:
+    return normalize_with_offsets(text)[0]
+
+
+class KeywordMatcher:
+    """Autómata Aho–Corasick sobre palabras clave normalizadas"""
+
+    def __init__(self, keywords: Sequence[str], whole_words: bool = False):
+        """
+        Args:
+            keywords: Palabras clave (se ignoran vacías y duplicadas tras normalizar)
+            whole_words: Si es False basta con que la coincidencia empiece al inicio
+                         de una palabra ("presupuesto" encuentra "presupuestos");
+                         si es True también debe terminar en fin de palabra.
+        """
+        self.whole_words = whole_words
+        self.keywords: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, int]]] = [[]]  # (id de keyword, longitud normalizada)
+
+        seen = set()
+        for keyword in keywords:
+            pattern = normalize(keyword.strip())
+            if not pattern or pattern in seen:
+                continue
+            seen.add(pattern)
+            self._add(pattern, len(self.keywords))
+            self.keywords.append(keyword)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, keyword_id: int) -> None:
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append((keyword_id, len(pattern)))
+
+    def _build_failure_links(self) -> None:
+        """Enlaces de fallo (BFS) y tabla de transiciones completa por estado
+
+        Con la tabla completa el recorrido no necesita seguir enlaces de fallo:
+        cada carácter es una sola consulta a diccionario.
+        """
+        order, queue = [], deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+        self._delta: List[Dict[str, int]] = [{} for _ in self._goto]
+        self._delta[0] = dict(self._goto[0])
+        for state in order:  # BFS: el estado de fallo ya está completo
+            self._delta[state] = {**self._delta[self._fail[state]], **self._goto[state]}
+
+    def find(self, text: str) -> List[KeywordMatch]:
+        """Todas las coincidencias, ordenadas por posición"""
+        if not self.keywords or not text:
+            return []
+        normalized, offsets = normalize_with_offsets(text)
+        delta, output, size = self._delta, self._output, len(normalized)
+        matches, state = [], 0
+        for i, char in enumerate(normalized):
+            state = delta[state].get(char, 0)
+            if not output[state]:
+                continue
+            end = i + 1
+            for keyword_id, length in output[state]:
+                start = end - length
+                if start > 0 and normalized[start - 1].isalnum():
+                    continue
+                if self.whole_words and end < size and normalized[end].isalnum():
+                    continue
+                if offsets is None:
+                    matches.append(KeywordMatch(self.keywords[keyword_id], start, end))
+                else:
+                    matches.append(KeywordMatch(self.keywords[keyword_id], offsets[start], offsets[end]))
+        matches.sort(key=lambda m: (m.start, m.end))
+        return matches
+
+
+@lru_cache(maxsize=32)
+def get_matcher(keywords: Tuple[str, ...], whole_words: bool = False) -> KeywordMatcher:
+    """Autómata cacheado por conjunto de palabras clave"""
+    return KeywordMatcher(keywords, whole_words=whole_words)
@@ -0,0 +1,316 @@
+"""llm_gateway.py - Pasarela única hacia Gemini
+
+Transcriber, Model y OpportunitiesManager llaman a Gemini a través de esta
+pasarela, que aplica en todo el proceso:
+
+- Semáforo global de llamadas simultáneas
+- Limitador token bucket por modelo
+- Reintentos con backoff exponencial y jitter ante 429 / 5xx / timeouts
+- Timeout por llamada y cancelación (Future.cancel() o cerrar el stream). Un
+  hilo que sigue corriendo tras el timeout conserva su hueco del semáforo
+  hasta terminar, así que nunca hay más de LLM_MAX_CONCURRENCY llamadas reales
+- Métricas: cola de espera, llamadas en curso y percentiles de latencia
+
+Internamente usa un bucle asyncio en un hilo propio: los hilos de Streamlit
+y de los workers usan la API síncrona (`generate`, `stream`, `call`) y el
+código async puede usar `agenerate` / `acall` directamente en ese bucle.
+"""
+import asyncio
+import functools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+import google.generativeai as genai
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from logger import get_logger
+from config import (
+    GEMINI_API_KEY, LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_BURST,
+    LLM_MAX_RETRIES, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS,
+    LLM_TIMEOUT_SECONDS, LLM_LATENCY_WINDOW
+)
+
+logger = get_logger(__name__)
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_EXCEPTIONS = (
+        google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+        google_exceptions.InternalServerError, google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable, google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+    )
+except ImportError:
+    RETRYABLE_EXCEPTIONS = ()
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """429, 5xx, timeouts y errores de conexión se reintentan; el resto no"""
+    if isinstance(error, RETRYABLE_EXCEPTIONS + (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt: int) -> float:
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class TokenBucket:
+    """`rate_per_minute` peticiones por minuto con ráfagas de hasta `capacity`
+
+    Solo se usa desde el bucle de la pasarela (no necesita lock).
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMGateway:
+    """Concurrencia, rate limit, reintentos, timeouts y métricas de las llamadas a Gemini"""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        burst: int = LLM_BURST,
+        max_retries: int = LLM_MAX_RETRIES,
+        timeout: float = LLM_TIMEOUT_SECONDS
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency + 4, thread_name_prefix="llm-call")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._models: Dict[str, Any] = {}
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+        self._stats_lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._counters = {"calls": 0, "retries": 0, "errors": 0, "timeouts": 0}
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    # ------------------------------------------------------------------
+    # Permisos (token bucket + semáforo)
+    # ------------------------------------------------------------------
+
+    async def _acquire(self, bucket: str) -> None:
+        with self._stats_lock:
+            self._waiting += 1
+        try:
+            if bucket not in self._buckets:
+                self._buckets[bucket] = TokenBucket(self.requests_per_minute, self.burst)
+            await self._buckets[bucket].acquire()
+            await self._semaphore.acquire()
+        finally:
+            with self._stats_lock:
+                self._waiting -= 1
+        with self._stats_lock:
+            self._in_flight += 1
+
+    def _release(self) -> None:
+        with self._stats_lock:
+            self._in_flight -= 1
+        self._loop.call_soon_threadsafe(self._semaphore.release)
+
+    def _record(self, bucket: str, started: float) -> None:
+        with self._stats_lock:
+            self._counters["calls"] += 1
+            window = self._latencies.setdefault(bucket, deque(maxlen=LLM_LATENCY_WINDOW))
+            window.append((time.monotonic() - started) * 1000)
+
+    def _count(self, counter: str) -> None:
+        with self._stats_lock:
+            self._counters[counter] += 1
+
+    # ------------------------------------------------------------------
+    # API async
+    # ------------------------------------------------------------------
+
+    async def acall(self, fn: Callable, *args, bucket: str = "default", timeout: Optional[float] = None, **kwargs) -> Any:
+        """Ejecuta una función bloqueante de Gemini con todas las políticas de la pasarela"""
+        timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(bucket)
+            started = time.monotonic()
+            try:
+                call = functools.partial(fn, *args, **kwargs)
+                running = self._loop.run_in_executor(self._executor, call)
+            except BaseException:
+                self._release()
+                raise
+            # El hueco se libera cuando el hilo termina de verdad, no al expirar el
+            # timeout (p. ej. upload_file no admite timeout y puede seguir subiendo)
+            running.add_done_callback(lambda _: self._release())
+            try:
+                result = await asyncio.wait_for(asyncio.shield(running), timeout)
+                self._record(bucket, started)
+                return result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+                if isinstance(e, asyncio.TimeoutError):
+                    self._count("timeouts")
+                    error = TimeoutError(f"{bucket}: sin respuesta en {timeout:g}s")
+                if attempt >= self.max_retries or not is_retryable(error):
+                    self._count("errors")
+                    if error is e:
+                        raise
+                    raise error from e
+
+            delay = backoff_delay(attempt)
+            self._count("retries")
+            logger.warning(f"⚠️  {bucket}: {type(error).__name__}, reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def agenerate(self, model_name: str, contents: Any, generation_config=None, timeout: Optional[float] = None, cached_content=None) -> Any:
+        """generate_content del modelo indicado (o del ligado a `cached_content`)"""
+        timeout = timeout or self.timeout
+        kwargs = {"request_options": {"timeout": timeout}}
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+        model = self.model(model_name, cached_content)
+        return await self.acall(model.generate_content, contents, bucket=model_name, timeout=timeout, **kwargs)
+
+    # ------------------------------------------------------------------
+    # API síncrona (hilos de Streamlit y workers)
+    # ------------------------------------------------------------------
+
+    def model(self, model_name: str, cached_content=None):
+        """GenerativeModel reutilizado; con `cached_content`, el ligado a esa caché de contexto"""
+        key = cached_content.name if cached_content is not None else model_name
+        with self._stats_lock:
+            if key not in self._models:
+                if cached_content is not None:
+                    self._models[key] = genai.GenerativeModel.from_cached_content(cached_content)
+                else:
+                    self._models[key] = genai.GenerativeModel(model_name)
+            return self._models[key]
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Como `call` pero devuelve un Future: `future.cancel()` aborta esperas y reintentos"""
+        return asyncio.run_coroutine_threadsafe(self.acall(fn, *args, **kwargs), self._loop)
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        return self.submit(fn, *args, **kwargs).result()
+
+    def generate(self, model_name: str, contents: Any, generation_config=None, timeout: Optional[float] = None, cached_content=None) -> Any:
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate(model_name, contents, generation_config=generation_config, timeout=timeout, cached_content=cached_content),
+            self._loop
+        )
+        return future.result()
+
+    def stream(self, model_name: str, contents: Any, generation_config=None, timeout: Optional[float] = None, cached_content=None) -> Iterator[str]:
+        """Texto de la respuesta en fragmentos según llega
+
+        Solo se reintenta antes del primer fragmento (después ya se ha entregado
+        texto). El permiso se mantiene hasta agotar o cerrar el iterador, así
+        que abandonar el stream libera el hueco.
+        """
+        timeout = timeout or self.timeout
+        kwargs = {"stream": True, "request_options": {"timeout": timeout}}
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+
+        for attempt in range(self.max_retries + 1):
+            asyncio.run_coroutine_threadsafe(self._acquire(model_name), self._loop).result()
+            started = time.monotonic()
+            try:
+                chunks = iter(self.model(model_name, cached_content).generate_content(contents, **kwargs))
+                first = next(chunks, None)
+            except Exception as e:
+                self._release()
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._count("errors")
+                    raise
+                delay = backoff_delay(attempt)
+                self._count("retries")
+                logger.warning(f"⚠️  {model_name}: {type(e).__name__}, reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            try:
+                for chunk in ([first] if first is not None else []):
+                    text = self._chunk_text(chunk)
+                    if text:
+                        yield text
+                for chunk in chunks:
+                    text = self._chunk_text(chunk)
+                    if text:
+                        yield text
+                self._record(model_name, started)
+            finally:
+                self._release()
+            return
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        try:
+            return chunk.text
+        except ValueError:
+            return ""  # Fragmento sin partes de texto (p. ej. el de cierre)
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _percentiles(values) -> Dict[str, float]:
+        ordered = sorted(values)
+        if not ordered:
+            return {"latency_ms_p50": 0.0, "latency_ms_p95": 0.0, "latency_ms_p99": 0.0}
+        pick = lambda p: round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+        return {"latency_ms_p50": pick(0.50), "latency_ms_p95": pick(0.95), "latency_ms_p99": pick(0.99)}
+
+    def stats(self) -> Dict:
+        """Cola de espera, llamadas en curso, contadores y percentiles (global y por modelo)"""
+        with self._stats_lock:
+            windows = {name: list(values) for name, values in self._latencies.items()}
+            stats = {"queue_depth": self._waiting, "in_flight": self._in_flight, **self._counters}
+        stats.update(self._percentiles(v for values in windows.values() for v in values))
+        stats["models"] = {name: self._percentiles(values) for name, values in windows.items()}
+        return stats
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Pasarela única por proceso (configura la API key de Gemini una sola vez)"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            genai.configure(api_key=GEMINI_API_KEY)
+            _gateway = LLMGateway()
+            logger.info("✓ LLM gateway initialized")
+        return _gateway
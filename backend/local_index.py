@@ -0,0 +1,390 @@
+"""local_index.py - Índice local (SQLite FTS5) de grabaciones y transcripciones
+
+Réplica en data/ de los metadatos de `recordings` y de la última
+transcripción de cada grabación, con un índice FTS5 sobre el contenido:
+
+Solo se lee cuando Supabase no responde (modo sin conexión): listado,
+estado de transcripción, lectura de transcripciones y búsqueda en nombre y
+contenido siguen funcionando. Con conexión manda siempre Supabase (ranking y
+fragmentos de la función SQL search_transcriptions), así que una réplica
+atrasada nunca sustituye a una respuesta de la BD.
+
+Se actualiza de forma incremental: cada save_transcription escribe aquí, el
+catálogo de grabaciones vuelca sus cargas y deltas, y una sincronización en
+segundo plano trae las transcripciones creadas o editadas en otras instancias
+(keyset (updated_at, id) > último cursor visto). Cada
+LOCAL_INDEX_RECONCILE_SECONDS se comparan los ids con Supabase para quitar
+las transcripciones borradas fuera de esta instancia.
+"""
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import streamlit as st
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import (
+    LOCAL_INDEX_DB_PATH, LOCAL_INDEX_SYNC_SECONDS, LOCAL_INDEX_SYNC_PAGE_SIZE, LOCAL_INDEX_RECONCILE_SECONDS
+)
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+_QUERY_PART = re.compile(r'(-?)"([^"]*)"|(-?)(\S+)')
+_QUERY_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str) -> str:
+    """Búsqueda estilo websearch_to_tsquery → consulta FTS5 segura
+
+    Admite "frases exactas", -exclusiones y or, como la búsqueda de Supabase.
+    Las palabras sueltas se buscan como prefijo ("presupuesto" encuentra
+    "presupuestos"), a falta del stemming en español de PostgreSQL.
+    """
+    include, exclude, pending_or = [], [], False
+    for match in _QUERY_PART.finditer(text):
+        negated = bool(match.group(1) or match.group(3))
+        quoted = match.group(2) is not None
+        raw = match.group(2) if quoted else match.group(4)
+        if not quoted and not negated and raw.lower() == "or":
+            pending_or = True
+            continue
+        terms = _QUERY_TERM.findall(raw)
+        if not terms:
+            continue
+        phrase = f'"{" ".join(terms)}"' + ("" if quoted else "*")
+        if negated:
+            exclude.append(phrase)
+        elif pending_or and include:
+            include[-1] = f"({include[-1]} OR {phrase})"
+        else:
+            include.append(phrase)
+        pending_or = False
+    if not include:
+        return ""  # FTS5 no admite una consulta solo con exclusiones
+    return " ".join(include) + "".join(f" NOT {phrase}" for phrase in exclude)
+
+
+class LocalTranscriptIndex:
+    """Réplica local de recordings + última transcripción por grabación, con FTS5"""
+
+    def __init__(self, db_path: Path = LOCAL_INDEX_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._init_schema()
+
+    @contextmanager
+    def _connect(self):
+        """Conexión corta por operación (commit al salir del bloque)"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_schema(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    created_at TEXT,
+                    updated_at TEXT,
+                    file_size_mb REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_recordings_filename ON recordings(filename);
+
+                -- Solo la última transcripción de cada grabación (la que usa la app)
+                CREATE TABLE IF NOT EXISTS transcriptions (
+                    recording_id TEXT PRIMARY KEY,
+                    id TEXT,
+                    filename TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    language TEXT,
+                    created_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_transcriptions_filename ON transcriptions(filename);
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS transcriptions_fts USING fts5(
+                    filename, content,
+                    content='transcriptions', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS transcriptions_ai AFTER INSERT ON transcriptions BEGIN
+                    INSERT INTO transcriptions_fts(rowid, filename, content) VALUES (new.rowid, new.filename, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS transcriptions_ad AFTER DELETE ON transcriptions BEGIN
+                    INSERT INTO transcriptions_fts(transcriptions_fts, rowid, filename, content)
+                    VALUES ('delete', old.rowid, old.filename, old.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS transcriptions_au AFTER UPDATE ON transcriptions BEGIN
+                    INSERT INTO transcriptions_fts(transcriptions_fts, rowid, filename, content)
+                    VALUES ('delete', old.rowid, old.filename, old.content);
+                    INSERT INTO transcriptions_fts(rowid, filename, content) VALUES (new.rowid, new.filename, new.content);
+                END;
+
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+    # ------------------------------------------------------------------
+    # Escritura (incremental)
+    # ------------------------------------------------------------------
+
+    def upsert_recordings(self, rows: List[Dict], replace: bool = False) -> None:
+        """Vuelca filas de recordings; con replace=True (carga completa) borra las que ya no existen"""
+        rows = [{
+            "id": r["id"], "filename": r.get("filename", ""), "created_at": r.get("created_at"),
+            "updated_at": r.get("updated_at") or r.get("created_at"), "file_size_mb": r.get("file_size_mb"),
+        } for r in rows if r.get("id")]
+        with self._lock, self._connect() as conn:
+            if replace:
+                conn.execute("CREATE TEMP TABLE live_ids (id TEXT PRIMARY KEY)")
+                conn.executemany("INSERT OR IGNORE INTO live_ids VALUES (?)", [(r["id"],) for r in rows])
+                conn.execute("DELETE FROM transcriptions WHERE recording_id NOT IN (SELECT id FROM live_ids)")
+                conn.execute("DELETE FROM recordings WHERE id NOT IN (SELECT id FROM live_ids)")
+            conn.executemany(
+                """INSERT INTO recordings (id, filename, created_at, updated_at, file_size_mb)
+                   VALUES (:id, :filename, :created_at, :updated_at, :file_size_mb)
+                   ON CONFLICT(id) DO UPDATE SET filename = excluded.filename,
+                       created_at = excluded.created_at, updated_at = excluded.updated_at,
+                       file_size_mb = COALESCE(excluded.file_size_mb, recordings.file_size_mb)""",
+                rows
+            )
+            # La transcripción se indexa también por nombre: seguir los renombrados
+            conn.execute(
+                """UPDATE transcriptions SET filename = (SELECT filename FROM recordings r WHERE r.id = recording_id)
+                   WHERE filename != (SELECT filename FROM recordings r WHERE r.id = recording_id)"""
+            )
+
+    def upsert_transcription(
+        self, recording_id: str, filename: str, content: str, transcription_id: Optional[str] = None,
+        language: str = "es", created_at: Optional[str] = None
+    ) -> None:
+        """Guarda la transcripción si es más reciente que la que ya hay para la grabación"""
+        created_at = created_at or datetime.now().isoformat()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """INSERT INTO transcriptions (recording_id, id, filename, content, language, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(recording_id) DO UPDATE SET id = excluded.id, filename = excluded.filename,
+                       content = excluded.content, language = excluded.language, created_at = excluded.created_at
+                   WHERE excluded.created_at >= COALESCE(transcriptions.created_at, '')""",
+                (recording_id, transcription_id, filename, content, language, created_at)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO recordings (id, filename, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (recording_id, filename, created_at, created_at)
+            )
+
+    def rename(self, old_filename: str, new_filename: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE recordings SET filename = ? WHERE filename = ?", (new_filename, old_filename))
+            conn.execute("UPDATE transcriptions SET filename = ? WHERE filename = ?", (new_filename, old_filename))
+
+    def remove_recording(self, recording_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM transcriptions WHERE recording_id = ?", (recording_id,))
+            conn.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+
+    def remove_transcription(self, transcription_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM transcriptions WHERE id = ?", (transcription_id,))
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def get_transcription(self, filename: str) -> Optional[Dict]:
+        """Última transcripción de la grabación, con las columnas de la tabla de Supabase"""
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT id, recording_id, content, language, created_at, created_at AS updated_at
+                   FROM transcriptions WHERE filename = ? ORDER BY created_at DESC LIMIT 1""",
+                (filename,)
+            ).fetchone()
+        if row:
+            self.hits += 1
+            return dict(row)
+        self.misses += 1
+        return None
+
+    def recordings(self) -> List[Dict]:
+        """Filas de recordings por recencia (catálogo sin conexión)"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, filename, created_at, updated_at, file_size_mb FROM recordings ORDER BY created_at DESC"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def transcription_status(self) -> Dict[str, bool]:
+        """{filename: transcrito}, como database.get_transcription_status_index"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                """SELECT r.filename, t.recording_id IS NOT NULL AS transcribed
+                   FROM recordings r LEFT JOIN transcriptions t ON t.recording_id = r.id"""
+            ).fetchall()
+        status: Dict[str, bool] = {}
+        for row in rows:
+            status[row["filename"]] = status.get(row["filename"], False) or bool(row["transcribed"])
+        return status
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Búsqueda en nombre y contenido, mismo formato que database.search_transcriptions"""
+        match = fts_query(query)
+        if not match:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                """SELECT t.recording_id, t.filename, t.id AS transcription_id, t.created_at,
+                          -bm25(transcriptions_fts, 2.0, 1.0) AS rank,
+                          snippet(transcriptions_fts, 1, '**', '**', ' … ', 16) AS snippet
+                   FROM transcriptions_fts
+                   JOIN transcriptions t ON t.rowid = transcriptions_fts.rowid
+                   WHERE transcriptions_fts MATCH ?
+                   ORDER BY bm25(transcriptions_fts, 2.0, 1.0)
+                   LIMIT ? OFFSET ?""",
+                (match, limit, offset)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    # ------------------------------------------------------------------
+    # Sincronización de transcripciones con Supabase
+    # ------------------------------------------------------------------
+
+    def _get_state(self, name: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_state(self, name: str, value: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, value))
+
+    def sync_due(self) -> bool:
+        return time.monotonic() - self._synced_at >= LOCAL_INDEX_SYNC_SECONDS and not self._sync_lock.locked()
+
+    def sync(self, db) -> int:
+        """Trae las transcripciones creadas o editadas desde la última sincronización
+
+        Paginado por keyset (updated_at, id) con el reloj del servidor (trigger
+        en database.sql), así que tras la primera carga solo viajan los cambios
+        y no se pierden filas con el mismo updated_at. Devuelve las filas
+        incorporadas.
+        """
+        import database as db_utils
+
+        if not db or not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._synced_at = time.monotonic()
+            if self._reconcile_due():
+                self._reconcile(db)
+            stamp, row_id = self._get_state("transcriptions_updated_at"), self._get_state("transcriptions_id")
+            cursor = (stamp, row_id) if stamp and row_id else None
+            added = 0
+            while True:
+                query = db.table("transcriptions").select(
+                    "id, recording_id, content, language, created_at, updated_at, recordings(filename)"
+                )
+                rows = db_utils.keyset_page(
+                    query, cursor, limit=LOCAL_INDEX_SYNC_PAGE_SIZE, desc=False, column="updated_at"
+                ).execute().data or []
+                for row in rows:
+                    filename = (row.get("recordings") or {}).get("filename")
+                    if filename and row.get("content"):
+                        self.upsert_transcription(
+                            row["recording_id"], filename, row["content"], row.get("id"),
+                            row.get("language") or "es", row.get("created_at")
+                        )
+                added += len(rows)
+                if rows:
+                    cursor = (rows[-1]["updated_at"], rows[-1]["id"])
+                    self._set_state("transcriptions_updated_at", cursor[0])
+                    self._set_state("transcriptions_id", cursor[1])
+                if not db_utils.next_cursor(rows, LOCAL_INDEX_SYNC_PAGE_SIZE, column="updated_at"):
+                    break
+            if added:
+                logger.info(f"✓ Índice local sincronizado: {added} transcripción(es) nuevas o editadas")
+            return added
+        except Exception as e:
+            logger.warning(f"⚠️  Índice local: sincronización incompleta - {type(e).__name__}: {str(e)[:100]}")
+            return 0
+        finally:
+            self._sync_lock.release()
+
+    def _reconcile_due(self) -> bool:
+        last = self._get_state("transcriptions_reconciled_at")
+        return not last or time.time() - float(last) >= LOCAL_INDEX_RECONCILE_SECONDS
+
+    def _reconcile(self, db) -> int:
+        """Quita las transcripciones que ya no existen en Supabase (borradas en otra instancia)
+
+        Solo viajan los ids, por keyset. Si se quita alguna, se reinicia el
+        cursor: la transcripción anterior de esa grabación (si la hay) vuelve
+        en la siguiente pasada de sync.
+        """
+        import database as db_utils
+
+        live, cursor = set(), None
+        while True:
+            query = db.table("transcriptions").select("id, created_at")
+            rows = db_utils.keyset_page(query, cursor, limit=LOCAL_INDEX_SYNC_PAGE_SIZE).execute().data or []
+            live.update(r["id"] for r in rows)
+            cursor = db_utils.next_cursor(rows, LOCAL_INDEX_SYNC_PAGE_SIZE)
+            if not cursor:
+                break
+        with self._lock, self._connect() as conn:
+            local_ids = [r["id"] for r in conn.execute("SELECT id FROM transcriptions WHERE id IS NOT NULL")]
+            stale = [(i,) for i in local_ids if i not in live]
+            conn.executemany("DELETE FROM transcriptions WHERE id = ?", stale)
+            if stale:
+                conn.execute(
+                    "DELETE FROM sync_state WHERE name IN ('transcriptions_updated_at', 'transcriptions_id')"
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (name, value) VALUES ('transcriptions_reconciled_at', ?)",
+                (str(time.time()),)
+            )
+        if stale:
+            logger.info(f"🗑️  Índice local: {len(stale)} transcripción(es) borradas en Supabase")
+        return len(stale)
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            recordings = conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+            transcriptions = conn.execute("SELECT COUNT(*) FROM transcriptions").fetchone()[0]
+        return {"recordings": recordings, "transcriptions": transcriptions, "hits": self.hits, "misses": self.misses}
+
+
+@st.cache_resource
+def get_local_index() -> LocalTranscriptIndex:
+    """Índice único por proceso"""
+    return LocalTranscriptIndex()
+
+
+def sync_local_index_in_background() -> None:
+    """Lanza la sincronización en un hilo si toca (no bloquea el rerun)"""
+    import database as db_utils
+
+    index = get_local_index()
+    if not index.sync_due():
+        return
+    threading.Thread(
+        target=lambda: index.sync(db_utils.init_supabase()), name="local-index-sync", daemon=True
+    ).start()
@@ -0,0 +1,181 @@
+"""opportunity_stats.py - Panel de oportunidades sobre agregados de Supabase
+
+Nunca descarga filas de `opportunities`: lee solo las vistas y funciones
+agregadas de database.sql (v_opportunities_breakdown, v_pending_opportunities,
+opportunities_weekly) y las guarda en memoria, compartidas por todas las
+sesiones. El refresco es incremental:
+
+- Cada OPPORTUNITY_DASHBOARD_REFRESH_SECONDS se consulta v_opportunities_watermark
+  (una fila); si no ha cambiado no se vuelve a pedir nada más
+- Si el único cambio son tickets nuevos, la tendencia semanal solo se pide
+  desde la última semana cacheada (crear tickets no toca semanas anteriores)
+- Si se ha editado o borrado algún ticket anterior (puede cambiar de tema o
+  desaparecer de una semana antigua), se recarga toda la ventana
+- Una recarga completa periódica cubre cualquier otro caso
+"""
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import streamlit as st
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from logger import get_logger
+from config import (
+    OPPORTUNITY_DASHBOARD_REFRESH_SECONDS, OPPORTUNITY_DASHBOARD_FULL_RELOAD_SECONDS,
+    OPPORTUNITY_DASHBOARD_WEEKS, OPPORTUNITY_DASHBOARD_PENDING_LIMIT
+)
+import database as db_utils
+
+logger = get_logger(__name__)
+
+
+class OpportunityStats:
+    """Agregados de oportunidades en memoria: tema/estado/prioridad, pendientes y tendencia semanal"""
+
+    def __init__(
+        self,
+        refresh_interval: float = OPPORTUNITY_DASHBOARD_REFRESH_SECONDS,
+        full_reload_interval: float = OPPORTUNITY_DASHBOARD_FULL_RELOAD_SECONDS,
+        weeks: int = OPPORTUNITY_DASHBOARD_WEEKS
+    ):
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.weeks = weeks
+        self._lock = threading.RLock()
+        self._breakdown: List[Dict] = []
+        self._pending: List[Dict] = []
+        self._weekly: Dict[Tuple[str, str], int] = {}  # (semana, tema) → oportunidades
+        self._watermark: Optional[Dict] = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self.queries = 0
+
+    # ------------------------------------------------------------------
+    # Refresco
+    # ------------------------------------------------------------------
+
+    def _first_week(self) -> str:
+        """Lunes de la semana más antigua mostrada"""
+        today = date.today()
+        monday = today - timedelta(days=today.weekday())
+        return (monday - timedelta(weeks=self.weeks - 1)).isoformat()
+
+    def _only_new_tickets(self, db, old: Optional[Dict], new: Dict) -> bool:
+        """True si entre las dos marcas solo se han creado tickets (ni ediciones ni borrados)
+
+        Dos conteos head=True (sin filas): los creados después de la marca
+        anterior deben explicar todo el aumento del total, y ningún ticket
+        anterior puede tener un updated_at posterior.
+        """
+        if old is None:
+            return False
+        old_total, new_total = int(old.get("total") or 0), int(new.get("total") or 0)
+        if not old_total:
+            return True  # No había tickets que editar ni borrar
+        if new_total <= old_total or not old.get("last_created_at") or not old.get("last_updated_at"):
+            return False
+        self.queries += 2
+        created = (
+            db.table("opportunities").select("id", count="exact", head=True)
+            .gt("created_at", old["last_created_at"]).execute().count or 0
+        )
+        edited = (
+            db.table("opportunities").select("id", count="exact", head=True)
+            .lte("created_at", old["last_created_at"]).gt("updated_at", old["last_updated_at"])
+            .execute().count or 0
+        )
+        return created == new_total - old_total and not edited
+
+    def refresh(self, force: bool = False) -> bool:
+        """Trae los agregados si las oportunidades han cambiado; False si Supabase no responde"""
+        now = time.monotonic()
+        if not force and self._checked_at and now - self._checked_at < self.refresh_interval:
+            return True
+        db = db_utils.init_supabase()
+        if not db:
+            return False
+        try:
+            self.queries += 1
+            rows = db.table("v_opportunities_watermark").select("total, last_created_at, last_updated_at").execute().data
+            watermark = rows[0] if rows else {}
+            full = force or not self._loaded_at or now - self._loaded_at > self.full_reload_interval
+            if watermark == self._watermark and not full:
+                self._checked_at = now
+                return True
+            if not full and not self._only_new_tickets(db, self._watermark, watermark):
+                full = True
+
+            self.queries += 2
+            breakdown = db.table("v_opportunities_breakdown").select("tema, status, priority, count").execute().data or []
+            pending = (
+                db.table("v_pending_opportunities").select("filename, total_pending, priorities")
+                .order("total_pending", desc=True).limit(OPPORTUNITY_DASHBOARD_PENDING_LIMIT)
+                .execute().data or []
+            )
+
+            # Tendencia: desde la última semana cacheada (incluida, puede estar a medias)
+            first_week = self._first_week()
+            with self._lock:
+                cached_weeks = [week for week, _ in self._weekly if week >= first_week]
+            since = first_week if full or not cached_weeks else max(cached_weeks)
+            self.queries += 1
+            weekly = db.rpc("opportunities_weekly", {"since": since}).execute().data or []
+
+            with self._lock:
+                self._breakdown, self._pending = breakdown, pending
+                self._weekly = {
+                    key: count for key, count in self._weekly.items()
+                    if first_week <= key[0] < since
+                }
+                for row in weekly:
+                    self._weekly[(str(row["week"])[:10], row["tema"])] = int(row["count"])
+                self._watermark = watermark
+                self._checked_at = now
+                if full:
+                    self._loaded_at = now
+            logger.info(f"✓ Panel de oportunidades actualizado ({'completo' if full else f'desde {since}'})")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️  Panel de oportunidades: refresco fallido - {type(e).__name__}: {str(e)[:100]}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Consultas en memoria
+    # ------------------------------------------------------------------
+
+    def _totals(self, field: str) -> Dict[str, int]:
+        totals: Dict[str, int] = {}
+        for row in self._breakdown:
+            key = row.get(field) or "—"
+            totals[key] = totals.get(key, 0) + int(row["count"])
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    def snapshot(self) -> Dict:
+        """Totales por estado, prioridad y tema, pendientes por grabación y tendencia {tema: {semana: n}}"""
+        first = date.fromisoformat(self._first_week())
+        weeks = [(first + timedelta(weeks=i)).isoformat() for i in range(self.weeks)]
+        with self._lock:
+            # Semanas sin oportunidades a 0 para que la tendencia no tenga huecos
+            trend: Dict[str, Dict[str, int]] = {}
+            for (week, tema), count in self._weekly.items():
+                if week < weeks[0]:
+                    continue
+                trend.setdefault(tema or "—", dict.fromkeys(weeks, 0))[week] = count
+            return {
+                "total": int(self._watermark.get("total") or 0) if self._watermark else 0,
+                "by_status": self._totals("status"),
+                "by_priority": self._totals("priority"),
+                "by_tema": self._totals("tema"),
+                "pending": list(self._pending),
+                "trend": trend,
+                "loaded": self._watermark is not None,
+            }
+
+
+@st.cache_resource
+def get_opportunity_stats() -> OpportunityStats:
+    """Panel único por proceso"""
+    return OpportunityStats()
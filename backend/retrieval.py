@@ -0,0 +1,233 @@
+"""retrieval.py - Recuperación de fragmentos de la transcripción para el chat
+
+En lugar de enviar la transcripción entera en cada pregunta, se trocea por
+turnos de palabra, se indexa con BM25 (y, opcionalmente, embeddings de
+Gemini calculados una vez por transcripción y guardados en disco) y al
+modelo solo le llegan los k fragmentos más relevantes más un resumen breve.
+"""
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+import google.generativeai as genai
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from logger import get_logger
+from config import (
+    RAG_CHUNK_TOKENS, RAG_TOP_K, RAG_SUMMARY_TERMS, RAG_EMBEDDINGS, RAG_EMBEDDING_MODEL,
+    RAG_EMBEDDINGS_DIR, RAG_EMBEDDING_WEIGHT
+)
+from helpers import chunk_speaker_turns, split_speaker_turns, estimate_tokens
+from keyword_matcher import normalize
+from llm_gateway import get_llm_gateway
+
+logger = get_logger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+EMBEDDING_BATCH = 100  # Máximo de textos por llamada a embed_content
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bien cada como con
+contra cual cuales cuando de del desde donde dos el ella ellas ello ellos en entre era eran
+es esa esas ese eso esos esta estaba estamos estan estar estas este esto estos estoy fue
+fueron ha habia han hasta hay la las le les lo los mas me mi mis mucho muy nada ni no nos
+nosotros o os otra otras otro otros para pero poco por porque que quien se sea ser si sido
+sin sobre su sus tambien te tengo tiene tienen todo todos tu tus un una unas uno unos vamos
+y ya yo eh bueno vale pues entonces osea
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Términos normalizados (sin acentos ni mayúsculas) y sin palabras vacías"""
+    return [t for t in _TOKEN.findall(normalize(text)) if len(t) > 1 and t not in STOPWORDS]
+
+
+def transcript_hash(transcription: str) -> str:
+    return hashlib.sha256(transcription.encode("utf-8")).hexdigest()[:24]
+
+
+class RetrievedContext(NamedTuple):
+    text: str           # Resumen + fragmentos seleccionados (lo que se envía al modelo)
+    chunks: List[int]   # Índices de los fragmentos usados, en orden de aparición
+    tokens_full: int    # Tokens estimados de la transcripción completa
+    tokens_sent: int    # Tokens estimados del contexto enviado
+    source: str = "rag"  # rag | full | gemini_cache | memo
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_full - self.tokens_sent)
+
+
+# ============================================================================
+# ÍNDICE POR TRANSCRIPCIÓN
+# ============================================================================
+
+class TranscriptIndex:
+    """Fragmentos de una transcripción con índice BM25 y embeddings opcionales"""
+
+    def __init__(self, transcription: str, chunk_tokens: int = RAG_CHUNK_TOKENS):
+        self.hash = transcript_hash(transcription)
+        self.tokens_full = estimate_tokens(transcription)
+        self.turns = split_speaker_turns(transcription)
+        self.chunks = chunk_speaker_turns(transcription, chunk_tokens)
+
+        self._postings: Dict[str, List[tuple]] = {}
+        self._lengths: List[int] = []
+        totals: Counter = Counter()
+        for doc, chunk in enumerate(self.chunks):
+            terms = Counter(tokenize(chunk))
+            self._lengths.append(sum(terms.values()))
+            totals.update(terms)
+            for term, tf in terms.items():
+                self._postings.setdefault(term, []).append((doc, tf))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        count = len(self.chunks)
+        self._idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self._postings.items()
+        }
+        self._term_totals = totals
+        self._summary: Optional[str] = None
+        self._embeddings: Optional[List[List[float]]] = None
+        self._embeddings_failed = not RAG_EMBEDDINGS
+
+    # ------------------------------------------------------------------
+    # BM25
+    # ------------------------------------------------------------------
+
+    def bm25_scores(self, query: str) -> List[float]:
+        scores = [0.0] * len(self.chunks)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self._postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc] / (self._avg_length or 1))
+                scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    # ------------------------------------------------------------------
+    # Embeddings (opcionales, una vez por transcripción)
+    # ------------------------------------------------------------------
+
+    def _embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        gateway = get_llm_gateway()
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH):
+            result = gateway.call(
+                genai.embed_content, model=RAG_EMBEDDING_MODEL, content=texts[start:start + EMBEDDING_BATCH],
+                task_type=task_type, bucket=RAG_EMBEDDING_MODEL
+            )
+            vectors.extend(result["embedding"])
+        return vectors
+
+    def _chunk_embeddings(self) -> Optional[List[List[float]]]:
+        """Embeddings de los fragmentos: memoria → disco → Gemini (y se guardan)"""
+        if self._embeddings is not None or self._embeddings_failed:
+            return self._embeddings
+        cache_file = RAG_EMBEDDINGS_DIR / f"{self.hash}.json"
+        try:
+            if cache_file.exists():
+                cached = json.loads(cache_file.read_text(encoding="utf-8"))
+                if cached.get("model") == RAG_EMBEDDING_MODEL and len(cached.get("vectors", [])) == len(self.chunks):
+                    self._embeddings = cached["vectors"]
+                    return self._embeddings
+            self._embeddings = self._embed(self.chunks, "retrieval_document")
+            RAG_EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
+            cache_file.write_text(json.dumps({"model": RAG_EMBEDDING_MODEL, "vectors": self._embeddings}), encoding="utf-8")
+            logger.info(f"✓ Embeddings calculados: {len(self.chunks)} fragmentos")
+        except Exception as e:
+            logger.warning(f"⚠️  Embeddings no disponibles, se usa solo BM25 - {type(e).__name__}: {str(e)[:100]}")
+            self._embeddings, self._embeddings_failed = None, True
+        return self._embeddings
+
+    @staticmethod
+    def _cosine(a: List[float], b: List[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    def scores(self, query: str) -> List[float]:
+        """BM25 normalizado a [0, 1], combinado con similitud coseno si hay embeddings"""
+        bm25 = self.bm25_scores(query)
+        top = max(bm25, default=0.0)
+        scores = [s / top for s in bm25] if top else bm25
+        vectors = self._chunk_embeddings()
+        if vectors:
+            try:
+                query_vector = self._embed([query], "retrieval_query")[0]
+                scores = [
+                    (1 - RAG_EMBEDDING_WEIGHT) * s + RAG_EMBEDDING_WEIGHT * self._cosine(query_vector, v)
+                    for s, v in zip(scores, vectors)
+                ]
+            except Exception as e:
+                logger.warning(f"⚠️  Embedding de la pregunta fallido, se usa solo BM25 - {type(e).__name__}")
+        return scores
+
+    # ------------------------------------------------------------------
+    # Selección y resumen
+    # ------------------------------------------------------------------
+
+    def top_chunks(self, query: str, k: int = RAG_TOP_K) -> List[int]:
+        """Índices de los k fragmentos más relevantes, en orden de aparición
+
+        Si la pregunta no comparte ningún término con la transcripción
+        ("¿de qué se habló?"), se toma una muestra repartida por toda la reunión.
+        """
+        if len(self.chunks) <= k:
+            return list(range(len(self.chunks)))
+        scores = self.scores(query)
+        if not any(scores):
+            step = len(self.chunks) / k
+            return sorted({int(i * step) for i in range(k)})
+        ranked = sorted((i for i in range(len(self.chunks)) if scores[i] > 0), key=lambda i: scores[i], reverse=True)
+        return sorted(ranked[:k])
+
+    def summary(self) -> str:
+        """Resumen breve extractivo: participantes, intervenciones y términos frecuentes"""
+        if self._summary is None:
+            speakers = Counter(turn.speaker for turn in self.turns)
+            participants = ", ".join(f"{name} ({count})" for name, count in speakers.most_common())
+            names = {t for name in speakers for t in tokenize(name)}
+            weighted = {
+                term: tf * self._idf.get(term, 0.0) for term, tf in self._term_totals.items()
+                if term not in names and not term.isdigit()
+            }
+            terms = sorted(weighted, key=weighted.get, reverse=True)[:RAG_SUMMARY_TERMS]
+            self._summary = (
+                f"Participantes (intervenciones): {participants or 'desconocidos'}\n"
+                f"Turnos de palabra: {len(self.turns)}\n"
+                f"Términos más frecuentes: {', '.join(terms)}"
+            )
+        return self._summary
+
+
+@lru_cache(maxsize=8)
+def get_transcript_index(transcription: str) -> TranscriptIndex:
+    """Índice cacheado por transcripción (se construye una vez por reunión)"""
+    index = TranscriptIndex(transcription)
+    logger.info(f"✓ Índice de transcripción: {len(index.chunks)} fragmentos, ~{index.tokens_full} tokens")
+    return index
+
+
+def build_context(question: str, transcription: str, summary: Optional[str] = None, k: int = RAG_TOP_K) -> RetrievedContext:
+    """Resumen de la reunión + los k fragmentos más relevantes para la pregunta
+
+    `summary` sustituye al resumen extractivo (p. ej. el resumen generado con IA).
+    """
+    index = get_transcript_index(transcription)
+    selected = index.top_chunks(question, k)
+    excerpts = "\n[...]\n".join(index.chunks[i] for i in selected)
+    text = (
+        f"RESUMEN DE LA REUNIÓN:\n{summary or index.summary()}\n\n"
+        f"FRAGMENTOS RELEVANTES DE LA TRANSCRIPCIÓN ({len(selected)} de {len(index.chunks)}):\n{excerpts}"
+    )
+    return RetrievedContext(text, selected, index.tokens_full, estimate_tokens(text))
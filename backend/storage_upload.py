@@ -0,0 +1,170 @@
+"""storage_upload.py - Subida reanudable (TUS) a Supabase Storage
+
+Lee el archivo local por bloques de tamaño fijo y los envía con PATCH al
+endpoint TUS de Storage, de modo que la memoria usada por subida no depende
+del tamaño del audio. La URL de la subida se guarda en disco: si el proceso
+o la red fallan, el siguiente intento continúa desde el último offset
+confirmado por el servidor en lugar de volver a enviar todo.
+"""
+import base64
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Optional
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import (
+    SUPABASE_URL, SUPABASE_KEY, MIME_TYPES,
+    STORAGE_BUCKET, STORAGE_UPLOAD_CHUNK_MB, UPLOADS_STATE_DIR
+)
+from logger import get_logger
+from helpers import safe_json_dump
+
+logger = get_logger(__name__)
+
+TUS_VERSION = "1.0.0"
+MAX_CHUNK_RETRIES = 3
+
+
+def _b64(value: str) -> str:
+    return base64.b64encode(value.encode("utf-8")).decode("ascii")
+
+
+class ResumableUpload:
+    """Subida TUS de un archivo local a un bucket de Storage"""
+
+    def __init__(
+        self,
+        http_client,
+        filename: str,
+        filepath: str,
+        bucket: str = STORAGE_BUCKET,
+        upsert: bool = True,
+        chunk_size: int = STORAGE_UPLOAD_CHUNK_MB * 1024 * 1024
+    ):
+        self.http = http_client
+        self.filename = filename
+        self.filepath = Path(filepath)
+        self.bucket = bucket
+        self.upsert = upsert
+        self.chunk_size = chunk_size
+        self.size = self.filepath.stat().st_size
+        self.endpoint = f"{SUPABASE_URL.rstrip('/')}/storage/v1/upload/resumable"
+        # Estado identificado por destino + tamaño + fecha de modificación del archivo local
+        stat = self.filepath.stat()
+        fingerprint = f"{bucket}/{filename}|{self.size}|{int(stat.st_mtime)}"
+        self.state_name = f"{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:24]}.json"
+
+    def _headers(self, **extra) -> dict:
+        headers = {
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+            "apikey": SUPABASE_KEY,
+            "Tus-Resumable": TUS_VERSION,
+        }
+        headers.update(extra)
+        return headers
+
+    # ------------------------------------------------------------------
+    # Estado persistido (URL de la subida en curso)
+    # ------------------------------------------------------------------
+
+    def _load_location(self) -> Optional[str]:
+        path = UPLOADS_STATE_DIR / self.state_name
+        try:
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f).get("location")
+        except Exception as e:
+            logger.warning(f"Estado de subida ilegible ({self.filename}): {type(e).__name__}")
+        return None
+
+    def _save_location(self, location: str) -> None:
+        safe_json_dump({
+            "filename": self.filename,
+            "bucket": self.bucket,
+            "size": self.size,
+            "location": location
+        }, self.state_name, UPLOADS_STATE_DIR)
+
+    def _clear_location(self) -> None:
+        (UPLOADS_STATE_DIR / self.state_name).unlink(missing_ok=True)
+
+    # ------------------------------------------------------------------
+    # Protocolo TUS
+    # ------------------------------------------------------------------
+
+    def _create(self) -> str:
+        ext = self.filename.lower().split('.')[-1]
+        metadata = ",".join([
+            f"bucketName {_b64(self.bucket)}",
+            f"objectName {_b64(self.filename)}",
+            f"contentType {_b64(MIME_TYPES.get(ext, 'audio/mpeg'))}",
+            f"cacheControl {_b64('3600')}",
+        ])
+        response = self.http.post(self.endpoint, headers=self._headers(**{
+            "Upload-Length": str(self.size),
+            "Upload-Metadata": metadata,
+            "x-upsert": "true" if self.upsert else "false",
+        }))
+        response.raise_for_status()
+        location = response.headers["Location"]
+        if location.startswith("/"):
+            location = SUPABASE_URL.rstrip("/") + location
+        self._save_location(location)
+        return location
+
+    def _server_offset(self, location: str) -> Optional[int]:
+        """Offset confirmado por el servidor (None si la subida ya no existe)"""
+        response = self.http.head(location, headers=self._headers())
+        if response.status_code in (404, 410):
+            return None
+        response.raise_for_status()
+        return int(response.headers.get("Upload-Offset", 0))
+
+    def _patch(self, location: str, offset: int, block: bytes) -> int:
+        response = self.http.patch(location, content=block, headers=self._headers(**{
+            "Upload-Offset": str(offset),
+            "Content-Type": "application/offset+octet-stream",
+        }))
+        response.raise_for_status()
+        return int(response.headers.get("Upload-Offset", offset + len(block)))
+
+    def run(self) -> bool:
+        """Sube (o reanuda) el archivo. Devuelve True al completar"""
+        started = time.monotonic()
+        location = self._load_location()
+        offset = self._server_offset(location) if location else None
+        if offset is None:
+            location, offset = self._create(), 0
+        elif offset:
+            logger.info(f"↻ Reanudando subida de {self.filename} desde {offset / (1024 * 1024):.1f} MB")
+
+        with open(self.filepath, "rb") as f:
+            attempt = 0
+            while offset < self.size:
+                f.seek(offset)
+                block = f.read(self.chunk_size)
+                try:
+                    offset = self._patch(location, offset, block)
+                    attempt = 0
+                except Exception as e:
+                    attempt += 1
+                    if attempt >= MAX_CHUNK_RETRIES:
+                        logger.error(f"❌ Subida {self.filename} detenida en {offset}/{self.size} bytes: {type(e).__name__}")
+                        return False
+                    wait_time = 2 ** (attempt - 1)
+                    logger.warning(f"Bloque en offset {offset} falló ({type(e).__name__}), reintentando en {wait_time}s...")
+                    time.sleep(wait_time)
+                    # Resincronizar con lo que el servidor llegó a guardar
+                    server_offset = self._server_offset(location)
+                    if server_offset is None:
+                        location, offset = self._create(), 0
+                    else:
+                        offset = server_offset
+
+        self._clear_location()
+        elapsed = time.monotonic() - started
+        logger.info(f"✓ {self.filename} subido por bloques ({self.size / (1024 * 1024):.1f} MB en {elapsed:.1f}s)")
+        return True
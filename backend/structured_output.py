@@ -0,0 +1,204 @@
+"""structured_output.py - JSON estructurado para el análisis de oportunidades
+
+- Esquema declarado de la respuesta (response_schema de Gemini)
+- Parser en streaming: entrega cada oportunidad en cuanto su objeto se cierra
+- Reparación local barata de JSON mal formado (fences, comas sobrantes, truncado)
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+PRIORITIES = ["high", "medium", "low"]
+
+
+def build_opportunity_schema(temas: List[str]) -> Dict:
+    """Esquema OpenAPI (subconjunto admitido por Gemini) de la respuesta esperada"""
+    tema = {"type": "string"}
+    if temas:
+        tema.update({"format": "enum", "enum": list(temas)})
+    return {
+        "type": "object",
+        "properties": {
+            "analisis_completo": {"type": "boolean"},
+            "oportunidades": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "tema": tema,
+                        "prioridad": {"type": "string", "format": "enum", "enum": PRIORITIES},
+                        "mencionado_por": {"type": "string"},
+                        "contexto": {"type": "string"},
+                        "confianza": {"type": "number"},
+                    },
+                    "required": ["tema", "prioridad", "mencionado_por", "contexto", "confianza"],
+                },
+            },
+        },
+        "required": ["analisis_completo", "oportunidades"],
+    }
+
+
+# ============================================================================
+# REPARACIÓN DE JSON
+# ============================================================================
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _close_open_structures(text: str) -> Optional[str]:
+    """Cierra strings y llaves/corchetes abiertos (respuesta truncada)
+
+    Devuelve None si el texto tiene cierres que no cuadran.
+    """
+    stack, in_string, escape = [], False, False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+    if in_string:
+        text = (text[:-1] if escape else text) + '"'
+    text = text.rstrip()
+    # Un valor a medias ("clave": / ,) no se puede completar: se descarta
+    text = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', "", text)
+    return text + "".join(reversed(stack))
+
+
+def _value_boundaries(text: str) -> List[int]:
+    """Posiciones de comas fuera de strings (puntos seguros para recortar)"""
+    positions, in_string, escape = [], False, False
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            positions.append(i)
+    return positions
+
+
+def repair_json(text: str, max_attempts: int = 20) -> Optional[Any]:
+    """Intenta recuperar un JSON mal formado sin volver a llamar al modelo
+
+    Quita fences de markdown y texto alrededor, comas finales, y cierra
+    estructuras truncadas; si el último elemento está incompleto lo descarta
+    recortando hasta la coma anterior.
+    """
+    if not text:
+        return None
+    text = _FENCE.sub("", text).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    text = text[min(starts):]
+
+    decoder = json.JSONDecoder()
+    try:
+        return decoder.raw_decode(text)[0]  # Ignora texto sobrante tras el JSON
+    except json.JSONDecodeError:
+        pass
+
+    candidate = _TRAILING_COMMA.sub(r"\1", text)
+    boundaries = _value_boundaries(candidate)
+    for _ in range(max_attempts):
+        closed = _close_open_structures(candidate)
+        if closed is not None:
+            try:
+                return json.loads(_TRAILING_COMMA.sub(r"\1", closed))
+            except json.JSONDecodeError:
+                pass
+        if not boundaries:
+            return None
+        candidate = candidate[:boundaries.pop()]
+    return None
+
+
+# ============================================================================
+# PARSER EN STREAMING
+# ============================================================================
+
+class OpportunityStreamParser:
+    """Extrae los objetos del array `oportunidades` a medida que llega la respuesta
+
+    Cada `feed(chunk)` devuelve las oportunidades que se han completado con ese
+    fragmento; si la respuesta se corta, `items` conserva las ya recibidas.
+    """
+
+    def __init__(self, array_key: str = "oportunidades"):
+        self._key_pattern = re.compile(r'"%s"\s*:\s*$' % re.escape(array_key))
+        self.buffer = ""
+        self.items: List[Dict] = []
+        self.array_closed = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict]:
+        self.buffer += chunk
+        new_items = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._array_depth is None and self._key_pattern.search(buffer[max(0, i - 64):i]):
+                    self._array_depth = self._depth
+                elif char == "{" and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = i
+            elif char in "}]":
+                if char == "}" and self._item_start is not None and self._depth == self._array_depth + 1:
+                    item = repair_json(buffer[self._item_start:i + 1])
+                    if isinstance(item, dict):
+                        self.items.append(item)
+                        new_items.append(item)
+                    self._item_start = None
+                elif char == "]" and self._array_depth is not None and self._depth == self._array_depth:
+                    self.array_closed = True
+                self._depth -= 1
+        self._pos = len(buffer)
+        return new_items
+
+    def result(self) -> Optional[Dict]:
+        """Documento completo (reparado si hace falta) o, si se cortó, las oportunidades completas
+
+        Con el array sin cerrar no se usa el documento reparado: su último
+        elemento estaría a medias (contexto truncado, confianza ausente).
+        """
+        if self.array_closed or self._array_depth is None:
+            document = repair_json(self.buffer)
+            if isinstance(document, dict) and isinstance(document.get("oportunidades"), list):
+                return document
+        if self.items:
+            return {"analisis_completo": False, "oportunidades": list(self.items)}
+        return None
@@ -0,0 +1,152 @@
+"""transcription_cache.py - Caché persistente de transcripciones por contenido
+
+Clave = hash MD5 del audio + modelo + versión del prompt. Se guarda primero en
+disco (data/transcription_cache) y, si está activado, también en la tabla
+`transcription_cache` de Supabase para compartirla entre instancias. La tabla
+es opcional: si no existe, la caché compartida se desactiva tras el primer error.
+"""
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import TRANSCRIPTION_CACHE_DIR, TRANSCRIPTION_CACHE_SUPABASE
+from logger import get_logger
+from helpers import safe_json_dump
+
+logger = get_logger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# PostgreSQL "relation does not exist" y PostgREST "tabla no encontrada en el schema cache"
+MISSING_TABLE_MARKERS = ("42P01", "PGRST205", "does not exist")
+
+
+def compute_file_hash(path: str) -> str:
+    """MD5 del contenido del archivo, leído por bloques (mismo hash que process_audio_file)"""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class TranscriptionCache:
+    """Caché audio_hash + modelo + versión de prompt → transcripción"""
+
+    def __init__(self, cache_dir: Path = TRANSCRIPTION_CACHE_DIR, use_supabase: bool = TRANSCRIPTION_CACHE_SUPABASE):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.use_supabase = use_supabase
+
+    @staticmethod
+    def make_key(audio_hash: str, model: str, prompt_version: str) -> str:
+        variant = hashlib.sha256(f"{model}|{prompt_version}".encode("utf-8")).hexdigest()[:16]
+        return f"{audio_hash}_{variant}"
+
+    def _db(self):
+        if not self.use_supabase:
+            return None
+        try:
+            from database import init_supabase
+            return init_supabase()
+        except Exception:
+            return None
+
+    def _handle_db_error(self, action: str, error: Exception) -> None:
+        """Desactiva la caché compartida si la tabla no existe; el resto de errores solo se registran"""
+        if any(marker in str(error) for marker in MISSING_TABLE_MARKERS):
+            self.use_supabase = False
+            logger.warning("⚠️  Tabla transcription_cache no encontrada: caché compartida desactivada (solo disco)")
+        else:
+            logger.debug(f"{action}: {type(error).__name__}")
+
+    def get(self, audio_hash: str, model: str, prompt_version: str) -> Optional[str]:
+        """Devuelve la transcripción cacheada o None"""
+        key = self.make_key(audio_hash, model, prompt_version)
+        path = self.cache_dir / f"{key}.json"
+        try:
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f).get("content")
+        except Exception as e:
+            logger.warning(f"Caché local ilegible ({key}): {type(e).__name__}")
+
+        db = self._db()
+        if not db:
+            return None
+        try:
+            result = db.table("transcription_cache").select("content").eq("cache_key", key).limit(1).execute()
+            if result.data:
+                content = result.data[0]["content"]
+                self._write_local(key, audio_hash, model, prompt_version, content)
+                return content
+        except Exception as e:
+            self._handle_db_error("Caché Supabase no disponible", e)
+        return None
+
+    def set(self, audio_hash: str, model: str, prompt_version: str, content: str) -> None:
+        """Guarda una transcripción en disco y (opcionalmente) en Supabase"""
+        key = self.make_key(audio_hash, model, prompt_version)
+        self._write_local(key, audio_hash, model, prompt_version, content)
+
+        db = self._db()
+        if not db:
+            return
+        try:
+            db.table("transcription_cache").upsert({
+                "cache_key": key,
+                "audio_hash": audio_hash,
+                "model": model,
+                "prompt_version": prompt_version,
+                "content": content,
+                "created_at": datetime.now().isoformat()
+            }).execute()
+        except Exception as e:
+            self._handle_db_error("No se pudo guardar en caché Supabase", e)
+
+    def _write_local(self, key: str, audio_hash: str, model: str, prompt_version: str, content: str) -> None:
+        safe_json_dump({
+            "audio_hash": audio_hash,
+            "model": model,
+            "prompt_version": prompt_version,
+            "content": content,
+            "created_at": datetime.now().isoformat()
+        }, f"{key}.json", self.cache_dir)
+
+    def invalidate(self, audio_hash: str) -> int:
+        """Elimina todas las entradas de un audio (cualquier modelo/prompt)
+
+        Returns:
+            Número de entradas locales eliminadas
+        """
+        removed = 0
+        for path in self.cache_dir.glob(f"{audio_hash}_*.json"):
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"No se pudo borrar {path.name}: {e}")
+
+        db = self._db()
+        if db:
+            try:
+                db.table("transcription_cache").delete().eq("audio_hash", audio_hash).execute()
+            except Exception as e:
+                self._handle_db_error("No se pudo invalidar en Supabase", e)
+        logger.info(f"Caché invalidada para {audio_hash}: {removed} entrada(s) locales")
+        return removed
+
+    def clear(self) -> int:
+        """Vacía la caché local (la de Supabase se conserva)"""
+        removed = 0
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                path.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
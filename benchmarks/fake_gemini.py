@@ -0,0 +1,100 @@
+"""fake_gemini.py - Sustituto de google.generativeai con latencia configurable
+
+`install(latency_ms)` reemplaza GenerativeModel, upload_file, delete_file y configure en el
+módulo `google.generativeai` ya importado, de modo que Transcriber, Model y
+OpportunitiesManager usan el modelo falso sin cambios en su código.
+"""
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict
+
+SPEAKERS = ["Jorge", "María", "Voz 3"]
+PHRASES = [
+    "Tenemos que revisar el presupuesto del próximo trimestre",
+    "El cliente quiere cerrar el contrato antes de fin de mes",
+    "Hay que contratar a dos personas más para el equipo",
+    "La auditoría de cumplimiento empieza la semana que viene",
+    "Necesitamos un curso de formación para la nueva plataforma",
+    "Queda aprobado el cambio de estrategia comercial",
+]
+
+
+def fake_transcription(lines: int = 60) -> str:
+    """Transcripción sintética con el formato 'Nombre: "texto"'"""
+    return "\n".join(
+        f'{SPEAKERS[i % len(SPEAKERS)]}: "{PHRASES[i % len(PHRASES)]}, punto {i}."'
+        for i in range(lines)
+    )
+
+
+def fake_opportunities_json() -> str:
+    return json.dumps({
+        "analisis_completo": True,
+        "oportunidades": [
+            {"tema": "Presupuesto", "prioridad": "high", "mencionado_por": "Jorge",
+             "contexto": PHRASES[0], "confianza": 0.9},
+            {"tema": "Cierre de venta", "prioridad": "high", "mencionado_por": "María",
+             "contexto": PHRASES[1], "confianza": 0.85},
+            {"tema": "Recursos Humanos", "prioridad": "medium", "mencionado_por": "Voz 3",
+             "contexto": PHRASES[2], "confianza": 0.8},
+        ]
+    }, ensure_ascii=False)
+
+
+class FakeGemini:
+    """Estado compartido: latencia y contador de llamadas"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def respond(self, contents: Any) -> str:
+        if isinstance(contents, list):
+            # [prompt, archivo_de_audio] → transcripción
+            self._call("transcribe")
+            return fake_transcription()
+        prompt = str(contents)
+        if '"oportunidades"' in prompt:
+            self._call("analyze")
+            return fake_opportunities_json()
+        self._call("chat")
+        return "Resumen: se habló de presupuesto, un contrato con el cliente y contrataciones."
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.calls = {}
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name: str = "", *args, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        text = _state.respond(contents)
+        if stream:
+            return iter(SimpleNamespace(text=text[i:i + 40]) for i in range(0, len(text), 40))
+        return SimpleNamespace(text=text)
+
+
+_state = FakeGemini()
+
+
+def install(latency_ms: float = 0.0) -> FakeGemini:
+    """Sustituye el cliente real de Gemini por el falso"""
+    import google.generativeai as genai
+
+    _state.latency_ms = latency_ms
+    genai.configure = lambda *args, **kwargs: None
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.upload_file = lambda path, mime_type=None, **kwargs: SimpleNamespace(name=str(path), mime_type=mime_type)
+    genai.delete_file = lambda name, **kwargs: None
+    return _state
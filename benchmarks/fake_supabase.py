@@ -0,0 +1,385 @@
+"""fake_supabase.py - Sustituto local del cliente Supabase (PostgREST + Storage)
+
+Implementa en memoria el subconjunto del query builder que usa la app
+(select con joins embebidos, filtros, order/range/limit, count, insert,
+upsert, update, delete, rpc) y el API de Storage. Cada `execute()` o llamada
+de Storage cuenta como una petición y espera `latency_ms`, para que los
+benchmarks reflejen el coste de las idas y vueltas a la red.
+"""
+import copy
+import fnmatch
+import threading
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+# Relaciones para los joins embebidos: (tabla, relación) → (columna local, columna remota, es_lista)
+RELATIONS = {
+    ("recordings", "transcriptions"): ("id", "recording_id", True),
+    ("recordings", "opportunities"): ("id", "recording_id", True),
+    ("recordings", "chat_history"): ("id", "recording_id", True),
+    ("transcriptions", "recordings"): ("recording_id", "id", False),
+    ("opportunities", "recordings"): ("recording_id", "id", False),
+    ("chat_history", "recordings"): ("recording_id", "id", False),
+}
+
+
+class FakeAPIError(Exception):
+    """Error equivalente a postgrest.APIError (columna inexistente, etc.)"""
+
+    def __init__(self, message: str, code: Optional[str] = None):
+        super().__init__(message)
+        self.message, self.code = message, code
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Divide por comas que no estén dentro de paréntesis"""
+    parts, depth, current = [], 0, ""
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _compare(op: str, value: Any, arg: Any) -> bool:
+    if op == "is":
+        return value is None if arg in (None, "null") else value == arg
+    if value is None:
+        return False
+    if op == "eq":
+        return str(value) == str(arg)
+    if op == "neq":
+        return str(value) != str(arg)
+    if op in ("gt", "gte", "lt", "lte"):
+        left, right = value, arg
+        if isinstance(value, (int, float)) and not isinstance(arg, (int, float)):
+            right = type(value)(arg)
+        else:
+            left, right = str(value), str(arg).strip('"')
+        return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+    if op == "in":
+        return str(value) in {str(a) for a in arg}
+    if op in ("like", "ilike"):
+        pattern = str(arg).replace("%", "*")
+        if op == "ilike":
+            return fnmatch.fnmatch(str(value).lower(), pattern.lower())
+        return fnmatch.fnmatchcase(str(value), pattern)
+    raise FakeAPIError(f"Operador no soportado: {op}")
+
+
+def _parse_conditions(filters: str, combine: Callable) -> Callable[[Dict], bool]:
+    """Lista de condiciones PostgREST (admite and(...) anidados) → predicado sobre una fila"""
+    conditions = []
+    for part in _split_top_level(filters):
+        if part.startswith("and(") and part.endswith(")"):
+            conditions.append(_parse_conditions(part[4:-1], all))
+            continue
+        column, op, arg = part.split(".", 2)
+        if op == "in":
+            arg = [a.strip().strip('"') for a in arg.strip("()").split(",")]
+        else:
+            arg = arg.strip('"')
+        conditions.append(lambda row, col=column, op=op, arg=arg: _compare(op, row.get(col), arg))
+    return lambda row: combine(condition(row) for condition in conditions)
+
+
+class FakeQuery:
+    """Query builder encadenable (equivalente a postgrest SyncRequestBuilder)"""
+
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table = table
+        self.method = "select"
+        self.columns = "*"
+        self.payload = None
+        self.filters: List[Callable[[Dict], bool]] = []
+        self.orders: List[tuple] = []
+        self.offset = 0
+        self.max_rows: Optional[int] = None
+        self.count_mode: Optional[str] = None
+        self.head = False
+        self.single_row = False
+        self.on_conflict: Optional[str] = None
+        self.negate_next = False
+
+    # --- métodos ---------------------------------------------------------
+
+    def select(self, columns: str = "*", count: Optional[str] = None, head: bool = False):
+        self.method, self.columns, self.count_mode, self.head = "select", columns, count, head
+        return self
+
+    def insert(self, data, **kwargs):
+        self.method, self.payload = "insert", data
+        return self
+
+    def upsert(self, data, on_conflict: Optional[str] = None, **kwargs):
+        self.method, self.payload, self.on_conflict = "upsert", data, on_conflict
+        return self
+
+    def update(self, data, **kwargs):
+        self.method, self.payload = "update", data
+        return self
+
+    def delete(self, **kwargs):
+        self.method = "delete"
+        return self
+
+    # --- filtros -----------------------------------------------------------
+
+    def _add(self, column: str, op: str, arg: Any):
+        negate, self.negate_next = self.negate_next, False
+        self.filters.append(lambda row: _compare(op, row.get(column), arg) != negate)
+        return self
+
+    @property
+    def not_(self):
+        """Niega el siguiente filtro (`.not_.is_("col", "null")`)"""
+        self.negate_next = True
+        return self
+
+    def eq(self, column, value): return self._add(column, "eq", value)
+    def neq(self, column, value): return self._add(column, "neq", value)
+    def gt(self, column, value): return self._add(column, "gt", value)
+    def gte(self, column, value): return self._add(column, "gte", value)
+    def lt(self, column, value): return self._add(column, "lt", value)
+    def lte(self, column, value): return self._add(column, "lte", value)
+    def in_(self, column, values): return self._add(column, "in", list(values))
+    def like(self, column, pattern): return self._add(column, "like", pattern)
+    def ilike(self, column, pattern): return self._add(column, "ilike", pattern)
+    def is_(self, column, value): return self._add(column, "is", value)
+
+    def or_(self, filters: str, **kwargs):
+        """Sintaxis PostgREST: 'col.op.valor,col.op.valor,and(col.op.valor,...)'"""
+        condition = _parse_conditions(filters, any)
+        self.filters.append(condition)
+        return self
+
+    # --- forma del resultado -----------------------------------------------
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.max_rows = count
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self.offset, self.max_rows = start, end - start + 1
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def maybe_single(self):
+        return self.single()
+
+    # --- ejecución ----------------------------------------------------------
+
+    def execute(self):
+        self.client._request(f"{self.method.upper()} {self.table}")
+        with self.client._lock:
+            return getattr(self, f"_execute_{self.method}")()
+
+    def _matching(self) -> List[Dict]:
+        return [row for row in self.client.tables.setdefault(self.table, []) if all(f(row) for f in self.filters)]
+
+    def _execute_select(self):
+        if self.table in self.client.views:
+            rows = [r for r in self.client.views[self.table](self.client) if all(f(r) for f in self.filters)]
+        else:
+            rows = self._matching()
+        total = len(rows)
+        for column, desc in reversed(self.orders):
+            rows = sorted(rows, key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        rows = rows[self.offset:]
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        data = [] if self.head else [self._project(self.table, row, self.columns) for row in rows]
+        if self.single_row:
+            data = data[0] if data else None
+        return SimpleNamespace(data=data, count=total if self.count_mode else None)
+
+    def _project(self, table: str, row: Dict, columns: str) -> Dict:
+        if columns.strip() == "*":
+            return copy.deepcopy(row)
+        result = {}
+        for item in _split_top_level(columns):
+            if "(" in item:
+                name, inner = item.split("(", 1)
+                relation = name.split("!")[0].strip()
+                local_col, remote_col, many = RELATIONS[(table, relation)]
+                related = [
+                    self._project(relation, r, inner[:-1])
+                    for r in self.client.tables.get(relation, [])
+                    if r.get(remote_col) == row.get(local_col)
+                ]
+                result[relation] = related if many else (related[0] if related else None)
+            elif item == "*":
+                result.update(copy.deepcopy(row))
+            else:
+                if item not in row and not self.client.lenient_columns:
+                    raise FakeAPIError(f"column {table}.{item} does not exist", code="42703")
+                result[item] = row.get(item)
+        return result
+
+    def _new_row(self, data: Dict) -> Dict:
+        now = datetime.now().isoformat()
+        row = {"id": str(uuid.uuid4()), "created_at": now, "updated_at": now}
+        row.update(copy.deepcopy(data))
+        return row
+
+    def _execute_insert(self):
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        rows = [self._new_row(item) for item in payload]
+        self.client.tables.setdefault(self.table, []).extend(rows)
+        return SimpleNamespace(data=copy.deepcopy(rows), count=None)
+
+    def _execute_upsert(self):
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        table = self.client.tables.setdefault(self.table, [])
+        keys = (self.on_conflict or self.client.primary_keys.get(self.table, "id")).split(",")
+        written = []
+        for item in payload:
+            existing = next((r for r in table if all(r.get(k) == item.get(k) for k in keys)), None)
+            if existing is not None:
+                existing.update(copy.deepcopy(item))
+                written.append(existing)
+            else:
+                row = self._new_row(item)
+                table.append(row)
+                written.append(row)
+        return SimpleNamespace(data=copy.deepcopy(written), count=None)
+
+    def _execute_update(self):
+        rows = self._matching()
+        for row in rows:
+            row.update(copy.deepcopy(self.payload))
+            if "updated_at" in row and "updated_at" not in self.payload:
+                row["updated_at"] = datetime.now().isoformat()  # Como los triggers de database.sql
+        return SimpleNamespace(data=copy.deepcopy(rows), count=None)
+
+    def _execute_delete(self):
+        rows = self._matching()
+        ids = {id(r) for r in rows}
+        self.client.tables[self.table] = [r for r in self.client.tables[self.table] if id(r) not in ids]
+        return SimpleNamespace(data=copy.deepcopy(rows), count=None)
+
+
+class FakeBucket:
+    """Bucket de Storage en memoria"""
+
+    def __init__(self, client: "FakeSupabase", name: str):
+        self.client = client
+        self.objects = client.buckets.setdefault(name, {})
+
+    def upload(self, path: str, file, file_options: Optional[Dict] = None):
+        self.client._request("STORAGE upload")
+        if hasattr(file, "read"):
+            file = file.read()
+        elif isinstance(file, str):
+            with open(file, "rb") as f:
+                file = f.read()
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        if path in self.objects and not upsert:
+            raise FakeAPIError("The resource already exists")
+        self.objects[path] = bytes(file)
+        return SimpleNamespace(path=path)
+
+    def download(self, path: str) -> bytes:
+        self.client._request("STORAGE download")
+        if path not in self.objects:
+            raise FakeAPIError("Object not found")
+        return self.objects[path]
+
+    def remove(self, paths: List[str]):
+        self.client._request("STORAGE remove")
+        return [{"name": p} for p in paths if self.objects.pop(p, None) is not None]
+
+    def move(self, from_path: str, to_path: str):
+        self.client._request("STORAGE move")
+        if from_path not in self.objects:
+            raise FakeAPIError("Object not found")
+        if to_path in self.objects:
+            raise FakeAPIError("The resource already exists")
+        self.objects[to_path] = self.objects.pop(from_path)
+        return {"message": "Successfully moved"}
+
+    def info(self, path: str) -> Dict:
+        self.client._request("STORAGE info")
+        if path not in self.objects:
+            raise FakeAPIError("Object not found")
+        return {"name": path, "size": len(self.objects[path])}
+
+    def list(self, path: str = "", options: Optional[Dict] = None):
+        self.client._request("STORAGE list")
+        search = (options or {}).get("search", "")
+        return [{"name": name} for name in self.objects if search in name]
+
+
+class FakeStorage:
+    def __init__(self, client: "FakeSupabase"):
+        self.client = client
+
+    def from_(self, bucket: str) -> FakeBucket:
+        return FakeBucket(self.client, bucket)
+
+
+class FakeSupabase:
+    """Cliente Supabase en memoria con latencia configurable y contador de peticiones"""
+
+    def __init__(self, latency_ms: float = 0.0, lenient_columns: bool = False):
+        self.latency_ms = latency_ms
+        self.lenient_columns = lenient_columns
+        self.tables: Dict[str, List[Dict]] = {}
+        self.buckets: Dict[str, Dict[str, bytes]] = {}
+        self.views: Dict[str, Callable[["FakeSupabase"], List[Dict]]] = {}
+        self.functions: Dict[str, Callable[..., Any]] = {}
+        self.primary_keys = {"transcription_cache": "cache_key"}
+        self.storage = FakeStorage(self)
+        self.requests = 0
+        self.request_log: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def _request(self, kind: str) -> None:
+        with self._lock:
+            self.requests += 1
+            self.request_log[kind] = self.request_log.get(kind, 0) + 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.request_log = {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def from_(self, name: str) -> FakeQuery:
+        return self.table(name)
+
+    def rpc(self, fn: str, params: Optional[Dict] = None):
+        client = self
+
+        class _RPC:
+            def execute(self):
+                client._request(f"RPC {fn}")
+                if fn not in client.functions:
+                    raise FakeAPIError(f"function {fn} does not exist")
+                with client._lock:
+                    return SimpleNamespace(data=client.functions[fn](client, **(params or {})), count=None)
+
+        return _RPC()
@@ -0,0 +1,472 @@
+"""run.py - Benchmarks de los caminos críticos del backend (offline)
+
+Uso:
+    python -m benchmarks.run                          # tamaños 10,100,1000,10000
+    python -m benchmarks.run --sizes 10,100 --repeat 3
+    python -m benchmarks.run --supabase-latency-ms 20 --gemini-latency-ms 300
+    python -m benchmarks.run --compare benchmarks/results/<commit>.json
+
+Supabase y Gemini se sustituyen por fakes en memoria (ver fake_supabase.py y
+fake_gemini.py), así que no se necesita red ni credenciales. El resultado se
+guarda en JSON (por defecto benchmarks/results/<commit>.json) para comparar
+entre commits con --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+APP_ROOT = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# Entorno aislado ANTES de importar la app: credenciales ficticias (nunca se
+# sale a la red), datos en un directorio temporal y logs solo de avisos
+os.environ["GEMINI_API_KEY"] = "benchmark"
+os.environ["SUPABASE_URL"] = "http://fake-supabase.local"
+os.environ["SUPABASE_KEY"] = "benchmark"
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="bench_data_"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")  # El rate limit real distorsionaría las medidas
+
+for path in (APP_ROOT, APP_ROOT / "backend", APP_ROOT / "frontend"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from benchmarks import fake_gemini  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+# ============================================================================
+# DATOS SINTÉTICOS
+# ============================================================================
+
+WAV_HEADER = (
+    b"RIFF\x24\x08\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00"
+    b"\x40\x1f\x00\x00\x80\x3e\x00\x00\x02\x00\x10\x00data\x00\x08\x00\x00"
+)
+
+
+def fake_wav(seed: int) -> bytes:
+    """WAV mínimo y distinto por semilla (para no chocar con la detección de duplicados)"""
+    return WAV_HEADER + seed.to_bytes(8, "little") * 256
+
+
+def recording_name(i: int) -> str:
+    return f"reunion_{i:05d}.wav"
+
+
+def seed_database(fake: FakeSupabase, size: int) -> None:
+    """N grabaciones; la mitad transcritas con 3 oportunidades cada una"""
+    base = datetime(2025, 1, 1)
+    transcription = fake_gemini.fake_transcription()
+    recordings, transcriptions, opportunities = [], [], []
+    for i in range(size):
+        created = (base + timedelta(minutes=i)).isoformat()
+        rec_id = f"rec-{i:05d}"
+        recordings.append({
+            "id": rec_id, "filename": recording_name(i), "filepath": "",
+            "transcription": None, "file_size_mb": 0.01,
+            "created_at": created, "updated_at": created,
+        })
+        if i % 2:
+            continue
+        transcriptions.append({
+            "id": f"tr-{i:05d}", "recording_id": rec_id, "content": transcription,
+            "language": "es", "created_at": created, "updated_at": created,
+        })
+        for k, tema in enumerate(("Presupuesto", "Cierre de venta", "Formación")):
+            opportunities.append({
+                "id": f"opp-{i:05d}-{k}", "recording_id": rec_id,
+                "title": f"[IA] {tema} - Jorge", "description": fake_gemini.PHRASES[k],
+                "status": "new", "priority": "High", "notes": "",
+                "created_at": created, "updated_at": created,
+            })
+    fake.tables = {
+        "recordings": recordings,
+        "transcriptions": transcriptions,
+        "opportunities": opportunities,
+        "chat_history": [],
+        "transcription_cache": [],
+    }
+    # Solo la grabación más reciente tiene audio en Storage (la que abre index.py)
+    fake.buckets = {"recordings": {recording_name(size - 1): fake_wav(size - 1)}}
+    register_aggregates(fake)
+
+
+def _tema(title: str) -> str:
+    """Equivalente de opportunity_tema() en database.sql"""
+    tema = title[4:].lstrip() if title.startswith("[IA]") else title
+    tema = tema.split(" - ", 1)[0].strip()
+    return tema[:1].upper() + tema[1:].lower()
+
+
+def register_aggregates(fake: FakeSupabase) -> None:
+    """Vistas y funciones agregadas de database.sql que usa el panel de oportunidades"""
+    def breakdown(client):
+        counts: Dict[tuple, int] = {}
+        for o in client.tables.get("opportunities", []):
+            key = (_tema(o["title"]), o.get("status"), o.get("priority"))
+            counts[key] = counts.get(key, 0) + 1
+        return [{"tema": t, "status": s, "priority": p, "count": n} for (t, s, p), n in counts.items()]
+
+    def watermark(client):
+        rows = client.tables.get("opportunities", [])
+        return [{
+            "total": len(rows),
+            "last_created_at": max((o.get("created_at") or "" for o in rows), default=None),
+            "last_updated_at": max((o.get("updated_at") or "" for o in rows), default=None),
+        }]
+
+    def pending(client):
+        filenames = {r["id"]: r["filename"] for r in client.tables.get("recordings", [])}
+        totals: Dict[str, Dict] = {}
+        for o in client.tables.get("opportunities", []):
+            if o.get("status") == "new" and o["recording_id"] in filenames:
+                row = totals.setdefault(o["recording_id"], {"filename": filenames[o["recording_id"]], "total_pending": 0, "priorities": set()})
+                row["total_pending"] += 1
+                row["priorities"].add(o.get("priority"))
+        return [dict(row, priorities=", ".join(sorted(row["priorities"]))) for row in totals.values()]
+
+    def weekly(client, since):
+        counts: Dict[tuple, int] = {}
+        for o in client.tables.get("opportunities", []):
+            created = datetime.fromisoformat(o["created_at"][:19]).date()
+            if created.isoformat() < since:
+                continue
+            key = ((created - timedelta(days=created.weekday())).isoformat(), _tema(o["title"]))
+            counts[key] = counts.get(key, 0) + 1
+        return [{"week": w, "tema": t, "count": n} for (w, t), n in sorted(counts.items())]
+
+    fake.views.update({
+        "v_opportunities_breakdown": breakdown,
+        "v_opportunities_watermark": watermark,
+        "v_pending_opportunities": pending,
+    })
+    fake.functions["opportunities_weekly"] = weekly
+
+# ============================================================================
+# ENTORNO DE LA APP CON FAKES
+# ============================================================================
+
+class _AttrDict(dict):
+    """session_state mínimo para llamar funciones de frontend fuera de `streamlit run`"""
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+
+@contextmanager
+def bare_session_state(**values):
+    import streamlit as st
+    original = st.session_state
+    st.session_state = _AttrDict(values)
+    try:
+        yield st.session_state
+    finally:
+        st.session_state = original
+
+
+class BenchContext:
+    """Importa la app con Supabase/Gemini falsos y expone sus componentes"""
+
+    def __init__(self, supabase_latency_ms: float, gemini_latency_ms: float):
+        self.fake = FakeSupabase(latency_ms=supabase_latency_ms)
+        self.gemini = fake_gemini.install(gemini_latency_ms)
+
+        import database
+        database.create_client = lambda *args, **kwargs: self.fake
+        self.db_utils = database
+
+        import streamlit as st
+        import streamlit.logger
+        streamlit.logger.set_log_level("error")  # Silencia los avisos de "bare mode"
+        from AudioRecorder import AudioRecorder
+        from OpportunitiesManager import OpportunitiesManager
+        from utils import process_audio_file
+        self.st = st
+        self.recorder = AudioRecorder()
+        self.process_audio_file = process_audio_file
+        self.OpportunitiesManager = OpportunitiesManager
+        self.size = 0
+
+    def prepare(self, size: int) -> None:
+        """Datos nuevos y cachés de Streamlit vacías para cada tamaño"""
+        seed_database(self.fake, size)
+        self.st.cache_data.clear()
+        self.st.cache_resource.clear()
+        self.opp_manager = self.OpportunitiesManager()
+        self.size = size
+
+    def reset_counters(self) -> None:
+        self.fake.reset_counters()
+        self.gemini.reset_counters()
+
+# ============================================================================
+# BENCHMARKS
+# ============================================================================
+
+def bench_process_audio_file(ctx: BenchContext) -> Callable[[int], None]:
+    def run(iteration: int) -> None:
+        with bare_session_state(processed_audios=set(), recordings=[], debug_log=[]):
+            ok, _ = ctx.process_audio_file(
+                fake_wav(10_000_000 + iteration), f"bench_upload_{ctx.size}_{iteration}.wav",
+                ctx.recorder, ctx.db_utils
+            )
+        assert ok, "process_audio_file falló"
+    return run
+
+
+def bench_get_transcription_by_filename(ctx: BenchContext) -> Callable[[int], None]:
+    filename = recording_name((ctx.size // 2) & ~1)  # Una grabación transcrita a mitad de tabla
+    def run(iteration: int) -> None:
+        assert ctx.db_utils.get_transcription_by_filename(filename), "sin transcripción"
+    return run
+
+
+def _benchmark_keywords() -> List[str]:
+    """Todas las variantes de keywords_dict.json (el conjunto real del análisis)"""
+    with open(APP_ROOT / "keywords_dict.json", encoding="utf-8") as f:
+        topics = json.load(f)["temas_de_interes"]
+    return [variant for topic in topics.values() for variant in topic.get("variantes", [])]
+
+
+def _extract_opportunities_loop(transcription: str, keywords_list: List[str]) -> List[Dict]:
+    """Implementación anterior (bucle keyword × palabra), como referencia"""
+    opportunities, words = [], transcription.lower().split()
+    for keyword in keywords_list:
+        for i, word in enumerate(words):
+            if keyword.lower() not in word:
+                continue
+            start, end = max(0, i - 15), min(len(words), i + 16)
+            opportunities.append({
+                "keyword": keyword,
+                "full_context": f"{' '.join(words[start:i])} **{keyword}** {' '.join(words[i+1:end])}",
+            })
+    return opportunities
+
+
+def bench_extract_opportunities(ctx: BenchContext) -> Callable[[int], None]:
+    # En los benchmarks de texto N = líneas de transcripción
+    text = fake_gemini.fake_transcription(lines=ctx.size)
+    keywords = _benchmark_keywords()
+    def run(iteration: int) -> None:
+        ctx.opp_manager.extract_opportunities(text, keywords)
+    return run
+
+
+def bench_extract_opportunities_loop(ctx: BenchContext) -> Callable[[int], None]:
+    text = fake_gemini.fake_transcription(lines=ctx.size)
+    keywords = _benchmark_keywords()
+    def run(iteration: int) -> None:
+        _extract_opportunities_loop(text, keywords)
+    return run
+
+
+def bench_analyze_opportunities_with_ai(ctx: BenchContext) -> Callable[[int], None]:
+    text = fake_gemini.fake_transcription(lines=ctx.size)
+    filename = recording_name(0)
+    def run(iteration: int) -> None:
+        detected, _ = ctx.opp_manager.analyze_opportunities_with_ai(text, filename)
+        assert detected, "no se detectaron oportunidades"
+    return run
+
+
+def _keyword_opportunities(count: int) -> List[Dict]:
+    return [{"id": f"kw_{i}", "keyword": "presupuesto", "status": "new", "notes": "", "priority": "Medium",
+             "full_context": f"{fake_gemini.PHRASES[0]} **presupuesto** punto {i}"} for i in range(count)]
+
+
+def bench_save_opportunities(ctx: BenchContext) -> Callable[[int], None]:
+    # N = oportunidades a guardar (un solo INSERT multi-fila)
+    filename = recording_name(0)
+    def run(iteration: int) -> None:
+        saved = ctx.opp_manager.save_opportunities(_keyword_opportunities(ctx.size), filename)
+        assert saved == ctx.size, "no se guardaron todas"
+    return run
+
+
+def bench_save_opportunity_loop(ctx: BenchContext) -> Callable[[int], None]:
+    # Camino anterior: un save_opportunity (y un INSERT) por oportunidad
+    filename = recording_name(0)
+    def run(iteration: int) -> None:
+        for opportunity in _keyword_opportunities(ctx.size):
+            ctx.opp_manager.save_opportunity(opportunity, filename)
+    return run
+
+
+def bench_load_opportunities(ctx: BenchContext) -> Callable[[int], None]:
+    filename = recording_name((ctx.size // 2) & ~1)
+    def run(iteration: int) -> None:
+        ctx.opp_manager.load_opportunities(filename)
+    return run
+
+
+def bench_opportunity_dashboard(ctx: BenchContext) -> Callable[[int], None]:
+    """Panel de oportunidades: la primera iteración carga los agregados, las demás solo la marca de cambios"""
+    from opportunity_stats import OpportunityStats
+    stats = OpportunityStats(refresh_interval=0)
+    def run(iteration: int) -> None:
+        assert stats.refresh(), "refresco fallido"
+        assert stats.snapshot()["total"] == len(ctx.fake.tables["opportunities"]), "total incorrecto"
+    return run
+
+
+def bench_index_rerun(ctx: BenchContext) -> Callable[[int], None]:
+    """Rerun completo de frontend/index.py (la primera iteración es el arranque en frío)"""
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(str(APP_ROOT / "frontend" / "index.py"), default_timeout=300)
+    def run(iteration: int) -> None:
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[BenchContext], Callable[[int], None]]] = {
+    "process_audio_file": bench_process_audio_file,
+    "get_transcription_by_filename": bench_get_transcription_by_filename,
+    "extract_opportunities": bench_extract_opportunities,
+    "extract_opportunities_loop": bench_extract_opportunities_loop,
+    "analyze_opportunities_with_ai": bench_analyze_opportunities_with_ai,
+    "save_opportunities": bench_save_opportunities,
+    "save_opportunity_loop": bench_save_opportunity_loop,
+    "load_opportunities": bench_load_opportunities,
+    "opportunity_dashboard": bench_opportunity_dashboard,
+    "index_rerun": bench_index_rerun,
+}
+
+# ============================================================================
+# EJECUCIÓN Y SALIDA
+# ============================================================================
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def run_benchmark(ctx: BenchContext, name: str, size: int, repeat: int) -> Dict:
+    result = {"benchmark": name, "size": size, "runs": 0}
+    try:
+        ctx.prepare(size)
+        fn = BENCHMARKS[name](ctx)
+        timings, requests, gemini_calls = [], [], []
+        for iteration in range(repeat):
+            ctx.reset_counters()
+            started = time.perf_counter()
+            fn(iteration)
+            timings.append((time.perf_counter() - started) * 1000)
+            requests.append(ctx.fake.requests)
+            gemini_calls.append(sum(ctx.gemini.calls.values()))
+        result.update({
+            "runs": len(timings),
+            "first_ms": round(timings[0], 3),
+            "min_ms": round(min(timings), 3),
+            "median_ms": round(statistics.median(timings), 3),
+            "mean_ms": round(statistics.mean(timings), 3),
+            "p95_ms": round(_percentile(timings, 0.95), 3),
+            "max_ms": round(max(timings), 3),
+            "supabase_requests": round(statistics.mean(requests), 2),
+            "gemini_calls": round(statistics.mean(gemini_calls), 2),
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict, baseline_path: Path, threshold: float) -> int:
+    """Imprime la variación de la mediana frente a otra ejecución. Devuelve nº de regresiones"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["benchmark"], r["size"]): r for r in baseline.get("results", []) if "median_ms" in r}
+    regressions = 0
+    print(f"\nComparación con {baseline_path.name} (commit {baseline.get('meta', {}).get('commit')}):")
+    for r in current["results"]:
+        old = previous.get((r["benchmark"], r["size"]))
+        if not old or "median_ms" not in r:
+            continue
+        change = (r["median_ms"] - old["median_ms"]) / old["median_ms"] if old["median_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  ⚠ REGRESIÓN"
+            regressions += 1
+        print(f"  {r['benchmark']:<32} N={r['size']:<6} {old['median_ms']:>10.2f} → {r['median_ms']:>10.2f} ms ({change:+.0%}){flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks offline de appGrabacionAudio")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Nº de grabaciones, separados por comas")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por benchmark y tamaño")
+    parser.add_argument("--only", default="", help="Benchmarks a ejecutar, separados por comas")
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0, help="Latencia simulada por petición a Supabase")
+    parser.add_argument("--gemini-latency-ms", type=float, default=0.0, help="Latencia simulada por llamada a Gemini")
+    parser.add_argument("--output", type=Path, default=None, help="Archivo JSON de salida")
+    parser.add_argument("--compare", type=Path, default=None, help="JSON de una ejecución anterior")
+    parser.add_argument("--fail-threshold", type=float, default=0.25, help="Subida de la mediana que cuenta como regresión")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    names = [n.strip() for n in args.only.split(",") if n.strip()] or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Benchmarks desconocidos: {', '.join(sorted(unknown))}")
+
+    ctx = BenchContext(args.supabase_latency_ms, args.gemini_latency_ms)
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "supabase_latency_ms": args.supabase_latency_ms,
+            "gemini_latency_ms": args.gemini_latency_ms,
+        },
+        "results": [],
+    }
+
+    for name in names:
+        for size in sizes:
+            result = run_benchmark(ctx, name, size, args.repeat)
+            report["results"].append(result)
+            summary = result.get("error") or (
+                f"mediana {result['median_ms']:.2f} ms · p95 {result['p95_ms']:.2f} ms · "
+                f"{result['supabase_requests']} peticiones · {result['gemini_calls']} llamadas IA"
+            )
+            print(f"{name:<32} N={size:<6} {summary}", flush=True)
+
+    output = args.output or RESULTS_DIR / f"{commit or datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+    if args.compare:
+        return 1 if compare(report, args.compare, args.fail_threshold) else 0
+    return 1 if any("error" in r for r in report["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,7 +11,7 @@ load_dotenv()
 # RUTAS Y DIRECTORIOS
 # ============================================================================
 APP_ROOT = Path(__file__).parent
-DATA_DIR = APP_ROOT / "data"
+DATA_DIR = Path(os.getenv("APP_DATA_DIR", APP_ROOT / "data"))  # Sobrescribible (p. ej. benchmarks)
 RECORDINGS_DIR = DATA_DIR / "recordings"
 OPPORTUNITIES_DIR = DATA_DIR / "opportunities"
 
@@ -30,6 +30,11 @@ if not OPPORTUNITIES_DIR.is_dir():
 # ============================================================================
 AUDIO_EXTENSIONS = ("mp3", "wav", "m4a", "ogg", "flac", "webm")
 
+# Caché LRU de audios en RECORDINGS_DIR (el original siempre está en Storage)
+AUDIO_CACHE_DB_PATH = DATA_DIR / "audio_cache.db"
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))  # Presupuesto en disco
+AUDIO_CACHE_MIN_AGE_SECONDS = 300  # No se expulsan audios usados en los últimos 5 minutos
+
 # Validar y parsear MAX_AUDIO_SIZE_MB
 try:
     MAX_AUDIO_SIZE_MB = int(os.getenv("MAX_AUDIO_SIZE_MB", "100"))
@@ -67,6 +72,17 @@ if not SUPABASE_URL or not SUPABASE_KEY:
         "Para Streamlit Cloud, configúralas en Settings > Secrets"
     )
 
+# Cliente HTTP compartido (keep-alive) para todas las llamadas a Supabase
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "10"))  # Conexiones máximas del pool
+SUPABASE_HTTP_TIMEOUT = 30  # segundos
+
+# Storage: los audios mayores que un bloque se suben por TUS (reanudable, por bloques)
+STORAGE_BUCKET = "recordings"
+STORAGE_UPLOAD_CHUNK_MB = 6  # Supabase exige bloques de 6 MB en subidas reanudables
+UPLOADS_STATE_DIR = DATA_DIR / "uploads"  # URL de subidas en curso (para reanudar)
+RENAME_LOG_DIR = DATA_DIR / "renames"  # Registro compensatorio de renombrados en curso
+RENAME_RECOVERY_SECONDS = 60  # Intervalo mínimo entre intentos de resolver renombrados a medias
+
 # ============================================================================
 # INFORMACIÓN DE LA APLICACIÓN
 # ============================================================================
@@ -80,6 +96,81 @@ APP_VERSION = "1.0.0"
 TRANSCRIPTION_MODEL = "gemini-2.0-flash"
 CHAT_MODEL = "gemini-2.0-flash"
 
+# ============================================================================
+# PASARELA LLM (todas las llamadas a Gemini)
+# ============================================================================
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Llamadas simultáneas en todo el proceso
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))  # Token bucket por modelo
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))  # Peticiones seguidas permitidas antes de limitar
+LLM_MAX_RETRIES = 4  # Reintentos ante 429 / 5xx / timeout
+LLM_BACKOFF_BASE_SECONDS = 1.0
+LLM_BACKOFF_MAX_SECONDS = 30.0
+LLM_TIMEOUT_SECONDS = 120  # Por llamada (chat y análisis)
+LLM_TRANSCRIPTION_TIMEOUT_SECONDS = 600  # Subida y transcripción de audio
+LLM_LATENCY_WINDOW = 500  # Últimas llamadas usadas para los percentiles
+
+# ============================================================================
+# TRANSCRIPCIÓN POR FRAGMENTOS (audios largos)
+# ============================================================================
+TRANSCRIPTION_CHUNK_THRESHOLD_SECONDS = 15 * 60  # A partir de esta duración se trocea el audio
+TRANSCRIPTION_CHUNK_SECONDS = 8 * 60  # Duración de cada ventana
+TRANSCRIPTION_CHUNK_OVERLAP_SECONDS = 20  # Solape entre ventanas consecutivas
+TRANSCRIPTION_MAX_WORKERS = int(os.getenv("TRANSCRIPTION_MAX_WORKERS", "4"))  # Fragmentos en paralelo
+
+# Caché de transcripciones por hash del audio (disco local + tabla opcional en Supabase)
+TRANSCRIPTION_CACHE_DIR = DATA_DIR / "transcription_cache"
+TRANSCRIPTION_CACHE_SUPABASE = os.getenv("TRANSCRIPTION_CACHE_SUPABASE", "false").lower() == "true"  # Requiere la tabla opcional transcription_cache
+
+# ============================================================================
+# COLA DE TRABAJOS EN SEGUNDO PLANO (transcripción → guardado → análisis)
+# ============================================================================
+JOBS_DB_PATH = DATA_DIR / "jobs.db"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Trabajos simultáneos por proceso
+JOB_POLL_SECONDS = 2  # Intervalo de refresco del estado en la UI
+
+# ============================================================================
+# ANÁLISIS DE OPORTUNIDADES CON IA
+# ============================================================================
+OPPORTUNITY_STRUCTURED_OUTPUT = os.getenv("OPPORTUNITY_STRUCTURED_OUTPUT", "true").lower() == "true"  # JSON con esquema declarado
+OPPORTUNITY_REPAIR_MAX_CHARS = 8000  # Texto máximo enviado en la llamada de reparación
+OPPORTUNITY_CHUNK_TOKENS = 3000  # Presupuesto por llamada (≈ 12.000 caracteres, el antiguo recorte)
+OPPORTUNITY_MAX_WORKERS = int(os.getenv("OPPORTUNITY_MAX_WORKERS", "4"))  # Fragmentos analizados en paralelo
+OPPORTUNITY_DEDUP_OVERLAP = 0.5  # Solape mínimo de contexto para fusionar oportunidades repetidas
+
+# Panel de oportunidades (solo lee vistas/funciones agregadas de database.sql)
+OPPORTUNITY_DASHBOARD_REFRESH_SECONDS = 60  # Comprobación de cambios (v_opportunities_watermark)
+OPPORTUNITY_DASHBOARD_FULL_RELOAD_SECONDS = 900  # Recarga completa de la tendencia (borrados antiguos)
+OPPORTUNITY_DASHBOARD_WEEKS = 12  # Semanas mostradas en la tendencia
+OPPORTUNITY_DASHBOARD_PENDING_LIMIT = 10  # Grabaciones con más oportunidades pendientes
+
+# ============================================================================
+# CHAT CON RECUPERACIÓN DE FRAGMENTOS (RAG)
+# ============================================================================
+RAG_MIN_TOKENS = 4000  # Por debajo de este tamaño se envía la transcripción completa
+RAG_CHUNK_TOKENS = 300  # Tamaño de cada fragmento indexado (turnos completos)
+RAG_TOP_K = 6  # Fragmentos enviados por pregunta
+RAG_SUMMARY_TERMS = 12  # Términos frecuentes incluidos en el resumen breve
+RAG_EMBEDDINGS = os.getenv("RAG_EMBEDDINGS", "false").lower() == "true"  # BM25 + embeddings de Gemini
+RAG_EMBEDDING_MODEL = "models/text-embedding-004"
+RAG_EMBEDDING_WEIGHT = 0.5  # Peso de la similitud coseno frente a BM25
+RAG_EMBEDDINGS_DIR = DATA_DIR / "embeddings_cache"
+
+# Caché de contexto del chat (por hash de transcripción)
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"  # CachedContent de Gemini
+CONTEXT_CACHE_MODEL = "models/gemini-2.0-flash-001"  # La caché explícita exige un modelo versionado
+CONTEXT_CACHE_MIN_TOKENS = 4096  # Mínimo que admite Gemini; por debajo se envía el prompt completo
+CONTEXT_CACHE_TTL_MINUTES = 30
+CHAT_ANSWER_MEMO_SIZE = 256  # Respuestas exactas memorizadas (transcripción, pregunta, keywords)
+CONTEXT_CACHE_MAX_TRANSCRIPTS = 64  # Transcripciones con estado de caché de Gemini en memoria
+
+# ============================================================================
+# ÍNDICE LOCAL (SQLite FTS5: réplica de grabaciones y transcripciones)
+# ============================================================================
+LOCAL_INDEX_DB_PATH = DATA_DIR / "local_index.db"
+LOCAL_INDEX_SYNC_SECONDS = 60  # Intervalo mínimo entre sincronizaciones con Supabase
+LOCAL_INDEX_SYNC_PAGE_SIZE = 200  # Transcripciones por petición al sincronizar
+LOCAL_INDEX_RECONCILE_SECONDS = 3600  # Cada cuánto se comprueban transcripciones borradas en otras instancias
+
 # ============================================================================
 # OPCIONES DE DATOS
 # ============================================================================
@@ -93,10 +184,19 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FILE = DATA_DIR / "app.log"
 
 # Configuración de sesión y UI
-CHAT_HISTORY_LIMIT = 50  # Límite máximo de mensajes en chat
+CHAT_HISTORY_LIMIT = 50  # Mensajes del chat en memoria por grabación
+CHAT_HISTORY_PAGE_SIZE = 20  # Mensajes por página al cargar conversaciones anteriores
+CHAT_HISTORY_FLUSH_SECONDS = 2  # Intervalo de escritura por lotes en chat_history
+CHAT_HISTORY_BATCH_SIZE = 50  # Mensajes por insert
+CHAT_HISTORY_MAX_WINDOWS = 32  # Grabaciones con conversación en memoria
+CHAT_HISTORY_MAX_ATTEMPTS = 3  # Intentos de guardado antes de descartar un mensaje
 MAX_SEARCH_RESULTS = 20  # Resultados máximos en búsqueda
+TRANSCRIPT_SEARCH_CACHE_SECONDS = 60  # Resultados de búsqueda en transcripciones reutilizados entre reruns
 SESSION_TIMEOUT_MINUTES = 30  # Timeout de sesión
 REFRESH_INTERVAL_SECONDS = 5  # Intervalo de refresco de datos
+CATALOG_FULL_RELOAD_SECONDS = 300  # Recarga completa del catálogo (detecta borrados de otras instancias)
+CATALOG_RETRY_MAX_SECONDS = 120  # Espera máxima entre cargas completas fallidas (sin conexión)
+HEALTH_METRICS_CACHE_SECONDS = 30  # Conteos y latencias del panel DEBUG reutilizados entre reruns
 
 # Configuración de cache
 CACHE_TTL_MINUTES = 10  # Tiempo de vida del cache en minutos
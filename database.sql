@@ -16,15 +16,21 @@ CREATE TABLE IF NOT EXISTS recordings (
     filename TEXT NOT NULL,
     filepath TEXT NOT NULL,
     transcription TEXT,
-    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
-    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
     
     CONSTRAINT recordings_pkey PRIMARY KEY (id)
 );
 
+-- Tamaño del archivo (lo muestra el catálogo de grabaciones)
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS file_size_mb NUMERIC(10, 2);
+
 -- Índices de performance
 CREATE INDEX IF NOT EXISTS idx_recordings_filename ON recordings(filename);
 CREATE INDEX IF NOT EXISTS idx_recordings_created_at ON recordings(created_at DESC);
+-- Refresco incremental del catálogo: keyset (updated_at, id) > último cursor visto
+DROP INDEX IF EXISTS idx_recordings_updated_at;
+CREATE INDEX IF NOT EXISTS idx_recordings_updated_at_id ON recordings(updated_at, id);
 
 -- Comentarios para documentación
 COMMENT ON TABLE recordings IS 'Tabla madre: almacena todos los audios subidos al sistema';
@@ -33,6 +39,7 @@ COMMENT ON COLUMN recordings.filename IS 'Nombre del archivo (ej: meeting_2025-0
 COMMENT ON COLUMN recordings.filepath IS 'Ruta en Supabase Storage (ej: recordings/meeting_2025-02-09.wav)';
 COMMENT ON COLUMN recordings.transcription IS 'Texto completo transcrito del audio';
 COMMENT ON COLUMN recordings.created_at IS 'Timestamp de cuando se subió el audio';
+COMMENT ON COLUMN recordings.file_size_mb IS 'Tamaño del audio en MB';
 
 ---
 
@@ -48,8 +55,8 @@ CREATE TABLE IF NOT EXISTS transcriptions (
     recording_id UUID NOT NULL,
     content TEXT NOT NULL,
     language TEXT DEFAULT 'es'::text,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
     
     CONSTRAINT transcriptions_pkey PRIMARY KEY (id),
     CONSTRAINT transcriptions_recording_id_fkey FOREIGN KEY (recording_id) REFERENCES recordings(id) ON DELETE CASCADE
@@ -58,6 +65,8 @@ CREATE TABLE IF NOT EXISTS transcriptions (
 -- Índices de performance
 CREATE INDEX IF NOT EXISTS idx_transcriptions_recording_id ON transcriptions(recording_id);
 CREATE INDEX IF NOT EXISTS idx_transcriptions_created_at ON transcriptions(created_at DESC);
+-- Sincronización del índice local: keyset (updated_at, id) > último cursor visto
+CREATE INDEX IF NOT EXISTS idx_transcriptions_updated_at_id ON transcriptions(updated_at, id);
 
 -- Comentarios para documentación
 COMMENT ON TABLE transcriptions IS 'Almacena transcripciones de audios (permite múltiples versiones/idiomas por audio)';
@@ -67,6 +76,68 @@ COMMENT ON COLUMN transcriptions.content IS 'Texto completo de la transcripción
 COMMENT ON COLUMN transcriptions.language IS 'Idioma detectado (es, en, fr, de, pt, it)';
 COMMENT ON COLUMN transcriptions.created_at IS 'Cuándo se transcribió el audio';
 
+-- Búsqueda de texto completo: configuración 'spanish' que además ignora acentos
+-- (el diccionario unaccent va antes del stemmer; ts_headline conserva el texto original)
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'spanish_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION spanish_unaccent (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION spanish_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END
+$$;
+
+ALTER TABLE transcriptions ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('spanish_unaccent'::regconfig, coalesce(content, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_transcriptions_content_tsv ON transcriptions USING GIN (content_tsv);
+
+COMMENT ON COLUMN transcriptions.content_tsv IS 'tsvector de content (spanish sin acentos) para search_transcriptions';
+
+-- Función: grabaciones cuya transcripción coincide con la búsqueda, por relevancia
+-- La sintaxis es la de websearch ("frase exacta", -excluir, or). Los fragmentos
+-- resaltados (ts_headline) solo se calculan para la página devuelta.
+CREATE OR REPLACE FUNCTION search_transcriptions(search_query TEXT, result_limit INTEGER DEFAULT 20, result_offset INTEGER DEFAULT 0)
+RETURNS TABLE (
+    recording_id UUID,
+    filename TEXT,
+    transcription_id UUID,
+    created_at TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    snippet TEXT
+) AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('spanish_unaccent'::regconfig, search_query) AS query
+    ),
+    matches AS (
+        -- Una fila por grabación: la versión de la transcripción más relevante
+        SELECT DISTINCT ON (t.recording_id)
+            t.recording_id, t.id AS transcription_id, t.content, t.created_at,
+            ts_rank_cd(t.content_tsv, q.query) AS rank
+        FROM transcriptions t, q
+        WHERE t.content_tsv @@ q.query
+        ORDER BY t.recording_id, rank DESC, t.created_at DESC
+    ),
+    page AS (
+        SELECT * FROM matches
+        ORDER BY rank DESC, created_at DESC
+        LIMIT result_limit OFFSET result_offset
+    )
+    SELECT
+        p.recording_id, r.filename, p.transcription_id, p.created_at, p.rank,
+        ts_headline('spanish_unaccent'::regconfig, p.content, q.query,
+                    'StartSel=**, StopSel=**, MaxFragments=2, MaxWords=25, MinWords=8, FragmentDelimiter=" … "')
+    FROM page p
+    JOIN recordings r ON r.id = p.recording_id
+    CROSS JOIN q
+    ORDER BY p.rank DESC, p.created_at DESC;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION search_transcriptions IS 'Búsqueda de texto completo en transcripciones con ranking y fragmentos resaltados';
+
 ---
 
 -- ============================================================================
@@ -85,7 +156,7 @@ CREATE TABLE IF NOT EXISTS opportunities (
     priority TEXT DEFAULT 'Medium',
     ticket_number INTEGER NOT NULL DEFAULT nextval('opportunities_ticket_number_seq'::regclass),
     notes TEXT,
-    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     
     -- Constraints de integridad
@@ -127,7 +198,7 @@ CREATE TABLE IF NOT EXISTS chat_history (
     recording_id UUID NOT NULL REFERENCES recordings(id) ON DELETE CASCADE,
     role VARCHAR(50) NOT NULL,
     message TEXT NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
     
     -- Constraints
     CONSTRAINT chat_history_role_valid CHECK (role IN ('user', 'assistant')),
@@ -137,6 +208,8 @@ CREATE TABLE IF NOT EXISTS chat_history (
 -- Índices de performance
 CREATE INDEX IF NOT EXISTS idx_chat_history_recording_id ON chat_history(recording_id);
 CREATE INDEX IF NOT EXISTS idx_chat_history_created_at ON chat_history(created_at DESC);
+-- Paginación keyset del historial de una grabación (recording_id = ? AND (created_at, id) < (?, ?))
+CREATE INDEX IF NOT EXISTS idx_chat_history_recording_created ON chat_history(recording_id, created_at DESC, id DESC);
 
 -- Comentarios
 COMMENT ON TABLE chat_history IS 'Historial de conversaciones usuario-IA para cada audio (opcional)';
@@ -145,6 +218,29 @@ COMMENT ON COLUMN chat_history.message IS 'Contenido del mensaje';
 
 ---
 
+-- ============================================================================
+-- TABLE: transcription_cache (OPCIONAL - caché de transcripciones)
+-- ============================================================================
+-- Transcripciones indexadas por contenido del audio (MD5) + modelo + versión
+-- del prompt. Evita pagar otra transcripción al re-subir el mismo audio.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS transcription_cache (
+    cache_key TEXT PRIMARY KEY,
+    audio_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_transcription_cache_audio_hash ON transcription_cache(audio_hash);
+
+COMMENT ON TABLE transcription_cache IS 'Caché de transcripciones por hash de audio + modelo + versión de prompt';
+COMMENT ON COLUMN transcription_cache.cache_key IS '{audio_hash}_{hash(modelo|versión)}';
+
+---
+
 -- ============================================================================
 -- VISTAS ÚTILES (OPTIONAL)
 -- ============================================================================
@@ -186,6 +282,61 @@ WHERE r.transcription IS NULL OR r.transcription = ''
 GROUP BY r.id, r.filename, r.filepath, r.created_at
 ORDER BY r.created_at DESC;
 
+-- Función: Tema de una oportunidad a partir del título
+-- ("[IA] Cierre de venta - Ana" → "Cierre de venta", "presupuesto" → "Presupuesto")
+CREATE OR REPLACE FUNCTION opportunity_tema(title TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT upper(left(t, 1)) || lower(substr(t, 2))
+    FROM (SELECT btrim(split_part(regexp_replace(title, '^\[IA\]\s*', ''), ' - ', 1)) AS t) s
+$$;
+
+-- Vista: Oportunidades por tema, estado y prioridad (panel de oportunidades)
+CREATE OR REPLACE VIEW v_opportunities_breakdown AS
+SELECT
+    opportunity_tema(title) AS tema,
+    status,
+    priority,
+    COUNT(*) AS count
+FROM opportunities
+GROUP BY 1, 2, 3;
+
+-- Vista: Marca de cambios en opportunities (el panel solo recarga si cambia)
+CREATE INDEX IF NOT EXISTS idx_opportunities_updated_at ON opportunities(updated_at DESC);
+
+CREATE OR REPLACE VIEW v_opportunities_watermark AS
+SELECT
+    COUNT(*) AS total,
+    MAX(created_at) AS last_created_at,
+    MAX(updated_at) AS last_updated_at
+FROM opportunities;
+
+-- Función: Oportunidades por semana y tema desde una fecha (usa idx_opportunities_created_at)
+CREATE OR REPLACE FUNCTION opportunities_weekly(since DATE)
+RETURNS TABLE (week DATE, tema TEXT, count BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT date_trunc('week', o.created_at)::date, opportunity_tema(o.title), COUNT(*)
+    FROM opportunities o
+    WHERE o.created_at >= since
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+$$;
+
+COMMENT ON FUNCTION opportunities_weekly IS 'Tendencia semanal de oportunidades por tema (panel de oportunidades)';
+
+-- Paginación keyset: las columnas del cursor (created_at/updated_at, id) no admiten NULL
+-- (para bases creadas antes de declararlas NOT NULL)
+UPDATE recordings SET created_at = now() WHERE created_at IS NULL;
+UPDATE recordings SET updated_at = created_at WHERE updated_at IS NULL;
+UPDATE transcriptions SET created_at = now() WHERE created_at IS NULL;
+UPDATE transcriptions SET updated_at = created_at WHERE updated_at IS NULL;
+UPDATE opportunities SET created_at = now() WHERE created_at IS NULL;
+UPDATE chat_history SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE recordings ALTER COLUMN created_at SET NOT NULL, ALTER COLUMN updated_at SET NOT NULL;
+ALTER TABLE transcriptions ALTER COLUMN created_at SET NOT NULL, ALTER COLUMN updated_at SET NOT NULL;
+ALTER TABLE opportunities ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE chat_history ALTER COLUMN created_at SET NOT NULL;
+
 ---
 
 -- ============================================================================
@@ -207,6 +358,41 @@ BEFORE UPDATE ON opportunities
 FOR EACH ROW
 EXECUTE FUNCTION update_opportunities_updated_at();
 
+-- Función: updated_at de recordings con el reloj del servidor (la app ya no lo envía)
+-- El catálogo en memoria trae los cambios por (updated_at, id): un reloj de
+-- cliente adelantado haría que se saltase las filas de otras instancias
+CREATE OR REPLACE FUNCTION update_recordings_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger: Actualizar updated_at en recordings (renombrados, transcripción)
+DROP TRIGGER IF EXISTS trigger_recordings_updated_at ON recordings;
+CREATE TRIGGER trigger_recordings_updated_at
+BEFORE UPDATE ON recordings
+FOR EACH ROW
+EXECUTE FUNCTION update_recordings_updated_at();
+
+-- Función: updated_at de transcriptions con el reloj del servidor (también al insertar)
+-- El índice local (local_index.py) trae los cambios por (updated_at, id)
+CREATE OR REPLACE FUNCTION update_transcriptions_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger: Actualizar updated_at en transcriptions
+DROP TRIGGER IF EXISTS trigger_transcriptions_updated_at ON transcriptions;
+CREATE TRIGGER trigger_transcriptions_updated_at
+BEFORE INSERT OR UPDATE ON transcriptions
+FOR EACH ROW
+EXECUTE FUNCTION update_transcriptions_updated_at();
+
 ---
 
 -- ============================================================================
@@ -308,6 +494,13 @@ ESTRUCTURA FINAL:
    ├── message (TEXT)
    ├── created_at (TIMESTAMP)
 
+5. transcription_cache (OPTIONAL - caché de transcripciones)
+   ├── cache_key (TEXT PK)
+   ├── audio_hash (TEXT)
+   ├── model, prompt_version (TEXT)
+   ├── content (TEXT)
+   ├── created_at (TIMESTAMP)
+
 RELACIONES:
 - recordings 1-to-many transcriptions (CASCADE DELETE)
 - recordings 1-to-many opportunities (CASCADE DELETE)
@@ -325,6 +518,14 @@ VISTAS:
 - v_pending_opportunities: oportunidades sin resolver
 - v_opportunities_stats: estadísticas por estado/prioridad
 - v_untranscribed_recordings: audios sin transcripciones
+- v_opportunities_breakdown: oportunidades por tema/estado/prioridad
+- v_opportunities_watermark: total y últimas fechas (detección de cambios)
+
+FUNCIONES:
+- search_transcriptions(query, limit, offset): búsqueda de texto completo
+  sobre transcriptions.content_tsv (índice GIN)
+- opportunity_tema(title): tema normalizado de una oportunidad
+- opportunities_weekly(since): oportunidades por semana y tema
 
 */
 
@@ -37,38 +37,23 @@ class AudioRecorder:
             logger.error(f"Error al leer directorio de grabaciones: {e}")
             return []
     
-    def get_recordings_from_supabase(self) -> List[str]:
+    def get_recordings_from_supabase(self, refresh: bool = False) -> List[str]:
         """
-        Obtiene lista de audios desde Supabase.
+        Obtiene lista de audios desde el catálogo en memoria (respaldado por Supabase).
+        
+        Args:
+            refresh (bool): Forzar un refresco incremental antes de listar
         
         Returns:
-            list: Lista de nombres de archivo desde Supabase o lista vacía si falla
+            list: Lista de nombres de archivo (más recientes primero) o lista vacía si falla
         """
         try:
-            import os
-            from supabase import create_client
-            
-            # Obtener credenciales desde variables de entorno
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_KEY")
-            
-            if not supabase_url or not supabase_key:
-                logger.warning("Credenciales de Supabase no configuradas")
-                return []
+            from RecordingsCatalog import get_recordings_catalog
             
-            # Crear cliente Supabase
-            client = create_client(supabase_url.strip(), supabase_key.strip())
-            
-            # Query a tabla recordings
-            response = client.table("recordings").select("filename").order("created_at", desc=True).execute()
-            
-            if response and response.data:
-                return [record["filename"] for record in response.data]
-            return []
+            catalog = get_recordings_catalog()
+            catalog.refresh(force=refresh)
+            return catalog.filenames()
             
-        except ImportError:
-            logger.warning("Supabase no instalado")
-            return []
         except Exception as e:
             logger.error(f"Error obteniendo grabaciones de Supabase: {e}")
             return []
@@ -129,6 +114,10 @@ class AudioRecorder:
             with open(filepath, "wb") as f:
                 f.write(audio_data)
             
+            # Registrar en la caché de audios (tamaño, hash, último acceso)
+            from audio_cache import get_audio_cache
+            get_audio_cache().register(filename)
+            
             logger.info(f"Audio guardado: {filename}")
             return str(filepath)
             
@@ -152,7 +141,8 @@ class AudioRecorder:
         try:
             filepath = RECORDINGS_DIR / filename
             if filepath.exists():
-                filepath.unlink()
+                from audio_cache import get_audio_cache
+                get_audio_cache().remove(filename)
                 logger.info(f"Audio eliminado: {filename}")
                 return True
             logger.warning(f"Archivo no encontrado para eliminar: {filename}")
@@ -164,7 +154,7 @@ class AudioRecorder:
     def get_recording_path(self, filename: str) -> str:
         """
         Obtiene la ruta completa de un archivo de audio.
-        Si el archivo local no existe, intenta descargarlo de Supabase Storage.
+        Se sirve desde la caché LRU de audios; si no está en disco se descarga de Supabase Storage.
         
         Args:
             filename (str): Nombre del archivo
@@ -174,23 +164,13 @@ class AudioRecorder:
         """
         filepath = RECORDINGS_DIR / filename
         
-        # Si el archivo ya existe localmente, retornar la ruta
-        if filepath.exists():
-            return str(filepath)
-        
-        # Si no existe, intentar descargar de Supabase Storage
         try:
-            sys.path.insert(0, str(Path(__file__).parent.parent))
-            from backend.database import download_audio_from_storage
+            from audio_cache import get_audio_cache
             
-            logger.info(f"Archivo local no encontrado: {filename}. Descargando de Storage...")
-            if download_audio_from_storage(filename, str(filepath)):
-                logger.info(f"Archivo descargado exitosamente: {filename}")
-                return str(filepath)
-            else:
-                logger.error(f"No se pudo descargar {filename} de Storage")
-                return str(filepath)  # Retornar la ruta de todos modos (para otros manejos de error)
+            cached_path = get_audio_cache().get_path(filename)
+            if cached_path:
+                return str(cached_path)
+            logger.error(f"No se pudo descargar {filename} de Storage")
         except Exception as e:
             logger.warning(f"Error intentando descargar de Storage: {e}")
-            return str(filepath)
-
+        return str(filepath)  # Retornar la ruta de todos modos (para otros manejos de error)
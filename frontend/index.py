@@ -1,6 +1,5 @@
 import streamlit as st
 import sys
-import re
 from pathlib import Path
 
 # Agregar carpetas al path para importar módulos
@@ -25,7 +24,7 @@ from notifications import (
     show_success_debug, show_error_debug, show_info_debug
 )
 from utils import process_audio_file, delete_audio
-from performance import get_transcription_cached, is_audio_transcribed, update_opportunity_local, delete_opportunity_local, delete_keyword_local, delete_recording_local, init_optimization_state
+from performance import get_transcription_cached, update_opportunity_local, delete_opportunity_local, delete_keyword_local, delete_recording_local, init_optimization_state, paginated_list, show_pagination_controls
 from helpers import format_recording_name
 
 # Importar de backend
@@ -33,9 +32,18 @@ from Transcriber import Transcriber
 from Model import Model
 from OpportunitiesManager import OpportunitiesManager
 import database as db_utils
+from jobs import get_job_queue, start_job_workers, ACTIVE_STATUSES, JOB_QUEUED, JOB_FAILED, JOB_PARTIAL
+from RecordingsCatalog import get_recordings_catalog
+from local_index import get_local_index, sync_local_index_in_background
+from audio_cache import get_audio_cache
+from llm_gateway import get_llm_gateway
+from context_cache import get_context_cache
+from chat_history import get_chat_history_store
+from opportunity_stats import get_opportunity_stats
 
-from datetime import datetime
-from config import CHAT_HISTORY_LIMIT
+import uuid
+from datetime import datetime, timedelta
+from config import JOB_POLL_SECONDS, SESSION_TIMEOUT_MINUTES, MAX_SEARCH_RESULTS, HEALTH_METRICS_CACHE_SECONDS
 
 # ============================================================================
 # FUNCIONES DE INICIALIZACIÓN
@@ -44,6 +52,7 @@ from config import CHAT_HISTORY_LIMIT
 def initialize_session_state(recorder_obj: AudioRecorder) -> None:
     """Inicializa todos los valores del session_state de forma centralizada"""
     session_defaults = {
+        "session_id": str(uuid.uuid4()),  # Dueño de los trabajos encolados desde esta sesión
         "processed_audios": set(),
         "recordings": recorder_obj.get_recordings_from_supabase(),
         "recordings_map": {},  # Mapeo: filename → recording_id para análisis de oportunidades
@@ -53,11 +62,11 @@ def initialize_session_state(recorder_obj: AudioRecorder) -> None:
         "keywords": {},
         "delete_confirmation": {},
         "transcription_cache": {},
-        "chat_history_limit": CHAT_HISTORY_LIMIT,
         "opp_delete_confirmation": {},
         "debug_log": [],  # Registro de eventos para el DEBUG
-        "audio_page": 0,  # Página actual para paginación de audios
-        "tickets_page": 0, # Página actual para paginación de tickets
+        "audio_page_number": 0,  # Página actual para paginación de audios
+        "tickets_page_number": 0, # Página actual para paginación de tickets
+        "tickets_cursors": [None],  # Cursor keyset de cada página de tickets visitada
         "editing_audio": None,  # Archivo siendo editado
         "new_audio_name": "",  # Nuevo nombre del archivo
         "generating_summary": False,  # Flag para generar resumen
@@ -85,31 +94,141 @@ def add_debug_event(message: str, event_type: str = "info") -> None:
         "message": message
     })
 
-def update_recordings_map() -> None:
-    """Actualiza el mapeo de filename → recording_id desde Supabase"""
-    try:
-        import os
-        from supabase import create_client
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_KEY")
+# ============================================================================
+# TRABAJOS EN SEGUNDO PLANO (transcripción + análisis)
+# ============================================================================
+
+JOB_STAGE_LABELS = {
+    None: "En cola",
+    "transcribe": "Transcribiendo",
+    "save": "Guardando transcripción",
+    "analyze": "Generando tickets con IA",
+}
+
+def render_analysis_result(num_opportunities: int, saved_count: int, filename: str) -> None:
+    """Muestra el resultado del análisis automático de oportunidades"""
+    if num_opportunities > 0:
+        # Determinar si se guardaron o solo se detectaron
+        if saved_count:
+            tickets_status = f"Se han creado {saved_count} ticket(s) automáticamente"
+            subtitle = "Los tickets están disponibles en la sección de 'Oportunidades'"
+            icon = "✅"
+        else:
+            tickets_status = f"Se detectaron {num_opportunities} oportunidad(es)"
+            subtitle = "Oportunidades identificadas por IA (pendiente almacenamiento)"
+            icon = "🔍"
         
-        if not supabase_url or not supabase_key:
-            logger.warning("⚠️  Supabase credentials no configuradas")
-            return
+        st.markdown(f'''
+        <div style="
+            background: linear-gradient(135deg, rgba(34, 197, 94, 0.1) 0%, rgba(59, 130, 246, 0.05) 100%);
+            border: 2px solid rgba(34, 197, 94, 0.3);
+            border-radius: 12px;
+            padding: 16px;
+            margin: 12px 0;
+            text-align: center;
+        ">
+            <div style="font-size: 14px; font-weight: 600; color: #22c55e; margin-bottom: 8px;">
+                {icon} Analisis Completado
+            </div>
+            <div style="font-size: 13px; color: #86efac; font-weight: 500;">
+                {tickets_status}
+            </div>
+            <div style="font-size: 11px; color: #4ade80; margin-top: 6px;">
+                {subtitle}
+            </div>
+        </div>
+        ''', unsafe_allow_html=True)
+        
+        if saved_count:
+            toast_msg = f"Se han creado {saved_count} tickets automáticamente"
+        else:
+            toast_msg = f"Se detectaron {num_opportunities} oportunidades por IA"
+        
+        st.toast(toast_msg, icon="🤖")
+        add_debug_event(f"IA detectó {num_opportunities} oportunidades para '{filename}'", "success")
+    else:
+        st.markdown('''
+        <div style="
+            background: linear-gradient(135deg, rgba(59, 130, 246, 0.1) 0%, rgba(34, 197, 94, 0.05) 100%);
+            border: 2px solid rgba(59, 130, 246, 0.3);
+            border-radius: 12px;
+            padding: 16px;
+            margin: 12px 0;
+            text-align: center;
+        ">
+            <div style="font-size: 14px; font-weight: 600; color: #3b82f6; margin-bottom: 8px;">
+                ℹ️ Análisis Completado
+            </div>
+            <div style="font-size: 13px; color: #93c5fd;">
+                No se detectaron nuevas oportunidades en esta transcripción
+            </div>
+        </div>
+        ''', unsafe_allow_html=True)
         
-        client = create_client(supabase_url.strip(), supabase_key.strip())
-        response = client.table("recordings").select("id, filename").order("created_at", desc=True).limit(50).execute()
+        st.toast("ℹ️ Análisis completado: No se detectaron oportunidades relevantes.", icon="ℹ️")
+        add_debug_event(f"IA no detectó oportunidades para '{filename}'", "info")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_transcription_job(job_id: str) -> None:
+    """Refresca solo el indicador de progreso mientras el trabajo está activo"""
+    job = job_queue.get(job_id)
+    if not job or job["status"] not in ACTIVE_STATUSES:
+        st.rerun()  # Terminado: rerun completo para cargar la transcripción
+    
+    label = JOB_STAGE_LABELS.get(job["stage"], "Procesando")
+    if job["status"] == JOB_QUEUED:
+        label = f"En cola ({job_queue.pending_count()} pendiente(s))"
+    st.progress(min(float(job["progress"]), 1.0), text=f"⏳ {label}...")
+
+def render_transcription_job(filename: str) -> None:
+    """Muestra progreso, resultado o error del último trabajo de esta sesión para un audio"""
+    job = job_queue.latest_for(filename, st.session_state.session_id)
+    if not job:
+        return
+    
+    if job["status"] in ACTIVE_STATUSES:
+        poll_transcription_job(job["id"])
+        return
+    
+    # Solo se notifica si terminó recientemente (y el resultado se carga una vez por sesión)
+    finished_at = datetime.fromisoformat(job["updated_at"])
+    if datetime.now() - finished_at > timedelta(minutes=SESSION_TIMEOUT_MINUTES):
+        return
+    
+    if job["status"] == JOB_FAILED:
+        show_error(f"Error al transcribir: {job['error']}")
+        if st.button("Reintentar", key=f"retry_job_{job['id']}", use_container_width=True):
+            job_queue.retry(job["id"])
+            job_workers.notify()
+            st.rerun()
+        return
+    
+    acknowledged = st.session_state.setdefault("acknowledged_jobs", set())
+    result = job["result"]
+    if job["id"] not in acknowledged:
+        acknowledged.add(job["id"])
+        st.session_state.contexto = result.get("transcription")
+        st.session_state.selected_audio = filename
+        st.session_state.loaded_audio = filename
+        st.session_state.chat_enabled = True
+        st.session_state.keywords = {}
         
-        if response and response.data:
-            recordings_map = {rec["filename"]: rec["id"] for rec in response.data}
-            st.session_state.recordings_map = recordings_map
-            logger.info(f"✅ Recordings map actualizado: {len(recordings_map)} registros")
-            logger.debug(f"   Ejemplos: {list(recordings_map.keys())[:3]}")
+        if job["status"] == JOB_PARTIAL:
+            stage_label = JOB_STAGE_LABELS.get(job["failed_stage"], job["failed_stage"])
+            show_warning(f"Transcripción guardada, pero falló la etapa «{stage_label}»: {job['error']}")
+            add_debug_event(f"Trabajo {job['id'][:8]} parcial: falló '{job['failed_stage']}' para '{filename}'", "error")
         else:
-            logger.warning("⚠️  No se obtuvieron recordings de Supabase")
-            st.session_state.recordings_map = {}
-    except Exception as e:
-        logger.error(f"❌ Error actualizando recordings_map: {type(e).__name__} - {str(e)[:100]}")
+            show_success("Transcripción completada")
+            add_debug_event(f"Transcripción completada para '{filename}' (ID: {result.get('transcription_id')})", "success")
+            logger.info(f"[STREAMLIT] Trabajo {job['id']}: {result.get('num_opportunities', 0)} detectadas | {result.get('saved_opportunities', 0)} guardadas | tiempos {result.get('timings')}")
+            render_analysis_result(result.get("num_opportunities", 0), result.get("saved_opportunities", 0), filename)
+    
+    if job["status"] == JOB_PARTIAL:
+        st.warning(f"⚠️ La transcripción está guardada, pero el análisis de oportunidades falló: {job['error']}")
+        if st.button("Reintentar análisis", key=f"retry_job_{job['id']}", use_container_width=True):
+            job_queue.retry(job["id"])
+            job_workers.notify()
+            st.rerun()
 
 # ============================================================================
 # CONFIGURACIÓN INICIAL DE LA INTERFAZ DE USUARIO
@@ -129,6 +248,19 @@ transcriber_model = Transcriber()
 chat_model = Model()
 opp_manager = OpportunitiesManager()
 
+# Completar/revertir renombrados que quedaron a medias (reintento periódico)
+db_utils.recover_pending_renames_if_due()
+
+# Catálogo de grabaciones en memoria (compartido por todas las sesiones)
+catalog = get_recordings_catalog()
+
+# Índice local de transcripciones: trae en segundo plano las de otras instancias
+sync_local_index_in_background()
+
+# Cola de trabajos compartida por todas las sesiones del proceso
+job_queue = get_job_queue()
+job_workers = start_job_workers(transcriber_model, opp_manager)
+
 # Inicializar estado de sesión de forma centralizada
 initialize_session_state(recorder)
 
@@ -146,7 +278,7 @@ with col_left:
     st.subheader("Grabadora en vivo")
     st.caption("Graba directamente desde tu micrófono")
     
-    audio_data = st.audio_input("", key=f"audio_recorder_{st.session_state.record_key_counter}", label_visibility="collapsed")
+    audio_data = st.audio_input("Grabadora", key=f"audio_recorder_{st.session_state.record_key_counter}", label_visibility="collapsed")
     
     # Procesar audio grabado SOLO UNA VEZ por hash
     if audio_data is not None:
@@ -170,7 +302,7 @@ with col_left:
     )
     
     if uploaded_file is not None:
-        audio_bytes = uploaded_file.read()
+        audio_bytes = uploaded_file.getvalue()  # Sin copia extra del buffer ya subido
         if len(audio_bytes) > 0:
             filename = uploaded_file.name
             
@@ -186,35 +318,32 @@ with col_left:
 # PANEL DERECHO - Audios Guardados y Transcripción
 # ============================================================================
 with col_right:
-    # Refresh de la lista de audios
-    recordings = recorder.get_recordings_from_supabase()
+    # Refresh incremental del catálogo (solo trae filas nuevas/modificadas)
+    catalog.refresh()
+    recordings = catalog.filenames()
     st.session_state.recordings = recordings
     
-    # Actualizar mapeo de IDs para análisis de oportunidades
-    update_recordings_map()
+    # Mapeo de IDs para análisis de oportunidades (todas las grabaciones, sin límite)
+    st.session_state.recordings_map = catalog.filename_to_id()
+    
+    # Estado de transcripción de TODAS las grabaciones en una sola consulta (cacheada)
+    transcription_status = catalog.transcription_status()
     
     if recordings:
         # Tabs para diferentes secciones
-        tab1, tab2, tab3 = st.tabs(["Transcribir", "Audios guardados", "Gestión en lote"])
+        tab1, tab2, tab_search, tab3 = st.tabs(["Transcribir", "Audios guardados", "Buscar en transcripciones", "Gestión en lote"])
         
         # ===== TAB 1: TRANSCRIBIR =====
         with tab1:
             # Filtrar audios (reutilizar la búsqueda si existe)
             search_query = st.session_state.get("audio_search", "")
-            if search_query and search_query.strip():
-                search_safe = re.escape(search_query.strip())
-                filtered_recordings = [
-                    r for r in recordings 
-                    if search_safe.lower() in r.lower()
-                ]
-            else:
-                filtered_recordings = recordings
+            filtered_recordings = catalog.search(search_query or "")
         
             selected_audio = st.selectbox(
                 "Selecciona un audio para transcribir",
                 filtered_recordings,
                 format_func=lambda x: format_recording_name(x) + (
-                    " [Transcrito]" if is_audio_transcribed(x, db_utils) else ""
+                    " [Transcrito]" if transcription_status.get(x, False) else ""
                 ),
                 key=f"selectbox_audio_{len(filtered_recordings)}"
             )
@@ -237,180 +366,45 @@ with col_right:
                         st.session_state.contexto = None
                         st.session_state.keywords = {}
                 
-                # Mostrar reproductor de audio
+                # Mostrar reproductor de audio (servido desde la caché de audios en disco)
                 audio_path = recorder.get_recording_path(selected_audio)
                 extension = selected_audio.split('.')[-1]
                 
-                # Verificar si el archivo existe antes de intentar abrirlo
-                audio_file_path = Path(audio_path)
-                if audio_file_path.exists():
+                if Path(audio_path).exists():
                     try:
-                        with open(audio_path, "rb") as f:
-                            st.audio(f.read(), format=f"audio/{extension}")
+                        st.audio(audio_path, format=f"audio/{extension}")
                     except Exception as e:
                         logger.error(f"Error al reproducir audio: {e}")
                         show_error(f"Error al reproducir el audio: {str(e)}")
                 else:
-                    # Si el archivo no existe, intentar descargarlo de Supabase nuevamente
-                    from backend.database import download_audio_from_storage
-                    try:
-                        if download_audio_from_storage(selected_audio, audio_path):
-                            with open(audio_path, "rb") as f:
-                                st.audio(f.read(), format=f"audio/{extension}")
-                        else:
-                            show_error("No se pudo descargar el audio desde el almacenamiento. Intenta más tarde.")
-                    except Exception as e:
-                        logger.error(f"Error al descargar/reproducir audio: {e}")
-                        show_error(f"Error al procesar el audio: {str(e)}")
+                    show_error("No se pudo descargar el audio desde el almacenamiento. Intenta más tarde.")
                 
                 st.markdown("")  # Espaciado
                 
                 col_transcribe, col_delete = st.columns([1, 1])
                 
                 with col_transcribe:
+                    force_transcription = st.checkbox(
+                        "Forzar nueva transcripción",
+                        key="force_transcription",
+                        help="Ignora la transcripción guardada en caché para este audio"
+                    )
                     if st.button("Transcribir", use_container_width=True):
-                        with st.spinner("Transcribiendo..."):
-                            try:
-                                audio_path = recorder.get_recording_path(selected_audio)
-                                transcription = transcriber_model.transcript_audio(audio_path)
-                                st.session_state.contexto = transcription.text
-                                st.session_state.selected_audio = selected_audio
-                                st.session_state.loaded_audio = selected_audio
-                                st.session_state.chat_enabled = True
-                                st.session_state.keywords = {}
-                                
-                                transcription_id = db_utils.save_transcription(
-                                    recording_filename=selected_audio,
-                                    content=transcription.text,
-                                    language="es"
-                                )
-                                
-                                show_success("Transcripción completada")
-                                add_debug_event(f"Transcripción completada para '{selected_audio}' (ID: {transcription_id})", "success")
-                                
-                                # === ANÁLISIS AUTOMÁTICO DE OPORTUNIDADES CON IA ===
-                                analysis_placeholder = st.empty()
-                                with analysis_placeholder.container():
-                                    st.markdown('''
-                                    <div style="
-                                        background: linear-gradient(135deg, rgba(139, 92, 246, 0.1) 0%, rgba(59, 130, 246, 0.05) 100%);
-                                        border: 2px solid rgba(139, 92, 246, 0.3);
-                                        border-radius: 12px;
-                                        padding: 16px;
-                                        margin: 12px 0;
-                                        text-align: center;
-                                    ">
-                                        <div style="font-size: 14px; font-weight: 600; color: #8b5cf6; margin-bottom: 8px;">
-                                            🤖 Generando Tickets Automáticamente...
-                                        </div>
-                                        <div style="font-size: 12px; color: #60a5fa;">
-                                            Analizando intenciones y oportunidades con IA
-                                        </div>
-                                    </div>
-                                    ''', unsafe_allow_html=True)
-                                
-                                opportunities_manager = OpportunitiesManager()
-                                
-                                # Obtener recording_id del mapeo
-                                recordings_map = st.session_state.get("recordings_map", {})
-                                rec_id = recordings_map.get(selected_audio)
-                                
-                                logger.info(f"[STREAMLIT] ========== ANÁLISIS DE IA INICIADO ==========")
-                                logger.info(f"[STREAMLIT] selected_audio: '{selected_audio}'")
-                                logger.info(f"[STREAMLIT] recordings_map keys: {list(recordings_map.keys())[:3]}...")
-                                logger.info(f"[STREAMLIT] recording_id obtenido: {rec_id}")
-                                logger.info(f"[STREAMLIT] transcription length: {len(transcription.text)} chars")
-                                
-                                try:
-                                    num_opportunities, detected_opps = opportunities_manager.analyze_opportunities_with_ai(
-                                        transcription=transcription.text,
-                                        audio_filename=selected_audio,
-                                        recording_id=rec_id
-                                    )
-                                    logger.info(f"[STREAMLIT] ✅ Análisis completado")
-                                    logger.info(f"[STREAMLIT] Detectadas: {num_opportunities} | Guardadas: {len(detected_opps) if detected_opps else 0}")
-                                except Exception as analysis_error:
-                                    logger.error(f"[STREAMLIT] ❌ ERROR: {type(analysis_error).__name__}")
-                                    logger.error(f"[STREAMLIT]    {str(analysis_error)}")
-                                    num_opportunities = 0
-                                    detected_opps = []
-                                
-                                logger.info(f"[STREAMLIT] ========== FIN DEL ANÁLISIS ==========\n")
-                                
-                                # Actualizar el indicador con los resultados
-                                with analysis_placeholder.container():
-                                    if num_opportunities > 0:
-                                        # Determinar si se guardaron o solo se detectaron
-                                        if detected_opps:
-                                            tickets_status = f"Se han creado {len(detected_opps)} ticket(s) automáticamente"
-                                            subtitle = "Los tickets están disponibles en la sección de 'Oportunidades'"
-                                            icon = "✅"
-                                        else:
-                                            tickets_status = f"Se detectaron {num_opportunities} oportunidad(es)"
-                                            subtitle = "Oportunidades identificadas por IA (pendiente almacenamiento)"
-                                            icon = "🔍"
-                                        
-                                        st.markdown(f'''
-                                        <div style="
-                                            background: linear-gradient(135deg, rgba(34, 197, 94, 0.1) 0%, rgba(59, 130, 246, 0.05) 100%);
-                                            border: 2px solid rgba(34, 197, 94, 0.3);
-                                            border-radius: 12px;
-                                            padding: 16px;
-                                            margin: 12px 0;
-                                            text-align: center;
-                                        ">
-                                            <div style="font-size: 14px; font-weight: 600; color: #22c55e; margin-bottom: 8px;">
-                                                {icon} Analisis Completado
-                                            </div>
-                                            <div style="font-size: 13px; color: #86efac; font-weight: 500;">
-                                                {tickets_status}
-                                            </div>
-                                            <div style="font-size: 11px; color: #4ade80; margin-top: 6px;">
-                                                {subtitle}
-                                            </div>
-                                        </div>
-                                        ''', unsafe_allow_html=True)
-                                        
-                                        if detected_opps:
-                                            toast_msg = f"Se han creado {len(detected_opps)} tickets automáticamente"
-                                        else:
-                                            toast_msg = f"Se detectaron {num_opportunities} oportunidades por IA"
-                                        
-                                        st.toast(toast_msg, icon="🤖")
-                                        add_debug_event(
-                                            f"IA detectó {num_opportunities} oportunidades para '{selected_audio}'",
-                                            "success"
-                                        )
-                                    else:
-                                        st.markdown('''
-                                        <div style="
-                                            background: linear-gradient(135deg, rgba(59, 130, 246, 0.1) 0%, rgba(34, 197, 94, 0.05) 100%);
-                                            border: 2px solid rgba(59, 130, 246, 0.3);
-                                            border-radius: 12px;
-                                            padding: 16px;
-                                            margin: 12px 0;
-                                            text-align: center;
-                                        ">
-                                            <div style="font-size: 14px; font-weight: 600; color: #3b82f6; margin-bottom: 8px;">
-                                                ℹ️ Análisis Completado
-                                            </div>
-                                            <div style="font-size: 13px; color: #93c5fd;">
-                                                No se detectaron nuevas oportunidades en esta transcripción
-                                            </div>
-                                        </div>
-                                        ''', unsafe_allow_html=True)
-                                        
-                                        st.toast(
-                                            "ℹ️ Análisis completado: No se detectaron oportunidades relevantes.",
-                                            icon="ℹ️"
-                                        )
-                                        add_debug_event(
-                                            f"IA no detectó oportunidades para '{selected_audio}'",
-                                            "info"
-                                        )
-                            except Exception as e:
-                                show_error(f"Error al transcribir: {e}")
-                
+                        # La transcripción y el análisis se ejecutan en la cola de trabajos:
+                        # la sesión no se bloquea y el trabajo sobrevive a reconexiones
+                        job_id = job_queue.submit(
+                            selected_audio,
+                            recorder.get_recording_path(selected_audio),
+                            {
+                                "force": force_transcription,
+                                "language": "es",
+                                "recording_id": st.session_state.get("recordings_map", {}).get(selected_audio)
+                            },
+                            session_id=st.session_state.session_id
+                        )
+                        job_workers.notify()
+                        add_debug_event(f"Transcripción de '{selected_audio}' encolada (trabajo {job_id[:8]})", "info")
+
                 with col_delete:
                     if st.button("Eliminar", use_container_width=True):
                         st.session_state.delete_confirmation[selected_audio] = True
@@ -433,6 +427,9 @@ with col_right:
                             if st.button("No", key=f"confirm_no_{selected_audio}"):
                                 st.session_state.delete_confirmation.pop(selected_audio, None)
                                 st.rerun()
+                
+                # Estado del trabajo de transcripción/análisis de este audio
+                render_transcription_job(selected_audio)
         
         # ===== TAB 2: AUDIOS GUARDADOS (BÚSQUEDA) =====
         with tab2:
@@ -447,33 +444,15 @@ with col_right:
             
             # Filtrar audios
             if search_query.strip():
-                search_safe = re.escape(search_query.strip())
-                filtered_recordings = [
-                    r for r in recordings 
-                    if search_safe.lower() in r.lower()
-                ]
+                filtered_recordings = catalog.search(search_query)
                 # Reset página al buscar
-                st.session_state.audio_page = 0
+                st.session_state.audio_page_number = 0
             else:
                 filtered_recordings = recordings
             
-            # Paginación: 3 audios por página
+            # Paginación: 3 audios por página (sobre el catálogo en memoria, sin consultar la BD)
             ITEMS_PER_PAGE = 3
-            total_items = len(filtered_recordings)
-            total_pages = (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE  # Redondeo hacia arriba
-            
-            # Asegurar que la página actual esté en rango válido
-            if st.session_state.audio_page >= total_pages and total_pages > 0:
-                st.session_state.audio_page = total_pages - 1
-            elif st.session_state.audio_page < 0:
-                st.session_state.audio_page = 0
-            
-            # Calcular índices de inicio y fin
-            start_idx = st.session_state.audio_page * ITEMS_PER_PAGE
-            end_idx = min(start_idx + ITEMS_PER_PAGE, total_items)
-            
-            # Obtener audios de la página actual
-            paginated_recordings = filtered_recordings[start_idx:end_idx]
+            paginated_recordings, _, total_pages = paginated_list(filtered_recordings, ITEMS_PER_PAGE, "audio_page")
             
             # Mostrar resultados
             if filtered_recordings:
@@ -481,7 +460,7 @@ with col_right:
                 
                 for recording in paginated_recordings:
                     display_name = format_recording_name(recording)
-                    is_transcribed = is_audio_transcribed(recording, db_utils)
+                    is_transcribed = transcription_status.get(recording, False)
                     transcribed_badge = components.render_badge("Transcrito", "transcribed") if is_transcribed else ""
                     
                     # Verificar si este audio está siendo editado
@@ -513,7 +492,8 @@ with col_right:
                                     success = db_utils.update_recording_filename(recording, new_filename)
                                     
                                     if success:
-                                        st.session_state.recordings = recorder.get_recordings_from_supabase()
+                                        catalog.rename(recording, new_filename)
+                                        st.session_state.recordings = catalog.filenames()
                                         st.session_state.editing_audio = None
                                         st.session_state.new_audio_name = ""
                                         show_success(f"✓ Renombrado a: {new_filename}")
@@ -555,23 +535,52 @@ with col_right:
                 # Controles de paginación (solo si hay más de 1 página)
                 if total_pages > 1:
                     st.markdown("---")
-                    
-                    # Crear botones de paginación
-                    col_buttons = st.columns(total_pages)
-                    for page_num in range(total_pages):
-                        with col_buttons[page_num]:
-                            button_style = "active" if page_num == st.session_state.audio_page else ""
-                            if st.button(
-                                str(page_num + 1),
-                                key=f"audio_page_{page_num}",
-                                use_container_width=True,
-                                disabled=(page_num == st.session_state.audio_page)
-                            ):
-                                st.session_state.audio_page = page_num
-                                st.rerun()
+                    show_pagination_controls(st.session_state.audio_page_number, total_pages, "audio_page")
             else:
                 st.info(f"No se encontraron grabaciones para '{search_query}'")
         
+        # ===== BÚSQUEDA DE TEXTO COMPLETO EN TRANSCRIPCIONES =====
+        with tab_search:
+            content_query = st.text_input(
+                "Buscar en el contenido de las transcripciones",
+                placeholder='Ej: auditoría, "cierre de venta", presupuesto -marketing',
+                key="transcript_search"
+            )
+            
+            if content_query.strip():
+                # Reset página al cambiar la búsqueda
+                if st.session_state.get("transcript_search_last") != content_query:
+                    st.session_state.transcript_search_last = content_query
+                    st.session_state.transcript_search_page = 0
+                page = st.session_state.get("transcript_search_page", 0)
+                
+                # Se pide un resultado de más para saber si hay página siguiente
+                results = db_utils.search_transcriptions(
+                    content_query, limit=MAX_SEARCH_RESULTS + 1, offset=page * MAX_SEARCH_RESULTS
+                )
+                
+                if results is None:
+                    show_error("La búsqueda en transcripciones no está disponible (aplica database.sql en Supabase)")
+                elif not results:
+                    st.info(f"Ninguna transcripción contiene '{content_query}'")
+                else:
+                    has_next = len(results) > MAX_SEARCH_RESULTS
+                    for result in results[:MAX_SEARCH_RESULTS]:
+                        st.markdown(f"**{format_recording_name(result['filename'])}**")
+                        st.caption(f"…{result.get('snippet') or ''}…")
+                    
+                    col_prev, col_page, col_next = st.columns([1, 2, 1])
+                    with col_prev:
+                        if st.button("← Anteriores", key="transcript_search_prev", disabled=page == 0, use_container_width=True):
+                            st.session_state.transcript_search_page = page - 1
+                            st.rerun()
+                    with col_page:
+                        st.caption(f"Página {page + 1} · selecciona el audio en la pestaña \"Transcribir\"")
+                    with col_next:
+                        if st.button("Siguientes →", key="transcript_search_next", disabled=not has_next, use_container_width=True):
+                            st.session_state.transcript_search_page = page + 1
+                            st.rerun()
+        
         # ===== TAB 3: GESTIÓN EN LOTE =====
         with tab3:
             st.subheader("Eliminar múltiples audios")
@@ -975,10 +984,7 @@ if st.session_state.get("chat_enabled", False) and st.session_state.get("context
                     keywords_list
                 )
                 
-                saved_count = 0
-                for opp in opportunities:
-                    opp_manager.save_opportunity(opp, st.session_state.selected_audio)
-                    saved_count += 1
+                saved_count = opp_manager.save_opportunities(opportunities, st.session_state.selected_audio)
                 
                 if saved_count > 0:
                     show_success_expanded(f"{saved_count} ticket(s) de oportunidad generado(s)")
@@ -995,27 +1001,30 @@ st.markdown("")
 
 if st.session_state.get("chat_enabled", False):
     selected_audio = st.session_state.get("selected_audio", "")
-    opportunities = opp_manager.load_opportunities(selected_audio)
     
-    if opportunities:
+    # Paginación de tickets en la BD: total con una consulta head y solo la página visible
+    TICKETS_PER_PAGE = 5
+    if st.session_state.get("tickets_audio") != selected_audio:
+        st.session_state.tickets_audio = selected_audio
+        st.session_state.tickets_page_number = 0
+        st.session_state.tickets_cursors = [None]
+    total_tickets = opp_manager.count_opportunities(selected_audio)
+    total_pages = (total_tickets + TICKETS_PER_PAGE - 1) // TICKETS_PER_PAGE
+    
+    if total_tickets:
         st.markdown('<h2 style="color: white;">Tickets de Oportunidades de Negocio</h2>', unsafe_allow_html=True)
         
-        # Paginación de tickets
-        TICKETS_PER_PAGE = 5
-        total_tickets = len(opportunities)
-        total_pages = (total_tickets + TICKETS_PER_PAGE - 1) // TICKETS_PER_PAGE
-        
-        if 'tickets_page' not in st.session_state:
-            st.session_state.tickets_page = 0
-            
-        if st.session_state.tickets_page >= total_pages and total_pages > 0:
-            st.session_state.tickets_page = total_pages - 1
-        elif st.session_state.tickets_page < 0:
-            st.session_state.tickets_page = 0
-            
-        start_idx = st.session_state.tickets_page * TICKETS_PER_PAGE
-        end_idx = min(start_idx + TICKETS_PER_PAGE, total_tickets)
-        paginated_opportunities = opportunities[start_idx:end_idx]
+        # Solo se llega a una página por anterior/siguiente, así que su cursor ya se conoce
+        cursors = st.session_state.tickets_cursors
+        page = min(max(st.session_state.tickets_page_number, 0), total_pages - 1, len(cursors) - 1)
+        st.session_state.tickets_page_number = page
+        paginated_opportunities, page_cursor = opp_manager.load_opportunities_page(
+            selected_audio, cursors[page], TICKETS_PER_PAGE
+        )
+        del cursors[page + 1:]
+        if page_cursor is not None:
+            cursors.append(page_cursor)
+        start_idx = page * TICKETS_PER_PAGE
 
         for idx, opp in enumerate(paginated_opportunities):
             # Usar el índice original para las keys de los widgets
@@ -1119,19 +1128,53 @@ if st.session_state.get("chat_enabled", False):
         # Controles de paginación de tickets
         if total_pages > 1:
             st.markdown("---")
-            
-            # Crear botones de paginación
-            col_buttons = st.columns(total_pages)
-            for page_num in range(total_pages):
-                with col_buttons[page_num]:
-                    if st.button(
-                        str(page_num + 1),
-                        key=f"ticket_page_{page_num}",
-                        use_container_width=True,
-                        disabled=(page_num == st.session_state.tickets_page)
-                    ):
-                        st.session_state.tickets_page = page_num
-                        st.rerun()
+            # Sin cursor siguiente esta es la última página aunque el total diga otra cosa
+            show_pagination_controls(page, total_pages if page_cursor is not None else page + 1, "tickets_page")
+
+# PANEL DE OPORTUNIDADES (agregados calculados en Supabase, cacheados en el proceso)
+
+with st.expander("📊 Panel de oportunidades"):
+    opportunity_stats = get_opportunity_stats()
+    if st.button("Actualizar panel", key="refresh_opportunity_stats"):
+        opportunity_stats.refresh(force=True)
+    else:
+        opportunity_stats.refresh()
+    dashboard = opportunity_stats.snapshot()
+    
+    if not dashboard["loaded"]:
+        show_info_debug("Panel no disponible (aplica database.sql en Supabase)")
+    elif not dashboard["total"]:
+        st.info("Aún no hay oportunidades")
+    else:
+        status_labels = {"new": "Nuevo", "in_progress": "En progreso", "closed": "Cerrado", "won": "Ganado"}
+        priority_labels = {"Low": "Baja", "Medium": "Media", "High": "Alta"}
+        by_status = dashboard["by_status"]
+        
+        col_total, col_new, col_progress, col_won = st.columns(4)
+        col_total.metric("Oportunidades", dashboard["total"])
+        col_new.metric("Nuevas", by_status.get("new", 0))
+        col_progress.metric("En progreso", by_status.get("in_progress", 0))
+        col_won.metric("Ganadas", by_status.get("won", 0))
+        
+        col_status, col_priority = st.columns(2)
+        with col_status:
+            st.markdown("**Por estado**")
+            st.bar_chart({"Oportunidades": {status_labels.get(k, k): v for k, v in by_status.items()}})
+        with col_priority:
+            st.markdown("**Por prioridad**")
+            st.bar_chart({"Oportunidades": {priority_labels.get(k, k): v for k, v in dashboard["by_priority"].items()}})
+        
+        st.markdown("**Por tema**")
+        st.bar_chart({"Oportunidades": dashboard["by_tema"]}, horizontal=True)
+        
+        if dashboard["trend"]:
+            st.markdown("**Tendencia semanal por tema**")
+            st.line_chart(dashboard["trend"])
+        
+        if dashboard["pending"]:
+            st.markdown("**Grabaciones con más oportunidades nuevas**")
+            for row in dashboard["pending"]:
+                st.caption(f"{format_recording_name(row['filename'])} · {row['total_pending']} nuevas ({row.get('priorities') or '—'})")
 
 st.markdown("")
 st.markdown("")
@@ -1148,30 +1191,40 @@ if st.session_state.get("chat_enabled", False):
         if keywords_list:
             show_info_debug(f"Palabras clave activas: {', '.join(keywords_list)}")
     
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
-        # Mensaje de bienvenida inicial
-        st.session_state.chat_history.append("🤖 **IA**: Hola, soy tu asistente de análisis. Estoy aquí para ayudarte a entender tu reunión y extraer información relevante. Cuéntame qué te gustaría analizar.")
+    # Conversación de la grabación (ventana en memoria, persistida en chat_history)
+    chat_store = get_chat_history_store()
+    chat_audio = st.session_state.get("selected_audio") or ""
+    chat_key = get_recordings_catalog().resolve_id(chat_audio) or chat_store.local_key(chat_audio)
+    chat_messages = chat_store.messages(chat_key)
+    if not chat_messages:
+        # Mensaje de bienvenida inicial (no se guarda)
+        chat_messages = [{"role": "assistant", "message": "Hola, soy tu asistente de análisis. Estoy aquí para ayudarte a entender tu reunión y extraer información relevante. Cuéntame qué te gustaría analizar."}]
+    
+    if chat_store.has_more(chat_key):
+        if st.button("⬆️ Cargar mensajes anteriores", key="load_older_chat"):
+            loaded = chat_store.load_older(chat_key)
+            add_debug_event(f"Chat: {loaded} mensajes anteriores cargados")
+            st.rerun()
     
     # Mostrar historial de chat con estilo profesional
-    if st.session_state.chat_history:
+    if chat_messages:
         st.markdown("""
         <div class="chat-container">
         """, unsafe_allow_html=True)
         
-        for message in st.session_state.chat_history:
-            if message.startswith("👤"):
+        for chat_message in chat_messages:
+            if chat_message["role"] == "user":
                 # Mensaje del usuario
-                user_text = message.replace("👤 **Usuario**: ", "")
+                user_text = chat_message["message"]
                 st.markdown(f"""
                 <div class="chat-message chat-message-user">
                     <div class="chat-avatar chat-avatar-user avatar-pulse">�</div>
                     <div class="chat-bubble chat-bubble-user">{user_text}</div>
                 </div>
                 """, unsafe_allow_html=True)
-            elif message.startswith("🤖"):
+            else:
                 # Mensaje de la IA
-                ai_text = message.replace("🤖 **IA**: ", "")
+                ai_text = chat_message["message"]
                 st.markdown(f"""
                 <div class="chat-message chat-message-ai">
                     <div class="chat-avatar chat-avatar-ai avatar-spin">✨</div>
@@ -1181,29 +1234,52 @@ if st.session_state.get("chat_enabled", False):
         
         st.markdown("</div>", unsafe_allow_html=True)
     
+    if st.session_state.get("last_retrieval"):
+        st.caption(f"🔎 {st.session_state.last_retrieval}")
+    
     # Campo de entrada centrado
     col_left, col_input, col_right = st.columns([1, 3, 1])
     with col_input:
         user_input = st.chat_input("Escribe tu pregunta o solicitud de análisis...")
     
     if user_input:
-        st.session_state.chat_history.append(f"👤 **Usuario**: {user_input}")
+        chat_store.append(chat_key, "user", user_input)
+        st.markdown(f"""
+        <div class="chat-message chat-message-user">
+            <div class="chat-avatar chat-avatar-user avatar-pulse">�</div>
+            <div class="chat-bubble chat-bubble-user">{user_input}</div>
+        </div>
+        """, unsafe_allow_html=True)
         
-        with st.spinner("Generando respuesta..."):
-            try:
-                # Pasar palabras clave al modelo
-                keywords = st.session_state.get("keywords", {})
-                response = chat_model.call_model(user_input, st.session_state.contexto, keywords)
-                st.session_state.chat_history.append(f"🤖 **IA**: {response}")
-                
-                # Limitar historial a últimos N mensajes para no sobrecargar memoria
-                max_history = st.session_state.chat_history_limit
-                if len(st.session_state.chat_history) > max_history:
-                    st.session_state.chat_history = st.session_state.chat_history[-max_history:]
-                
-                st.rerun()
-            except Exception as e:
-                show_error(f"Error al generar respuesta: {e}")
+        try:
+            # Pasar palabras clave al modelo; la respuesta se pinta según llega
+            keywords = st.session_state.get("keywords", {})
+            # Respuesta memorizada, caché de contexto de Gemini o solo los fragmentos relevantes
+            response = st.write_stream(chat_model.stream_answer(
+                user_input, st.session_state.contexto, keywords, st.session_state.get("summary_text")
+            ))
+            chat_store.append(chat_key, "assistant", response)
+            retrieved = chat_model.last_context
+            if retrieved is None or retrieved.source == "full":
+                st.session_state.last_retrieval = None
+            elif retrieved.source == "memo":
+                st.session_state.last_retrieval = "Última pregunta: respuesta repetida, servida sin llamar a la IA"
+            elif retrieved.source == "gemini_cache":
+                st.session_state.last_retrieval = (
+                    f"Última pregunta: transcripción en caché de Gemini, solo se enviaron ~{retrieved.tokens_sent:,} tokens "
+                    f"(ahorro ~{retrieved.tokens_saved:,})"
+                )
+            else:
+                st.session_state.last_retrieval = (
+                    f"Última pregunta: {len(retrieved.chunks)} fragmentos, ~{retrieved.tokens_sent:,} de "
+                    f"~{retrieved.tokens_full:,} tokens (ahorro ~{retrieved.tokens_saved:,})"
+                )
+            if retrieved is not None and retrieved.tokens_saved:
+                add_debug_event(f"Chat ({retrieved.source}): ~{retrieved.tokens_saved:,} tokens ahorrados")
+            
+            st.rerun()
+        except Exception as e:
+            show_error(f"Error al generar respuesta: {e}")
 else:
     show_info_expanded("Carga un audio y transcríbelo para habilitar el chat.")
 
@@ -1220,22 +1296,51 @@ with st.expander("🔧 DEBUG - Estado de Supabase"):
         supabase = db_utils.init_supabase()
         
         if supabase:
-            # Contar grabaciones
-            test = supabase.table("recordings").select("*", count="exact").execute()
-            record_count = len(test.data) if test.data else 0
+            # Conteos head-only (sin descargar filas), cacheados unos segundos
+            health = db_utils.get_health_metrics()
+            if not health["ok"]:
+                raise ConnectionError(health["error"])
+            tables = health["tables"]
             
-            # Contar oportunidades
-            test_opp = supabase.table("opportunities").select("*", count="exact").execute()
-            opp_count = len(test_opp.data) if test_opp.data else 0
+            show_success_debug("¡Conexión establecida correctamente!")
+            show_success_debug(f"Grabaciones en BD: {tables['recordings']['count']} ({tables['recordings']['latency_ms']} ms)")
+            show_success_debug(f"Oportunidades en BD: {tables['opportunities']['count']} ({tables['opportunities']['latency_ms']} ms)")
+            show_success_debug(f"Transcripciones en BD: {tables['transcriptions']['count']} ({tables['transcriptions']['latency_ms']} ms)")
+            show_info_debug(f"Comprobado a las {health['checked_at']} (se reutiliza durante {HEALTH_METRICS_CACHE_SECONDS} s)")
             
-            # Contar transcripciones
-            test_trans = supabase.table("transcriptions").select("*", count="exact").execute()
-            trans_count = len(test_trans.data) if test_trans.data else 0
+            audio_cache_stats = get_audio_cache().stats()
+            show_info_debug(
+                f"Caché de audio: {audio_cache_stats['files']} archivos | "
+                f"{audio_cache_stats['used_mb']}/{audio_cache_stats['max_mb']} MB | "
+                f"aciertos {audio_cache_stats['hits']} · fallos {audio_cache_stats['misses']} "
+                f"({audio_cache_stats['hit_ratio']:.0%}) | expulsados {audio_cache_stats['evictions']}"
+            )
             
-            show_success_debug("¡Conexión establecida correctamente!")
-            show_success_debug(f"Grabaciones en BD: {record_count}")
-            show_success_debug(f"Oportunidades en BD: {opp_count}")
-            show_success_debug(f"Transcripciones en BD: {trans_count}")
+            pool = db_utils.get_pool_stats()
+            show_info_debug(
+                f"Pool HTTP: {pool['pool_size']} conexiones | {pool['requests']} peticiones | "
+                f"{pool['reused_connections']} reutilizadas ({pool['reuse_ratio']:.0%}) | "
+                f"latencia p50 {pool['latency_ms_p50']} ms · p95 {pool['latency_ms_p95']} ms"
+            )
+            
+            llm = get_llm_gateway().stats()
+            show_info_debug(
+                f"Gemini: {llm['in_flight']} en curso · {llm['queue_depth']} en cola | {llm['calls']} llamadas | "
+                f"{llm['retries']} reintentos · {llm['timeouts']} timeouts · {llm['errors']} errores | "
+                f"latencia p50 {llm['latency_ms_p50']} ms · p95 {llm['latency_ms_p95']} ms"
+            )
+            
+            chat_cache = get_context_cache().stats()
+            show_info_debug(
+                f"Caché del chat: {chat_cache['answer_hits']} respuestas repetidas · "
+                f"{chat_cache['provider_hits']} preguntas sobre caché de Gemini ({chat_cache['provider_created']} creadas)"
+            )
+            
+            local_index = get_local_index().stats()
+            show_info_debug(
+                f"Índice local: {local_index['recordings']} grabaciones · {local_index['transcriptions']} transcripciones · "
+                f"{local_index['hits']} lecturas sin conexión servidas en local ({local_index['misses']} no encontradas)"
+            )
         else:
             show_error_debug("Falta SUPABASE_URL o SUPABASE_KEY en Secrets")
             
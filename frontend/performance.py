@@ -180,12 +180,12 @@ def paginated_list(items: List[Any], items_per_page: int = 20, key_prefix: str =
     Returns:
         Tupla (items_in_page, page_number, total_pages)
     """
-    if f"{key_prefix}_number" not in st.session_state:
-        st.session_state[f"{key_prefix}_number"] = 0
-    
-    page = st.session_state[f"{key_prefix}_number"]
     total_pages = (len(items) + items_per_page - 1) // items_per_page
     
+    # Página en rango válido (la lista puede haber encogido tras borrar o filtrar)
+    page = min(max(st.session_state.get(f"{key_prefix}_number", 0), 0), max(total_pages - 1, 0))
+    st.session_state[f"{key_prefix}_number"] = page
+    
     start = page * items_per_page
     end = start + items_per_page
     
@@ -194,7 +194,7 @@ def paginated_list(items: List[Any], items_per_page: int = 20, key_prefix: str =
 
 def show_pagination_controls(page: int, total_pages: int, key_prefix: str = "page") -> None:
     """
-    Muestra botones de paginación
+    Muestra botones de paginación (anterior/siguiente: escala a miles de páginas)
     
     Args:
         page: Página actual (0-indexed)
@@ -257,7 +257,7 @@ def load_recording_with_all_data(db_utils, filename: str) -> Optional[Dict[str,
     """
     try:
         # Query optimizada que trae todo
-        result = db_utils.db.table("recordings").select(
+        result = db_utils.init_supabase().table("recordings").select(
             "*, transcriptions(*), opportunities(*)"
         ).eq("filename", filename).execute()
         
@@ -281,7 +281,7 @@ def batch_load_opportunities(db_utils, recording_ids: List[str]) -> Dict[str, Li
     """
     result_dict = {}
     try:
-        result = db_utils.db.table("opportunities").select("*").in_(
+        result = db_utils.init_supabase().table("opportunities").select("*").in_(
             "recording_id", recording_ids
         ).execute()
         
@@ -356,6 +356,6 @@ def batch_delete_recordings(db_utils, filenames: List[str]) -> tuple:
 def delete_audio(filename: str, db_utils) -> bool:
     """Helper para eliminar audio"""
     try:
-        return db_utils.delete_recording_from_db(db_utils.db, filename)
+        return db_utils.delete_recording_by_filename(filename)
     except Exception:
         return False
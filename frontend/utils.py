@@ -4,6 +4,7 @@ Este módulo proporciona funciones de utilidad para procesar y gestionar
 archivos de audio en la interfaz de Streamlit.
 """
 import hashlib
+from datetime import datetime
 import streamlit as st
 from pathlib import Path
 from typing import Tuple, Optional, Any
@@ -59,22 +60,25 @@ def process_audio_file(
         
         # Guardar archivo
         filepath = recorder.save_recording(audio_bytes, filename)
-        recording_id = db_utils.save_recording_to_db(filename, filepath)
+        recording = db_utils.save_recording_to_db(filename, filepath)
         
-        if not recording_id:
+        if not recording:
             show_error("Error: No se guardó en Supabase")
             logger.error(f"BD falló: {filename}")
             return False, None
         
-        # Actualizar session state
+        # Actualizar catálogo con la fila devuelta por la BD (sin volver a listar la tabla) y session state
+        recording_id = recording["id"]
+        from RecordingsCatalog import get_recordings_catalog
+        catalog = get_recordings_catalog()
+        catalog.upsert(recording)
         st.session_state.processed_audios.add(audio_hash)
-        st.session_state.recordings = recorder.get_recordings_from_supabase()
+        st.session_state.recordings = catalog.filenames()
         
         logger.info(f"✓ Audio OK: {filename} (ID: {recording_id})")
         # Agregar al registro de debug
         if "debug_log" not in st.session_state:
             st.session_state.debug_log = []
-        from datetime import datetime
         timestamp = datetime.now().strftime("%H:%M:%S")
         st.session_state.debug_log.append({
             "time": timestamp,
@@ -109,7 +113,9 @@ def delete_audio(filename: str, recorder: Any, db_utils: Any) -> bool:
         db_utils.delete_recording_by_filename(filename)
         recorder.delete_recording(filename)
         
-        # Limpiar session state
+        # Limpiar catálogo y session state
+        from RecordingsCatalog import get_recordings_catalog
+        get_recordings_catalog().remove(filename)
         st.session_state.processed_audios.clear()
         
         if filename in st.session_state.recordings:
@@ -0,0 +1,54 @@
+"""Regresiones de la unión de transcripciones solapadas (audio_chunks.stitch_transcripts)"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# config.py exige credenciales al importarse; aquí no se usan
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("SUPABASE_URL", "http://fake-supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="test_data_"))
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from audio_chunks import stitch_transcripts
+
+
+def test_short_line_later_in_head_does_not_drop_new_lines():
+    previous = "\n".join([
+        "Ana: Buenos días, empezamos con el presupuesto del trimestre",
+        "Luis: Vale",
+        "Ana: El proveedor de logística ha subido las tarifas un diez por ciento",
+    ])
+    current = "\n".join([
+        "Ana: El proveedor de logística ha subido las tarifas un diez por ciento",
+        "Luis: Habría que pedir otra oferta antes de renovar",
+        "Ana: Lo preparo yo para la semana que viene",
+        "Luis: Incluye también el transporte refrigerado",
+        "Ana: De acuerdo, lo añado a la petición",
+        "Luis: Vale",
+    ])
+    lines = stitch_transcripts([previous, current]).splitlines()
+
+    assert lines == [
+        "Ana: Buenos días, empezamos con el presupuesto del trimestre",
+        "Luis: Vale",
+        "Ana: El proveedor de logística ha subido las tarifas un diez por ciento",
+        "Luis: Habría que pedir otra oferta antes de renovar",
+        "Ana: Lo preparo yo para la semana que viene",
+        "Luis: Incluye también el transporte refrigerado",
+        "Ana: De acuerdo, lo añado a la petición",
+        "Luis: Vale",
+    ]
+
+
+def test_overlap_run_aligns_generic_speakers():
+    previous = "Ana: Revisamos los pedidos pendientes de marzo\nLuis: Quedan tres sin entregar al cliente"
+    current = "Voz 1: Quedan tres sin entregar al cliente\nVoz 1: Los reclamo mañana a primera hora"
+    lines = stitch_transcripts([previous, current]).splitlines()
+
+    assert lines == [
+        "Ana: Revisamos los pedidos pendientes de marzo",
+        "Luis: Quedan tres sin entregar al cliente",
+        "Luis: Los reclamo mañana a primera hora",
+    ]
@@ -0,0 +1,96 @@
+"""Estados de la cola de trabajos cuando falla una etapa (jobs.JobWorkerPool)"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# config.py exige credenciales al importarse; aquí no se usan
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("SUPABASE_URL", "http://fake-supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="test_data_"))
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+import audio_cache
+import database as db_utils
+from jobs import JobQueue, JobWorkerPool, build_transcription_stages, JOB_DONE, JOB_FAILED, JOB_PARTIAL
+from OpportunitiesManager import OpportunitiesManager, AnalysisFailed
+
+
+class FakeTranscriber:
+    def __init__(self):
+        self.calls = 0
+
+    def transcript_audio(self, audio_path, use_cache=True, progress_callback=None):
+        self.calls += 1
+        return SimpleNamespace(text="Ana: Hay que revisar el presupuesto", cached=False)
+
+
+class FakeOpportunities:
+    def __init__(self, fail: bool):
+        self.fail = fail
+
+    def analyze_opportunities_with_ai(self, transcription, audio_filename, recording_id=None, raise_errors=False):
+        if self.fail:
+            if raise_errors:
+                raise AnalysisFailed("Respuesta de Gemini sin JSON recuperable")
+            return 0, []
+        return 1, [{"id": "opp-1"}]
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_cache, "get_audio_cache", lambda: SimpleNamespace(get_path=lambda filename: None))
+    queue = JobQueue(tmp_path / "jobs.db")
+    transcriber = FakeTranscriber()
+
+    def build(saved_id="tr-1", fail_analysis=False):
+        monkeypatch.setattr(db_utils, "save_transcription", lambda **kwargs: saved_id)
+        stages = build_transcription_stages(queue, transcriber, FakeOpportunities(fail_analysis))
+        return JobWorkerPool(queue, stages, workers=1)
+
+    return queue, transcriber, build
+
+
+def run_next(queue, pool):
+    pool._run(queue.claim_next())
+
+
+def test_failed_analysis_leaves_job_partial_and_retry_resumes(pipeline):
+    queue, transcriber, build = pipeline
+    job_id = queue.submit("reunion.wav", "/tmp/reunion.wav")
+
+    run_next(queue, build(fail_analysis=True))
+    job = queue.get(job_id)
+    assert job["status"] == JOB_PARTIAL
+    assert job["failed_stage"] == "analyze"
+    assert job["result"]["transcription_id"] == "tr-1"
+
+    queue.retry(job_id)
+    run_next(queue, build())
+    job = queue.get(job_id)
+    assert job["status"] == JOB_DONE
+    assert job["result"]["saved_opportunities"] == 1
+    assert transcriber.calls == 1  # La reanudación no vuelve a transcribir
+
+
+def test_failed_save_fails_job(pipeline):
+    queue, _, build = pipeline
+    job_id = queue.submit("reunion.wav", "/tmp/reunion.wav")
+
+    run_next(queue, build(saved_id=None))
+    job = queue.get(job_id)
+    assert job["status"] == JOB_FAILED
+    assert job["failed_stage"] == "save"
+
+
+def test_analysis_reports_failure_only_when_asked():
+    manager = OpportunitiesManager.__new__(OpportunitiesManager)
+    manager.load_keywords_dict = lambda: {}
+
+    assert manager.analyze_opportunities_with_ai("texto", "reunion.wav") == (0, [])
+    with pytest.raises(AnalysisFailed):
+        manager.analyze_opportunities_with_ai("texto", "reunion.wav", raise_errors=True)